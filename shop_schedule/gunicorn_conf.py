@@ -0,0 +1,58 @@
+"""
+Production server settings:
+
+    gunicorn -c shop_schedule/gunicorn_conf.py shop_schedule.wsgi
+
+The app is imported and warmed up once in the master process, workers are
+forked after that and share the loaded state copy-on-write.
+"""
+import gc
+import multiprocessing
+import os
+import time
+
+_started = time.perf_counter()
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', 8000))
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# a sync worker doesn't heartbeat while it serves a request, so streamed responses
+# (events, open_intervals, export) longer than timeout would get it killed;
+# gthread workers heartbeat from their main loop and serve a stream per thread
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+preload_app = True
+accesslog = '-'
+
+
+def when_ready(server):
+    from django.db import connections
+    from timeline import warmup
+
+    seconds = warmup.warm()
+    # workers must not share database sockets of the master
+    connections.close_all()
+    if hasattr(gc, 'freeze'):
+        # python 3.7+, garbage collection in workers doesn't touch (and copy) preloaded objects
+        gc.freeze()
+
+    server.log.info(
+        'Warmed up in %.3fs, master ready in %.3fs', seconds, time.perf_counter() - _started
+    )
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    from timeline.warmup import memory_usage
+
+    memory = memory_usage() or {}
+    worker.log.info(
+        'Worker %s booted in %.3fs, rss %s KiB, private %s KiB',
+        worker.pid,
+        time.perf_counter() - worker.forked_at,
+        memory.get('rss', '-'),
+        memory.get('private', '-'),
+    )
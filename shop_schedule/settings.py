@@ -41,7 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework.authtoken',
-    'timeline',
+    'timeline.apps.TimelineConfig',
 ]
 
 REST_FRAMEWORK = {
@@ -51,6 +51,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # reverse proxies in front of the app, clients are told apart by REMOTE_ADDR by
+    # default, otherwise by the X-Forwarded-For address the last proxy has added
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
 MIDDLEWARE = [
@@ -61,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'timeline.profiling.ProfileMiddleware',
 ]
 
 ROOT_URLCONF = 'shop_schedule.urls'
@@ -94,9 +98,39 @@ DATABASES = {
         'USER': os.environ.get('DATABASE_USER', ''),
         'HOST': os.environ.get('DATABASE_HOST', ''),
         'PORT': os.environ.get('DATABASE_PORT', ''),
+        # seconds to keep a connection between requests, "none" keeps it forever
+        'CONN_MAX_AGE': (
+            None
+            if os.environ.get('DATABASE_CONN_MAX_AGE') == 'none'
+            else int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+        ),
+        # ping kept connections at the start of a request, see timeline.db
+        'CONN_HEALTH_CHECKS': os.environ.get('DATABASE_CONN_HEALTH_CHECKS', '1') == '1',
+        # used by the timeline.backends.postgresql_pool engine
+        'POOL_MIN_SIZE': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 0)),
+        'POOL_MAX_SIZE': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+        # seconds to wait for a free pooled connection
+        'POOL_TIMEOUT': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
     }
 }
 
+# Optional sharding of shops by owner: comma separated database aliases.
+# Aliases missing from DATABASES copy the default database settings with
+# NAME taken from DATABASE_NAME_<ALIAS>.
+TIMELINE_SHARDS = [alias for alias in os.environ.get('TIMELINE_SHARDS', '').split(',') if alias]
+
+for alias in TIMELINE_SHARDS:
+    if alias not in DATABASES:
+        DATABASES[alias] = dict(
+            DATABASES['default'],
+            NAME=os.environ.get(
+                'DATABASE_NAME_' + alias.upper(),
+                '{}_{}'.format(DATABASES['default']['NAME'], alias),
+            ),
+        )
+
+DATABASE_ROUTERS = ['timeline.sharding.OwnerShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -144,3 +178,55 @@ DEFAULT_SHOP_SCHEDULE = {
         {'from_time': datetime.time(15, 15), 'to_time': datetime.time(15, 25)},
     ],
 }
+
+# load weekly entries of all shops into memory before forking server workers
+SCHEDULE_SNAPSHOT = os.environ.get('SCHEDULE_SNAPSHOT') == '1'
+
+# upper limit of is_working cache lifetime, seconds
+SCHEDULE_CACHE_MAX_AGE = int(os.environ.get('SCHEDULE_CACHE_MAX_AGE', 3600))
+
+# outbox readers skip changes younger than this, seconds. Change ids are taken
+# at insert and a transaction holding a smaller id may commit later, so it must
+# exceed the longest writing transaction plus the clock skew between servers
+OUTBOX_SETTLE_SECONDS = float(os.environ.get('OUTBOX_SETTLE_SECONDS', 5))
+
+# seconds between outbox checks of the events scheduler, changes made by
+# other processes are pushed after OUTBOX_SETTLE_SECONDS plus this
+EVENTS_POLL_SECONDS = float(os.environ.get('EVENTS_POLL_SECONDS', 2))
+# shops of one events stream, each of them is checked when the stream starts
+EVENTS_MAX_IDS = int(os.environ.get('EVENTS_MAX_IDS', 100))
+# shops of one bulk status request, they are read by one IN (...) query per shard
+STATUS_MAX_IDS = int(os.environ.get('STATUS_MAX_IDS', 100))
+
+# seconds a running job keeps its worker without a heartbeat, then it is taken
+# by another worker (jobs of crashed or restarted workers)
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+
+# SCHEDULE_THROTTLE=0 turns throttling off, e.g. for the server under loadtest
+SCHEDULE_THROTTLE = os.environ.get('SCHEDULE_THROTTLE', '1') == '1'
+
+# token buckets of public shop actions, "N/period" allows bursts of N requests
+# per client ip or token, refilled over the period (s, m, h or d)
+SCHEDULE_THROTTLE_RATES = {
+    'is_working': os.environ.get('THROTTLE_IS_WORKING', '600/min'),
+    'schedule': os.environ.get('THROTTLE_SCHEDULE', '300/min'),
+    'open_intervals': os.environ.get('THROTTLE_OPEN_INTERVALS', '60/min'),
+    'bulk_status': os.environ.get('THROTTLE_BULK_STATUS', '60/min'),
+    'open_shops': os.environ.get('THROTTLE_OPEN_SHOPS', '60/min'),
+    'nearby': os.environ.get('THROTTLE_NEARBY', '120/min'),
+}
+# cache alias to share the buckets between processes, kept in process by default
+SCHEDULE_THROTTLE_CACHE = os.environ.get('SCHEDULE_THROTTLE_CACHE') or None
+
+# share of requests profiled by timeline.profiling.ProfileMiddleware (0 - only
+# requests of staff users with the "X-Profile: 1" header), "cprofile" or "sample"
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+# seconds between stack samples of the "sample" mode
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+
+# grid cell size of the shop location index, degrees
+GEO_CELL_DEGREES = float(os.environ.get('GEO_CELL_DEGREES', 0.05))
+# nearest shops checked for open status by one nearby search
+GEO_MAX_CANDIDATES = int(os.environ.get('GEO_MAX_CANDIDATES', 2000))
+GEO_MAX_RADIUS_KM = float(os.environ.get('GEO_MAX_RADIUS_KM', 50))
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 
 
 class TimelineConfig(AppConfig):
     name = 'timeline'
+
+    def ready(self):
+        from .db import check_connections
+
+        request_started.connect(check_connections, dispatch_uid="timeline_check_connections")
@@ -0,0 +1,108 @@
+"""
+PostgreSQL backend taking connections from an in-process pool.
+
+Closing a Django connection (at the end of a request with CONN_MAX_AGE=0,
+or a worker thread finishing) returns it to the pool instead of closing the
+socket, so threaded and gevent workers share at most POOL_MAX_SIZE open
+connections per process. Pools are created lazily, after a preforking server
+has forked its workers. When all of them are taken, a thread waits up to
+POOL_TIMEOUT seconds for a free one.
+"""
+import os
+import threading
+from django.db.backends.postgresql import base
+from psycopg2 import pool
+
+_pools = {}
+_lock = threading.Lock()
+
+
+class WaitingConnectionPool(pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool raises PoolError at once when it is exhausted,
+    this one waits for a returned connection and then fails with OperationalError
+    """
+
+    def __init__(self, minconn, maxconn, timeout, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise base.Database.OperationalError(
+                "No free connection in the pool of {} after {} seconds, "
+                "raise POOL_MAX_SIZE or lower the number of threads".format(
+                    self.maxconn, self.timeout
+                )
+            )
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        super().putconn(conn, key, close)
+        self._slots.release()
+
+
+def get_pool(alias, settings_dict, conn_params):
+    key = (os.getpid(), alias)
+    with _lock:
+        if key not in _pools:
+            _pools[key] = WaitingConnectionPool(
+                settings_dict.get("POOL_MIN_SIZE", 0),
+                settings_dict.get("POOL_MAX_SIZE", 10),
+                settings_dict.get("POOL_TIMEOUT", 10),
+                **conn_params
+            )
+        return _pools[key]
+
+
+def close_pools():
+    with _lock:
+        for key in [key for key in _pools if key[0] == os.getpid()]:
+            _pools.pop(key).closeall()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connection_pool = get_pool(self.alias, self.settings_dict, conn_params)
+        connection = connection_pool.getconn()
+
+        if self.settings_dict.get("CONN_HEALTH_CHECKS"):
+            # connections could wait in the pool longer than the server keeps them,
+            # every idle connection is checked at most once
+            for _ in range(self.settings_dict.get("POOL_MAX_SIZE", 10)):
+                if self._ping(connection):
+                    break
+                connection_pool.putconn(connection, close=True)
+                connection = connection_pool.getconn()
+
+        # same as the parent, a pooled connection keeps the isolation level it was set to
+        self.isolation_level = self.settings_dict["OPTIONS"].get(
+            "isolation_level", connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _ping(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            # the ping doesn't leave an open transaction
+            connection.rollback()
+        except base.Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        connection_pool = get_pool(self.alias, self.settings_dict, self.get_connection_params())
+        with self.wrap_database_errors:
+            # the pool rolls back an unfinished transaction and drops closed connections
+            connection_pool.putconn(self.connection, close=self.errors_occurred)
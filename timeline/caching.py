@@ -0,0 +1,94 @@
+import datetime
+from django.conf import settings
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def schedule_etag(shop, date=None):
+    # past special hours drop out of the schedule every day
+    if date is None:
+        date = timezone.localdate()
+    return quote_etag(
+        "{}-{}-{}".format(shop.pk, shop.schedule_version, date.strftime("%Y%m%d"))
+    )
+
+
+def is_working_etag(shop, expires):
+    return quote_etag(
+        "{}-{}-{}".format(shop.pk, shop.schedule_version, int(expires.timestamp()))
+    )
+
+
+def if_none_match(request):
+    return parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+
+
+def schedule_not_modified(request, shop, date=None):
+    """
+    Schedule can only change together with schedule version and date
+    """
+    etag = schedule_etag(shop, date)
+    if etag in if_none_match(request) or "*" in if_none_match(request):
+        return cached_response(status=status.HTTP_304_NOT_MODIFIED, etag=etag)
+    return None
+
+
+def is_working_not_modified(request, shop, now=None):
+    """
+    is_working result is valid till expiration time kept in its etag
+    """
+    if now is None:
+        now = timezone.now()
+
+    for etag in if_none_match(request):
+        shop_id, _, rest = etag.strip('"').partition("-")
+        version, _, expires = rest.partition("-")
+        if not (shop_id.isdigit() and version.isdigit() and expires.isdigit()):
+            continue
+        if int(shop_id) != shop.pk or int(version) != shop.schedule_version:
+            continue
+
+        expires = datetime.datetime.fromtimestamp(int(expires), tz=timezone.utc)
+        if expires > now:
+            return cached_response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                etag=etag,
+                max_age=max_age(now, expires),
+            )
+
+    return None
+
+
+def is_working_expires(shop, now=None):
+    """
+    Cache is_working till the next open/close transition
+    """
+    if now is None:
+        now = timezone.now()
+
+    expires = now + datetime.timedelta(seconds=settings.SCHEDULE_CACHE_MAX_AGE)
+    transition = shop.next_transition(now)
+    if transition is not None and transition < expires:
+        expires = transition
+
+    return expires
+
+
+def max_age(now, expires):
+    return max(int((expires - now).total_seconds()), 0)
+
+
+def cached_response(data=None, status=None, etag=None, max_age=None):
+    response = Response(data, status=status)
+
+    if etag is not None:
+        response["ETag"] = etag
+
+    if max_age is None:
+        response["Cache-Control"] = "public, no-cache"
+    else:
+        response["Cache-Control"] = "public, max-age={}".format(max_age)
+
+    return response
@@ -0,0 +1,28 @@
+"""
+Reuse of database connections.
+
+Django 2.1 keeps a connection for CONN_MAX_AGE seconds but doesn't check it
+before reuse, so the first query of a request fails after the database
+restarts or drops idle connections. Databases with CONN_HEALTH_CHECKS get
+their kept connections pinged at the start of every request and replaced
+when they don't answer.
+"""
+from django.db import connections
+
+
+def check_connection(connection):
+    """
+    Close the kept connection if it's broken, the next query opens a new one
+    """
+    if connection.connection is None or connection.in_atomic_block:
+        return
+    if not connection.settings_dict.get("CONN_HEALTH_CHECKS"):
+        return
+
+    if not connection.is_usable():
+        connection.close()
+
+
+def check_connections(**kwargs):
+    for connection in connections.all():
+        check_connection(connection)
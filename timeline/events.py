@@ -0,0 +1,225 @@
+import heapq
+import json
+import queue
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+# seconds between keepalive comments of event stream
+KEEPALIVE_TIMEOUT = 15
+
+
+class Subscription:
+    def __init__(self, shop_ids):
+        self.shop_ids = frozenset(shop_ids)
+        self.queue = queue.Queue()
+
+    def get(self, timeout=None):
+        """
+        Wait for the next event, None on timeout
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """
+    In-process publish/subscribe of shop open/close events
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, shop_ids):
+        subscription = Subscription(shop_ids)
+        with self._lock:
+            for shop_id in subscription.shop_ids:
+                self._subscriptions[shop_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Remove subscription, return shops nobody is subscribed to anymore
+        """
+        unused = set()
+        with self._lock:
+            for shop_id in subscription.shop_ids:
+                self._subscriptions[shop_id].discard(subscription)
+                if not self._subscriptions[shop_id]:
+                    del self._subscriptions[shop_id]
+                    unused.add(shop_id)
+        return unused
+
+    def publish(self, shop_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(shop_id, ()))
+        for subscription in subscriptions:
+            subscription.queue.put(event)
+
+
+class TransitionScheduler:
+    """
+    Keep a heap of the next open/close transition of every watched shop
+    and publish an event when the shop state changes
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker or Broker()
+        self._lock = threading.Lock()
+        self._heap = []
+        self._due = {}
+        self._states = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        # last outbox record applied by sync
+        self.cursor = None
+
+    def subscribe(self, shop_ids):
+        subscription = self.broker.subscribe(shop_ids)
+        for shop_id in subscription.shop_ids:
+            if shop_id not in self._states:
+                self.refresh(shop_id)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for shop_id in self.broker.unsubscribe(subscription):
+                self._states.pop(shop_id, None)
+                self._due.pop(shop_id, None)
+
+    def state(self, shop_id):
+        return self._states.get(shop_id)
+
+    def refresh(self, shop_id, now=None):
+        """
+        Recalculate shop state and its next transition
+        """
+        from .models import Shop
+
+        if now is None:
+            now = timezone.now()
+
+        shop = Shop.objects.for_shop(shop_id).filter(pk=shop_id).first()
+        if shop is None:
+            is_working, transition = None, None
+        else:
+            is_working, transition = shop.is_working(), shop.next_transition(now)
+
+        with self._lock:
+            previous = self._states.get(shop_id)
+            self._states[shop_id] = is_working
+            self._due.pop(shop_id, None)
+            if transition is not None:
+                self._due[shop_id] = transition
+                heapq.heappush(self._heap, (transition, shop_id))
+
+        self._wakeup.set()
+
+        if previous is not None and previous != is_working:
+            self.broker.publish(shop_id, {"shop": shop_id, "is_working": is_working})
+
+        return is_working
+
+    def schedule_changed(self, shop_ids):
+        for shop_id in shop_ids:
+            if shop_id in self._states:
+                self.refresh(shop_id)
+
+    def sync(self):
+        """
+        Refresh watched shops changed in other processes, as recorded in the outbox
+        """
+        from .outbox import iter_changes, last_cursor
+
+        if self.cursor is None or not self._states:
+            # states of new subscriptions are read from the database
+            self.cursor = last_cursor()
+            return
+
+        changed = set()
+        for change in iter_changes(self.cursor):
+            changed.add(change.shop_id)
+            self.cursor = change.pk
+        self.schedule_changed(sorted(changed))
+
+    def tick(self, now=None):
+        """
+        Refresh shops with due transitions,
+        return seconds until the next transition or None
+        """
+        if now is None:
+            now = timezone.now()
+
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                transition, shop_id = heapq.heappop(self._heap)
+                # skip entries replaced by a later refresh
+                if self._due.get(shop_id) == transition:
+                    due.append(shop_id)
+
+        for shop_id in due:
+            self.refresh(shop_id, now)
+
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return max((self._heap[0][0] - now).total_seconds(), 0)
+
+    def start(self):
+        with self._lock:
+            # a thread stopped by an error is replaced
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            self.sync()
+            timeout = self.tick()
+            close_old_connections()
+            poll = settings.EVENTS_POLL_SECONDS
+            self._wakeup.wait(poll if timeout is None else min(timeout, poll))
+
+
+scheduler = TransitionScheduler()
+
+
+def schedule_changed(shop_ids):
+    scheduler.schedule_changed(shop_ids)
+
+
+def format_event(event):
+    return "event: state\ndata: {}\n\n".format(json.dumps(event))
+
+
+def stream(shop_ids, scheduler=scheduler):
+    """
+    Server-sent events with the current state of shops and then their changes
+    """
+    scheduler.start()
+    subscription = scheduler.subscribe(shop_ids)
+
+    try:
+        for shop_id in sorted(subscription.shop_ids):
+            yield format_event({"shop": shop_id, "is_working": scheduler.state(shop_id)})
+
+        # the stream doesn't query, a pooled or per request connection goes back now
+        close_old_connections()
+        while True:
+            event = subscription.get(timeout=KEEPALIVE_TIMEOUT)
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield format_event(event)
+    finally:
+        scheduler.unsubscribe(subscription)
@@ -0,0 +1,120 @@
+"""
+Streaming export of the weekly schedule of every shop.
+
+Entry rows are read once, shard by shard, through a server-side cursor
+ordered by (shop, from_time) and grouped per shop on the fly, so memory
+doesn't depend on the size of the catalog. Entries of a day start within
+the day, so they come ordered by day_of_week too. Shops without working
+hours have no entries and are not exported.
+"""
+import csv
+import datetime
+import json
+from itertools import groupby
+from django.utils import timezone
+from . import sharding
+from .serializers import group_by_day
+from .utils import MINUTES_PER_WEEK
+
+CHUNK_SIZE = 2000
+CRLF = "\r\n"
+
+
+def iter_shops(chunk_size=CHUNK_SIZE):
+    """
+    Yield (shop id, [(day_of_week, from_time, to_time)]) of every shop with entries
+    """
+    from .models import Entry
+
+    for alias in sharding.shards():
+        rows = (
+            Entry.objects.using(alias)
+            .order_by("shop_id", "from_time")
+            .values_list("shop_id", "day_of_week", "from_time", "to_time")
+            .iterator(chunk_size=chunk_size)
+        )
+        for shop_id, shop_rows in groupby(rows, key=lambda row: row[0]):
+            yield shop_id, [row[1:] for row in shop_rows]
+
+
+class Echo:
+    """
+    File-like object returning what is written, lets csv.writer feed a stream
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_csv(shops):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("shop", "day_of_week", "from_time", "to_time"))
+    for shop_id, entries in shops:
+        for day, hours in group_by_day(entries).items():
+            for part in hours:
+                yield writer.writerow((shop_id, day, part["from_time"], part["to_time"]))
+
+
+def export_jsonl(shops):
+    """
+    One object per shop, the schedule has the format of GET /api/shop/[id]/schedule
+    """
+    for shop_id, entries in shops:
+        yield json.dumps({"shop": shop_id, "working_hours": group_by_day(entries)}) + "\n"
+
+
+def ics_time(dt):
+    return dt.strftime("%Y%m%dT%H%M%S")
+
+
+def export_ics(shops, week=None):
+    """
+    Weekly recurring events in floating (shop local) time,
+    they start from the week of the week date, the current one by default
+    """
+    if week is None:
+        week = timezone.localdate()
+    monday = datetime.datetime.combine(
+        week - datetime.timedelta(days=week.weekday()), datetime.time()
+    )
+    stamp = timezone.now().strftime("%Y%m%dT%H%M%SZ")
+
+    yield CRLF.join(
+        ("BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//shop-schedule//export//EN", "")
+    )
+    for shop_id, entries in shops:
+        for _, from_time, to_time in entries:
+            if to_time < from_time:
+                to_time += MINUTES_PER_WEEK
+            start = monday + datetime.timedelta(minutes=from_time)
+            # to_time is included
+            end = monday + datetime.timedelta(minutes=to_time + 1)
+            yield CRLF.join(
+                (
+                    "BEGIN:VEVENT",
+                    "UID:shop-{}-{}@shop-schedule".format(shop_id, from_time),
+                    "DTSTAMP:" + stamp,
+                    "DTSTART:" + ics_time(start),
+                    "DTEND:" + ics_time(end),
+                    "RRULE:FREQ=WEEKLY",
+                    "SUMMARY:Shop {} is open".format(shop_id),
+                    "END:VEVENT",
+                    "",
+                )
+            )
+    yield "END:VCALENDAR" + CRLF
+
+
+FORMATS = {
+    "csv": (export_csv, "text/csv"),
+    "jsonl": (export_jsonl, "application/x-ndjson"),
+    "ics": (export_ics, "text/calendar"),
+}
+
+
+def export(output, chunk_size=CHUNK_SIZE):
+    """
+    Chunks of the export in the output format and its content type
+    """
+    writer, content_type = FORMATS[output]
+    return writer(iter_shops(chunk_size)), content_type
@@ -0,0 +1,191 @@
+"""
+In-process grid index of shop locations.
+
+Shops are kept in square cells of GEO_CELL_DEGREES. The index is loaded from
+the database once and then follows the outbox (Change rows), so every process
+sees location changes of other processes without a GIS extension.
+"""
+import math
+import threading
+from collections import defaultdict
+from django.conf import settings
+from . import sharding
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance by the haversine formula
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    lat_part = math.sin((lat2 - lat1) / 2) ** 2
+    lng_part = math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    a = lat_part + lng_part
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    def __init__(self, cell_degrees=None):
+        self.cell_degrees = cell_degrees or settings.GEO_CELL_DEGREES
+        self.columns = int(math.ceil(360 / self.cell_degrees))
+        self.cells = defaultdict(dict)
+        self.locations = {}
+        # last applied outbox record, None until loaded
+        self.cursor = None
+        self._lock = threading.RLock()
+
+    def cell(self, lat, lng):
+        row = int(math.floor((lat + 90) / self.cell_degrees))
+        column = int(math.floor((lng + 180) / self.cell_degrees)) % self.columns
+        return row, column
+
+    def update(self, shop_id, lat, lng):
+        with self._lock:
+            self.remove(shop_id)
+            if lat is None or lng is None:
+                return
+
+            self.cells[self.cell(lat, lng)][shop_id] = (lat, lng)
+            self.locations[shop_id] = (lat, lng)
+
+    def remove(self, shop_id):
+        with self._lock:
+            location = self.locations.pop(shop_id, None)
+            if location is None:
+                return
+
+            cell = self.cell(*location)
+            self.cells[cell].pop(shop_id, None)
+            if not self.cells[cell]:
+                del self.cells[cell]
+
+    def nearby(self, lat, lng, radius_km):
+        """
+        (distance, shop id) of shops within radius_km, nearest first
+        """
+        lat_span = radius_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(abs(lat) + lat_span, 90)))
+        if cos_lat * 180 <= lat_span:
+            lng_span = 180
+        else:
+            lng_span = min(lat_span / cos_lat, 180)
+
+        first_row, first_column = self.cell(max(lat - lat_span, -90), lng - lng_span)
+        last_row, _ = self.cell(min(lat + lat_span, 90), lng)
+        columns = min(int(math.ceil(2 * lng_span / self.cell_degrees)) + 1, self.columns)
+
+        found = []
+        with self._lock:
+            for row in range(first_row, last_row + 1):
+                for offset in range(columns):
+                    cell = self.cells.get((row, (first_column + offset) % self.columns))
+                    if not cell:
+                        continue
+                    for shop_id, (shop_lat, shop_lng) in cell.items():
+                        distance = distance_km(lat, lng, shop_lat, shop_lng)
+                        if distance <= radius_km:
+                            found.append((distance, shop_id))
+
+        found.sort()
+        return found
+
+    def load(self):
+        """
+        Fill the index from all shards
+        """
+        from .models import Shop
+        from .outbox import last_cursor
+
+        with self._lock:
+            # changes committed while loading are applied by the next sync
+            cursor = last_cursor()
+
+            self.cells.clear()
+            self.locations.clear()
+            for alias in sharding.shards():
+                shops = (
+                    Shop.objects.using(alias)
+                    .filter(latitude__isnull=False, longitude__isnull=False)
+                    .values_list("pk", "latitude", "longitude")
+                )
+                for shop_id, lat, lng in shops.iterator():
+                    self.update(shop_id, lat, lng)
+            self.cursor = cursor
+
+    def sync(self):
+        """
+        Apply shop changes recorded in the outbox since the last sync
+        """
+        from .models import Change, Shop
+        from .outbox import iter_changes
+
+        with self._lock:
+            if self.cursor is None:
+                self.load()
+                return
+
+            changed = set()
+            for change in iter_changes(self.cursor):
+                if change.kind in (Change.SHOP, Change.DELETE):
+                    changed.add(change.shop_id)
+                self.cursor = change.pk
+            if not changed:
+                return
+
+            for alias, shop_ids in sharding.group_by_shard(changed).items():
+                locations = dict.fromkeys(shop_ids, (None, None))
+                locations.update(
+                    (shop_id, (lat, lng))
+                    for shop_id, lat, lng in Shop.objects.using(alias)
+                    .filter(pk__in=shop_ids)
+                    .values_list("pk", "latitude", "longitude")
+                )
+                for shop_id, (lat, lng) in locations.items():
+                    self.update(shop_id, lat, lng)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Index of this process, created on first use
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = GridIndex()
+        return _index
+
+
+def reset():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def nearby_open(lat, lng, radius_km, limit, dt=None):
+    """
+    Up to limit (distance, shop id) of shops open at dt, nearest first.
+    Candidates are checked in batches, at most GEO_MAX_CANDIDATES of them
+    """
+    from .models import Shop
+
+    grid = get_index()
+    grid.sync()
+
+    candidates = grid.nearby(lat, lng, radius_km)[:settings.GEO_MAX_CANDIDATES]
+    batch_size = max(limit * 2, 50)
+
+    result = []
+    for start in range(0, len(candidates), batch_size):
+        batch = candidates[start:start + batch_size]
+        status = Shop.objects.bulk_is_working([shop_id for _, shop_id in batch], dt)
+        result += [(distance, shop_id) for distance, shop_id in batch if status.get(shop_id)]
+        if len(result) >= limit:
+            break
+
+    return result[:limit]
@@ -0,0 +1,203 @@
+import datetime
+import json
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from . import sharding
+from .models import Change, Daysoff, Job, Shop
+from .maintenance import delete_shops, iter_id_chunks, iter_shop_chunks, reschedule_shops
+from .serializers import ScheduleSerialized
+
+# attempts before job is marked as failed
+MAX_ATTEMPTS = 3
+
+handlers = {}
+# job run by the thread, its lease is renewed by heartbeat()
+_current = threading.local()
+
+
+def handler(kind):
+    """
+    Register function handling jobs of the kind, it gets job payload
+    and returns json serializable result
+    """
+
+    def register(func):
+        handlers[kind] = func
+        return func
+
+    return register
+
+
+def enqueue(kind, payload, owner=None):
+    if kind not in handlers:
+        raise ValueError("Unknown job kind: {}".format(kind))
+
+    return Job.objects.create(kind=kind, payload=json.dumps(payload), owner=owner)
+
+
+def requeue_expired(now=None):
+    """
+    Return running jobs without a heartbeat for JOB_LEASE_SECONDS to the queue,
+    the ones out of attempts are failed. Return number of requeued jobs
+    """
+    if now is None:
+        now = timezone.now()
+
+    expired = Job.objects.filter(
+        status=Job.RUNNING,
+        heartbeat_at__lt=now - datetime.timedelta(seconds=settings.JOB_LEASE_SECONDS),
+    )
+    expired.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=Job.FAILED, error="Lease expired", finished_at=now
+    )
+    return expired.update(status=Job.QUEUED, error="Lease expired")
+
+
+def dequeue():
+    """
+    Take the oldest queued job and mark it as running, None if queue is empty
+    """
+    requeue_expired()
+    queued = Job.objects.filter(status=Job.QUEUED).order_by("pk")
+    now = timezone.now()
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = queued.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = Job.RUNNING
+            job.started_at = job.heartbeat_at = now
+            job.attempts += 1
+            job.save(update_fields=["status", "started_at", "heartbeat_at", "attempts"])
+            return job
+
+    # without SKIP LOCKED (sqlite) job is claimed by conditional update
+    for pk in queued.values_list("pk", flat=True)[:10]:
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+
+    return None
+
+
+def heartbeat():
+    """
+    Renew the lease of the job run by this thread, handlers call it between chunks
+    """
+    job = getattr(_current, "job", None)
+    if job is not None:
+        Job.objects.filter(pk=job.pk, attempts=job.attempts).update(
+            heartbeat_at=timezone.now()
+        )
+
+
+def run(job):
+    _current.job = job
+    try:
+        result = handlers[job.kind](json.loads(job.payload))
+    except Exception as exc:
+        job.error = repr(exc)
+        job.status = Job.QUEUED if job.attempts < MAX_ATTEMPTS else Job.FAILED
+    else:
+        job.result = json.dumps(result)
+        job.error = ""
+        job.status = Job.DONE
+    finally:
+        _current.job = None
+
+    job.finished_at = timezone.now()
+    # a job taken over after its lease expired is finished by the new attempt
+    Job.objects.filter(pk=job.pk, attempts=job.attempts).update(
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        finished_at=job.finished_at,
+    )
+    return job
+
+
+def work(burst=False, poll_interval=1.0, stop=None):
+    """
+    Run jobs until stop event is set, or until queue is empty in burst mode
+    """
+    while stop is None or not stop.is_set():
+        job = dequeue()
+        if job is not None:
+            run(job)
+            continue
+
+        if burst:
+            return
+
+        close_old_connections()
+        time.sleep(poll_interval)
+
+
+@handler("reschedule")
+def reschedule(payload):
+    serializer = ScheduleSerialized(data=payload["working_schedule"])
+    serializer.is_valid(raise_exception=True)
+    days = payload.get("days", list(range(7)))
+
+    changed = 0
+    for shop_ids in iter_shop_chunks(payload.get("chunk_size", 1000), owner=payload["owner"]):
+        # days already equal to the schedule are skipped, a retry continues
+        changed += len(reschedule_shops(shop_ids, serializer.validated_data, days))
+        heartbeat()
+
+    return {"changed": changed}
+
+
+@handler("close")
+def close(payload):
+    """
+    Add the days off to every shop of the owner, shops already closed
+    for the same dates by an earlier attempt are skipped
+    """
+    alias = sharding.shard_for_owner(payload["owner"])
+    from_date, to_date = payload["from_date"], payload.get("to_date")
+    closed = 0
+    for shop_ids in iter_shop_chunks(payload.get("chunk_size", 1000), owner=payload["owner"]):
+        with sharding.atomic(alias):
+            existing = Daysoff.objects.using(alias).filter(
+                shop_id__in=shop_ids, from_date=from_date
+            )
+            if to_date is None:
+                existing = existing.filter(to_date__isnull=True)
+            else:
+                existing = existing.filter(to_date=to_date)
+            done = set(existing.values_list("shop_id", flat=True))
+            new_ids = [shop_id for shop_id in shop_ids if shop_id not in done]
+
+            Daysoff.objects.using(alias).bulk_create(
+                Daysoff(shop_id=shop_id, from_date=from_date, to_date=to_date)
+                for shop_id in new_ids
+            )
+            if new_ids:
+                Shop.objects.schedule_changed(new_ids, Change.DAYSOFF)
+        closed += len(shop_ids)
+        heartbeat()
+
+    return {"closed": closed}
+
+
+@handler("delete")
+def delete(payload):
+    deleted = 0
+    for shop_ids in iter_id_chunks(payload["ids"], payload.get("chunk_size", 500)):
+        # only own shops are deleted
+        owned = Shop.objects.for_owner(payload["owner"]).filter(pk__in=shop_ids)
+        deleted += delete_shops(list(owned.values_list("pk", flat=True)))
+        heartbeat()
+
+    return {"deleted": deleted}
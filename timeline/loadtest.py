@@ -0,0 +1,305 @@
+"""
+Load generator for the shop API.
+
+Seeds shops through the public API and replays a weighted mix of calls with
+asyncio clients, every client keeps one HTTP/1.1 keep-alive connection.
+"""
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+KINDS = ("is_working", "schedule", "update_schedule", "close")
+DEFAULT_MIX = "is_working=70,schedule=20,update_schedule=7,close=3"
+
+
+def parse_mix(value):
+    """
+    Parse "kind=weight,..." into a list of (kind, weight)
+    """
+    mix = []
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise ValueError("unknown request kind {!r}".format(kind))
+        try:
+            weight = int(weight or 1)
+        except ValueError:
+            raise ValueError("weight of {} must be an integer".format(kind))
+        if weight < 0:
+            raise ValueError("weight of {} must not be negative".format(kind))
+        mix.append((kind, weight))
+
+    if not any(weight for _, weight in mix):
+        raise ValueError("at least one request kind needs a positive weight")
+
+    return mix
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of sorted values
+    """
+    if not values:
+        return None
+    rank = math.ceil(q / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        # 429 responses, they are not errors of the server
+        self.throttled = defaultdict(int)
+        self.started = None
+        self.finished = None
+
+    def record(self, kind, latency, ok, throttled=False):
+        self.latencies[kind].append(latency)
+        if throttled:
+            self.throttled[kind] += 1
+        elif not ok:
+            self.errors[kind] += 1
+
+    def summary(self):
+        """
+        Rows of (kind, requests, errors, p50, p95, p99) with the total row last,
+        latencies are in milliseconds
+        """
+        rows = []
+        everything = []
+        for kind in sorted(self.latencies):
+            values = sorted(self.latencies[kind])
+            everything += values
+            rows.append(self._row(kind, values, self.errors[kind]))
+
+        rows.append(self._row("total", sorted(everything), sum(self.errors.values())))
+        return rows
+
+    def throughput(self):
+        requests = sum(len(values) for values in self.latencies.values())
+        return requests / max(self.finished - self.started, 1e-6)
+
+    def _row(self, kind, values, errors):
+        return (
+            kind,
+            len(values),
+            errors,
+            *(percentile(values, q) * 1000 if values else 0.0 for q in (50, 95, 99))
+        )
+
+
+class HttpError(Exception):
+    pass
+
+
+class Client:
+    """
+    Minimal HTTP/1.1 client with a keep-alive connection
+    """
+
+    def __init__(self, url, token=None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.token = token
+        self.reader = self.writer = None
+
+    async def request(self, method, path, data=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        headers = [
+            "{} {}{} HTTP/1.1".format(method, self.prefix, path),
+            "Host: {}:{}".format(self.host, self.port),
+            "Accept: application/json",
+            "Content-Length: {}".format(len(body)),
+        ]
+        if data is not None:
+            headers.append("Content-Type: application/json")
+        if self.token:
+            headers.append("Authorization: Token {}".format(self.token))
+        message = ("\r\n".join(headers) + "\r\n\r\n").encode() + body
+
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port
+                )
+            try:
+                self.writer.write(message)
+                return await self._read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # the server closed a kept-alive connection, retry once
+                self.close()
+                if attempt:
+                    raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding") == "chunked":
+            body = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+                body += chunk[:-2]
+        else:
+            body = await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+
+        return status, body
+
+    async def json(self, method, path, data=None, expected=(200, 201)):
+        status, body = await self.request(method, path, data)
+        if status not in expected:
+            raise HttpError("{} {}: {} {}".format(method, path, status, body[:200]))
+        return json.loads(body.decode()) if body else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def random_schedule(rng):
+    """
+    Working schedule in the update_schedule format, sometimes overnight or with a break
+    """
+    from_hour = rng.choice((6, 7, 8, 9, 10, 11))
+    if rng.random() < 0.1:
+        to_time = "{:02d}:00".format(rng.choice((0, 1, 2, 3)))
+    else:
+        to_time = "{:02d}:{:02d}".format(rng.randint(17, 23), rng.choice((0, 30, 59)))
+
+    schedule = {"from_time": "{:02d}:00".format(from_hour), "to_time": to_time}
+    if rng.random() < 0.5:
+        schedule["breaks"] = [{"from_time": "13:00", "to_time": "14:00"}]
+    return schedule
+
+
+def random_day(rng):
+    day_of_week = rng.randrange(7)
+    if rng.random() < 0.15:
+        return {"day_of_week": day_of_week, "is_working_day": False}
+    return {
+        "day_of_week": day_of_week,
+        "is_working_day": True,
+        "working_schedule": random_schedule(rng),
+    }
+
+
+def random_close(rng):
+    from_date = time.strftime(
+        "%Y-%m-%d", time.gmtime(time.time() + rng.randint(0, 60) * 86400)
+    )
+    return {"from_date": from_date, "to_date": from_date}
+
+
+async def seed(url, shops, rng):
+    """
+    Register a user and create shops with random schedules through the API,
+    return the token and shop ids
+    """
+    client = Client(url)
+    # a new user on every run, also with a fixed random seed
+    credentials = {
+        "username": "loadtest-{}".format(uuid.uuid4().hex[:12]),
+        "password": uuid.uuid4().hex,
+    }
+    await client.json("POST", "/user/register/", credentials)
+    token = (await client.json("POST", "/user/login/", credentials))["token"]
+    client.close()
+
+    # shops are created one by one, so seeding also works with SQLite
+    client = Client(url, token)
+    shop_ids = []
+    for number in range(shops):
+        shop = await client.json("POST", "/shop/", {"title": "shop {}".format(number)})
+        for day_of_week in range(7):
+            data = {
+                "day_of_week": day_of_week,
+                "is_working_day": rng.random() > 0.1,
+                "working_schedule": random_schedule(rng),
+            }
+            await client.json("POST", "/shop/{}/update_schedule/".format(shop["id"]), data)
+        shop_ids.append(shop["id"])
+    client.close()
+
+    return token, shop_ids
+
+
+def plan(mix, requests, rng):
+    kinds = [kind for kind, _ in mix]
+    weights = [weight for _, weight in mix]
+    return rng.choices(kinds, weights, k=requests)
+
+
+async def replay(url, token, shop_ids, kinds, concurrency, rng, stats):
+    """
+    Send the planned requests with concurrent keep-alive clients
+    """
+    queue = list(reversed(kinds))
+
+    def request_for(kind, shop_id):
+        if kind == "is_working":
+            return "GET", "/shop/{}/is_working/".format(shop_id), None
+        if kind == "schedule":
+            return "GET", "/shop/{}/schedule/".format(shop_id), None
+        if kind == "update_schedule":
+            return "POST", "/shop/{}/update_schedule/".format(shop_id), random_day(rng)
+        return "POST", "/shop/{}/close/".format(shop_id), random_close(rng)
+
+    async def worker():
+        client = Client(url, token)
+        while queue:
+            kind = queue.pop()
+            method, path, data = request_for(kind, rng.choice(shop_ids))
+            started = time.perf_counter()
+            try:
+                status, _ = await client.request(method, path, data)
+                ok = status < 400
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                client.close()
+                ok = status = False
+            stats.record(kind, time.perf_counter() - started, ok, status == 429)
+        client.close()
+
+    stats.started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+def run(url, shops, requests, concurrency, mix, random_seed=None):
+    """
+    Seed shops and replay the request mix, return Stats
+    """
+    rng = random.Random(random_seed)
+    loop = asyncio.new_event_loop()
+    try:
+        token, shop_ids = loop.run_until_complete(seed(url, shops, rng))
+        kinds = plan(mix, requests, rng)
+        return loop.run_until_complete(
+            replay(url, token, shop_ids, kinds, concurrency, rng, Stats())
+        )
+    finally:
+        loop.close()
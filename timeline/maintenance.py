@@ -0,0 +1,289 @@
+import datetime
+from collections import defaultdict
+from itertools import chain, groupby
+from django.db import connections, transaction
+from . import events, occupancy, sharding
+from .models import (
+    Change,
+    Daysoff,
+    DaysoffHistory,
+    Entry,
+    ScheduleVersion,
+    Shop,
+    SpecialHours,
+)
+from .schedule import DayScheduler
+from .utils import merge_slots
+
+
+def iter_shop_chunks(chunk_size, start_after=0, owner=None):
+    """
+    Yield lists of shop ids ordered by id, starting after start_after,
+    shops of every shard are merged
+    """
+    if owner is not None:
+        querysets = [Shop.objects.for_owner(owner)]
+    else:
+        querysets = [Shop.objects.using(alias) for alias in sharding.shards()]
+
+    while True:
+        shop_ids = sorted(
+            chain.from_iterable(
+                shops.filter(pk__gt=start_after)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:chunk_size]
+                for shops in querysets
+            )
+        )[:chunk_size]
+        if not shop_ids:
+            return
+
+        yield shop_ids
+        start_after = shop_ids[-1]
+
+
+def iter_id_chunks(shop_ids, chunk_size):
+    """
+    Yield sorted lists of the given shop ids
+    """
+    shop_ids = sorted(set(shop_ids))
+    for start in range(0, len(shop_ids), chunk_size):
+        yield shop_ids[start:start + chunk_size]
+
+
+def compact_shops(shop_ids, batch_size=1000, dry_run=False):
+    """
+    Merge overlapping and adjacent entries of every shop day, one transaction
+    per shard, return numbers of deleted and created rows
+    """
+    deleted = created = 0
+    for alias, ids in sorted(sharding.group_by_shard(shop_ids).items()):
+        shard_deleted, shard_created = compact_shard(alias, ids, batch_size, dry_run)
+        deleted += shard_deleted
+        created += shard_created
+
+    return deleted, created
+
+
+def compact_shard(alias, shop_ids, batch_size=1000, dry_run=False):
+    """
+    compact_shops of shops stored in the database alias
+    """
+    entries = (
+        Entry.objects.using(alias)
+        .filter(shop_id__in=shop_ids)
+        .order_by("shop_id", "day_of_week", "from_time")
+        .values_list("pk", "shop_id", "day_of_week", "from_time", "to_time")
+    )
+
+    delete_ids = []
+    deleted_rows = []
+    new_entries = []
+    changed_shops = set()
+    for (shop_id, day_of_week), rows in groupby(entries, key=lambda row: row[1:3]):
+        # the first of duplicated rows is kept
+        existing = {}
+        for pk, _, _, from_time, to_time in rows:
+            if existing.setdefault((from_time, to_time), pk) != pk:
+                delete_ids.append(pk)
+                deleted_rows.append((from_time, to_time))
+                changed_shops.add(shop_id)
+
+        merged = set(merge_slots(existing))
+        for row, pk in existing.items():
+            if row not in merged:
+                delete_ids.append(pk)
+                deleted_rows.append(row)
+                changed_shops.add(shop_id)
+
+        for from_time, to_time in merged - set(existing):
+            new_entries.append(
+                Entry(
+                    shop_id=shop_id,
+                    day_of_week=day_of_week,
+                    from_time=from_time,
+                    to_time=to_time,
+                )
+            )
+
+    if dry_run or not changed_shops:
+        return len(delete_ids), len(new_entries)
+
+    with sharding.atomic(alias):
+        for start in range(0, len(delete_ids), batch_size):
+            Entry.objects.using(alias).filter(
+                pk__in=delete_ids[start:start + batch_size]
+            ).delete()
+        Entry.objects.using(alias).bulk_create(new_entries, batch_size=batch_size)
+
+        Shop.objects.db_manager(alias).schedule_changed(changed_shops)
+        occupancy.apply(
+            [(entry.from_time, entry.to_time) for entry in new_entries], deleted_rows
+        )
+
+    return len(delete_ids), len(new_entries)
+
+
+def archive_daysoff(batch_size=1000, before=None):
+    """
+    Move one batch per shard of days off finished before the date into history,
+    return number of moved rows
+    """
+    if before is None:
+        before = datetime.date.today()
+
+    moved = 0
+    for alias in sharding.shards():
+        with transaction.atomic(using=alias):
+            rows = list(
+                Daysoff.objects.using(alias)
+                .filter(to_date__lt=before)
+                .order_by("pk")
+                .select_for_update()
+                .values_list("pk", "shop_id", "from_date", "to_date", "created_at")[
+                    :batch_size
+                ]
+            )
+            if not rows:
+                continue
+
+            DaysoffHistory.objects.using(alias).bulk_create(
+                DaysoffHistory(
+                    shop_id=shop_id, from_date=from_date, to_date=to_date, created_at=created_at
+                )
+                for _, shop_id, from_date, to_date, created_at in rows
+            )
+            Daysoff.objects.using(alias).filter(pk__in=[row[0] for row in rows]).delete()
+        moved += len(rows)
+
+    return moved
+
+
+def reschedule_shops(shop_ids, schedule, days=range(7), batch_size=1000, dry_run=False):
+    """
+    Replace schedule of given days with the same schedule for all shops, one
+    transaction per shard, return (shop_id, deleted rows, created rows) of changed shops
+    """
+    new_rows = {
+        day: {tuple(row) for row in DayScheduler(day).create(schedule)} for day in days
+    }
+
+    changed = []
+    for alias, ids in sorted(sharding.group_by_shard(shop_ids).items()):
+        changed += reschedule_shard(alias, ids, new_rows, batch_size, dry_run)
+    return changed
+
+
+def reschedule_shard(alias, shop_ids, new_rows, batch_size=1000, dry_run=False):
+    """
+    reschedule_shops of shops stored in the database alias,
+    new_rows maps day of week to its (from_time, to_time) rows
+    """
+    days = list(new_rows)
+    entries = (
+        Entry.objects.using(alias)
+        .filter(shop_id__in=shop_ids, day_of_week__in=days)
+        .order_by("shop_id", "day_of_week")
+        .values_list("pk", "shop_id", "day_of_week", "from_time", "to_time")
+    )
+    existing = defaultdict(lambda: defaultdict(dict))
+    for pk, shop_id, day_of_week, from_time, to_time in entries:
+        existing[shop_id][day_of_week][pk] = (from_time, to_time)
+
+    delete_ids = []
+    deleted_rows = []
+    new_entries = []
+    versions = {}
+    changed = []
+    for shop_id in shop_ids:
+        deleted = created = 0
+        for day_of_week, rows in new_rows.items():
+            current = existing[shop_id][day_of_week]
+            if set(current.values()) == rows and len(current) == len(rows):
+                continue
+
+            delete_ids += current.keys()
+            deleted_rows += current.values()
+            versions[shop_id, day_of_week] = current.values()
+            new_entries += [
+                Entry(
+                    shop_id=shop_id,
+                    day_of_week=day_of_week,
+                    from_time=from_time,
+                    to_time=to_time,
+                )
+                for from_time, to_time in rows
+            ]
+            deleted += len(current)
+            created += len(rows)
+
+        if deleted or created:
+            changed.append((shop_id, deleted, created))
+
+    if dry_run or not changed:
+        return changed
+
+    with sharding.atomic(alias):
+        for start in range(0, len(delete_ids), batch_size):
+            Entry.objects.using(alias).filter(
+                pk__in=delete_ids[start:start + batch_size]
+            ).delete()
+        Entry.objects.using(alias).bulk_create(new_entries, batch_size=batch_size)
+        ScheduleVersion.objects.db_manager(alias).record(versions)
+
+        Shop.objects.db_manager(alias).schedule_changed([shop_id for shop_id, _, _ in changed])
+        occupancy.apply(
+            [(entry.from_time, entry.to_time) for entry in new_entries], deleted_rows
+        )
+
+    return changed
+
+
+def raw_delete(model, alias, column, ids):
+    """
+    DELETE rows with column in ids without loading them into the cascade collector,
+    return number of deleted rows
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {} WHERE {} IN ({})".format(
+                connection.ops.quote_name(model._meta.db_table),
+                connection.ops.quote_name(column),
+                ", ".join(["%s"] * len(ids)),
+            ),
+            ids,
+        )
+        return cursor.rowcount
+
+
+def delete_shops(shop_ids, dry_run=False):
+    """
+    Delete shops and their timeline rows by a few raw queries, one transaction
+    per shard. Occupancy, outbox and events are updated as by Shop.delete.
+    Return number of deleted shops
+    """
+    deleted = 0
+    for alias, ids in sorted(sharding.group_by_shard(shop_ids).items()):
+        ids = sorted(ids)
+        if dry_run:
+            deleted += Shop.objects.using(alias).filter(pk__in=ids).count()
+            continue
+
+        with sharding.atomic(alias):
+            removed = list(
+                Entry.objects.using(alias)
+                .filter(shop_id__in=ids)
+                .values_list("from_time", "to_time")
+            )
+            # rows referring to the shops go first, for not deferred foreign keys
+            for model in (Entry, SpecialHours, Daysoff, DaysoffHistory, ScheduleVersion):
+                raw_delete(model, alias, "shop_id", ids)
+            count = raw_delete(Shop, alias, "id", ids)
+
+            Change.objects.record(ids, Change.DELETE)
+            transaction.on_commit(lambda ids=ids: events.schedule_changed(ids))
+            occupancy.apply(removed=removed)
+        deleted += count
+
+    return deleted
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from timeline.maintenance import archive_daysoff
+
+
+class Command(BaseCommand):
+    help = "Move finished days off into history table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--sleep", type=float, default=0, help="seconds to wait between batches"
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+
+        while True:
+            moved = archive_daysoff(options["batch_size"])
+            total += moved
+            if moved < options["batch_size"]:
+                break
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write("{} days off archived".format(total))
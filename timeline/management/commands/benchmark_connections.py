@@ -0,0 +1,114 @@
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+from timeline.db import check_connection
+from timeline.loadtest import percentile
+
+POOL_ENGINE = "timeline.backends.postgresql_pool"
+
+MODES = {
+    # settings overrides of every mode
+    "connect": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False},
+    "persistent": {"CONN_MAX_AGE": None, "CONN_HEALTH_CHECKS": False},
+    "persistent+check": {"CONN_MAX_AGE": None, "CONN_HEALTH_CHECKS": True},
+    "pool": {"ENGINE": POOL_ENGINE, "CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": True},
+}
+
+
+def make_connection(alias, overrides):
+    settings_dict = dict(connections.databases[alias], **overrides)
+    return load_backend(settings_dict["ENGINE"]).DatabaseWrapper(settings_dict, alias)
+
+
+def request(connection, query):
+    """
+    Seconds of one request: the health check, a query and the end of request cleanup
+    """
+    started = time.perf_counter()
+    check_connection(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        cursor.fetchall()
+    connection.close_if_unusable_or_obsolete()
+    return time.perf_counter() - started
+
+
+def run_mode(alias, overrides, requests, threads, query):
+    timings = []
+    errors = []
+
+    def worker(count):
+        try:
+            connection = make_connection(alias, overrides)
+            try:
+                for _ in range(count):
+                    timings.append(request(connection, query))
+            finally:
+                connection.close()
+        except Exception as exc:
+            errors.append(exc)
+
+    workers = [
+        threading.Thread(target=worker, args=(requests // threads + (i < requests % threads),))
+        for i in range(threads)
+    ]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return timings, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Compare request latency with new, persistent and pooled database connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--threads", type=int, default=1)
+        parser.add_argument(
+            "--modes",
+            default=",".join(MODES),
+            help="comma separated modes of {}, pool needs PostgreSQL".format(", ".join(MODES)),
+        )
+        parser.add_argument("--query", default="SELECT 1")
+
+    def handle(self, *args, **options):
+        if options["database"] not in connections.databases:
+            raise CommandError("Unknown database {}".format(options["database"]))
+        modes = options["modes"].split(",")
+        for mode in modes:
+            if mode not in MODES:
+                raise CommandError("Unknown mode {}".format(mode))
+
+        vendor = connections[options["database"]].vendor
+        self.stdout.write(
+            "{:<18} {:>9} {:>9} {:>9} {:>10}".format("mode", "avg ms", "p50 ms", "p95 ms", "req/s")
+        )
+        for mode in modes:
+            if mode == "pool" and vendor != "postgresql":
+                self.stdout.write("{:<18} skipped, {} database".format(mode, vendor))
+                continue
+
+            timings, seconds = run_mode(
+                options["database"],
+                MODES[mode],
+                options["requests"],
+                max(options["threads"], 1),
+                options["query"],
+            )
+            self.stdout.write(
+                "{:<18} {:>9.3f} {:>9.3f} {:>9.3f} {:>10.1f}".format(
+                    mode,
+                    sum(timings) / len(timings) * 1000,
+                    percentile(timings, 50) * 1000,
+                    percentile(timings, 95) * 1000,
+                    len(timings) / seconds,
+                )
+            )
@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand
+from timeline.maintenance import compact_shops, iter_shop_chunks
+
+
+class Command(BaseCommand):
+    help = "Merge duplicated, overlapping and adjacent schedule entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="shops per chunk")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="rows per delete/insert query"
+        )
+        parser.add_argument(
+            "--start-after",
+            type=int,
+            default=0,
+            help="resume after this shop id (printed after every chunk)",
+        )
+        parser.add_argument(
+            "--sleep", type=float, default=0, help="seconds to wait between chunks"
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        total_deleted = total_created = 0
+
+        for shop_ids in iter_shop_chunks(options["chunk_size"], options["start_after"]):
+            deleted, created = compact_shops(
+                shop_ids, options["batch_size"], options["dry_run"]
+            )
+            total_deleted += deleted
+            total_created += created
+            self.stdout.write(
+                "last shop id {}: {} rows deleted, {} rows created".format(
+                    shop_ids[-1], deleted, created
+                )
+            )
+
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(
+            "{}{} rows deleted, {} rows created, {} rows reclaimed".format(
+                "[dry run] " if options["dry_run"] else "",
+                total_deleted,
+                total_created,
+                total_deleted - total_created,
+            )
+        )
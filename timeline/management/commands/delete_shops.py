@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from timeline.maintenance import delete_shops, iter_id_chunks, iter_shop_chunks
+
+
+class Command(BaseCommand):
+    help = "Delete shops with their schedules by batched raw queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", type=int, help="delete all shops of this owner")
+        parser.add_argument("--ids", help="comma separated shop ids")
+        parser.add_argument(
+            "--chunk-size", type=int, default=500, help="shops per transaction"
+        )
+        parser.add_argument(
+            "--sleep", type=float, default=0, help="seconds to wait between chunks"
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["ids"]:
+            try:
+                shop_ids = [int(shop_id) for shop_id in options["ids"].split(",")]
+            except ValueError:
+                raise CommandError("--ids must be comma separated integers")
+            chunks = iter_id_chunks(shop_ids, options["chunk_size"])
+        elif options["owner"] is not None:
+            chunks = iter_shop_chunks(options["chunk_size"], owner=options["owner"])
+        else:
+            raise CommandError("--owner or --ids is required")
+
+        total = 0
+        for shop_ids in chunks:
+            total += delete_shops(shop_ids, options["dry_run"])
+            self.stdout.write(
+                "last shop id {}: {} shops deleted".format(shop_ids[-1], total)
+            )
+
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(
+            "{}{} shops deleted".format("[dry run] " if options["dry_run"] else "", total)
+        )
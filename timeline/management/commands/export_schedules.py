@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from timeline import export
+
+
+class Command(BaseCommand):
+    help = "Stream weekly schedules of all shops as csv, jsonl or ics"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", choices=sorted(export.FORMATS), default="csv"
+        )
+        parser.add_argument("--file", help="write to the file instead of stdout")
+        parser.add_argument("--chunk-size", type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks, _ = export.export(options["output"], options["chunk_size"])
+
+        if not options["file"]:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+
+        # csv and ics lines already end with \r\n
+        with open(options["file"], "w", encoding="utf-8", newline="") as f:
+            for chunk in chunks:
+                f.write(chunk)
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from timeline import loadtest
+
+
+class Command(BaseCommand):
+    help = "Seed shops through the API of a running server and measure request latencies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", default="http://127.0.0.1:8000/api", help="API root of the server"
+        )
+        parser.add_argument("--shops", type=int, default=20, help="shops to seed")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=10, help="concurrent clients")
+        parser.add_argument(
+            "--mix",
+            default=loadtest.DEFAULT_MIX,
+            help="weights of {}".format(", ".join(loadtest.KINDS)),
+        )
+        parser.add_argument("--seed", type=int, help="random seed to repeat a run")
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadtest.parse_mix(options["mix"])
+        except ValueError as exc:
+            raise CommandError(exc)
+        if options["shops"] < 1 or options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("shops, requests and concurrency must be positive")
+
+        try:
+            stats = loadtest.run(
+                options["url"],
+                options["shops"],
+                options["requests"],
+                options["concurrency"],
+                mix,
+                options["seed"],
+            )
+        except (OSError, loadtest.HttpError) as exc:
+            raise CommandError("seeding failed: {}".format(exc))
+
+        self.stdout.write(
+            "{:<16} {:>8} {:>8} {:>8} {:>9} {:>9} {:>9}".format(
+                "request", "count", "errors", "error %", "p50 ms", "p95 ms", "p99 ms"
+            )
+        )
+        for kind, count, errors, p50, p95, p99 in stats.summary():
+            self.stdout.write(
+                "{:<16} {:>8} {:>8} {:>8.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                    kind, count, errors, errors * 100 / max(count, 1), p50, p95, p99
+                )
+            )
+        self.stdout.write("throughput: {:.1f} requests/s".format(stats.throughput()))
+
+        throttled = sum(stats.throttled.values())
+        if throttled:
+            self.stdout.write(
+                "throttled: {} requests got 429, run the server with SCHEDULE_THROTTLE=0 "
+                "to measure it without limits".format(throttled)
+            )
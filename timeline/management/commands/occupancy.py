@@ -0,0 +1,42 @@
+import calendar
+from django.core.management.base import BaseCommand
+from timeline import occupancy
+from timeline.utils import MINUTES_PER_DAY
+
+
+class Command(BaseCommand):
+    help = "Print number of open shops for every minute of the week"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", type=int, help="count only shops of this owner")
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="recalculate the maintained catalog-wide histogram",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            occupancy.rebuild()
+
+        histogram = occupancy.get_histogram(options["owner"])
+
+        # print runs of minutes with the same count
+        start = 0
+        for minute in range(1, len(histogram) + 1):
+            if minute < len(histogram) and histogram[minute] == histogram[start]:
+                continue
+            self.stdout.write(
+                "{} - {}: {}".format(
+                    self._format_minute(start),
+                    self._format_minute(minute - 1),
+                    histogram[start],
+                )
+            )
+            start = minute
+
+    def _format_minute(self, minute):
+        day_of_week, minute = divmod(minute, MINUTES_PER_DAY)
+        return "{} {:02d}:{:02d}".format(
+            calendar.day_abbr[day_of_week], *divmod(minute, 60)
+        )
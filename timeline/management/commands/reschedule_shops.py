@@ -0,0 +1,118 @@
+import json
+import time
+from multiprocessing import Pool
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+from timeline.maintenance import iter_shop_chunks, reschedule_shops
+from timeline.serializers import ScheduleSerialized
+
+
+def reschedule_chunk(args):
+    """
+    Worker task, retries the chunk on database errors
+    """
+    shop_ids, schedule, days, retries, dry_run = args
+
+    for attempt in range(retries + 1):
+        try:
+            return shop_ids, reschedule_shops(shop_ids, schedule, days, dry_run=dry_run), None
+        except DatabaseError as exc:
+            error = exc
+            close_connections()
+            time.sleep(2 ** attempt)
+
+    return shop_ids, [], str(error)
+
+
+def close_connections():
+    # every worker opens its own connection
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Apply the default (or given) schedule to all shops"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--schedule",
+            help="json file with from_time, to_time and breaks, DEFAULT_SHOP_SCHEDULE by default",
+        )
+        parser.add_argument(
+            "--days", default="0,1,2,3,4,5,6", help="comma separated days of week"
+        )
+        parser.add_argument("--owner", type=int, help="reschedule only shops of this owner")
+        parser.add_argument(
+            "--processes", type=int, default=4, help="worker processes, 0 runs in this process"
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000, help="shops per chunk")
+        parser.add_argument("--retries", type=int, default=3)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="only show shops which would be changed"
+        )
+
+    def handle(self, *args, **options):
+        schedule = self._load_schedule(options["schedule"])
+        days = [int(day) for day in options["days"].split(",")]
+        if not all(0 <= day <= 6 for day in days):
+            raise CommandError("days of week are 0..6")
+
+        tasks = (
+            (shop_ids, schedule, days, options["retries"], options["dry_run"])
+            for shop_ids in iter_shop_chunks(options["chunk_size"], owner=options["owner"])
+        )
+
+        if options["processes"]:
+            close_connections()
+            with Pool(options["processes"], initializer=close_connections) as pool:
+                self._report(pool.imap_unordered(reschedule_chunk, tasks), options)
+        else:
+            self._report(map(reschedule_chunk, tasks), options)
+
+    def _load_schedule(self, path):
+        if path is None:
+            return settings.DEFAULT_SHOP_SCHEDULE
+
+        with open(path) as schedule_file:
+            serializer = ScheduleSerialized(data=json.load(schedule_file))
+        if not serializer.is_valid():
+            raise CommandError(serializer.errors)
+
+        return serializer.validated_data
+
+    def _report(self, results, options):
+        shops = changed_shops = deleted = created = failed = 0
+        started = time.time()
+
+        for shop_ids, changed, error in results:
+            shops += len(shop_ids)
+            if error is not None:
+                failed += len(shop_ids)
+                self.stderr.write(
+                    "shops {}-{} failed: {}".format(shop_ids[0], shop_ids[-1], error)
+                )
+
+            for shop_id, shop_deleted, shop_created in changed:
+                changed_shops += 1
+                deleted += shop_deleted
+                created += shop_created
+                if options["verbosity"] > 1:
+                    self.stdout.write(
+                        "shop {}: -{} +{} rows".format(shop_id, shop_deleted, shop_created)
+                    )
+
+            self.stdout.write(
+                "{} shops processed, {} changed ({:.0f} shops/s)".format(
+                    shops, changed_shops, shops / max(time.time() - started, 1e-3)
+                )
+            )
+
+        self.stdout.write(
+            "{}{} shops changed, {} rows deleted, {} rows created, {} shops failed".format(
+                "[dry run] " if options["dry_run"] else "",
+                changed_shops,
+                deleted,
+                created,
+                failed,
+            )
+        )
@@ -0,0 +1,51 @@
+import threading
+from django.core.management.base import BaseCommand
+from django.db import connection
+from timeline import jobs
+
+
+class Command(BaseCommand):
+    help = "Run background jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=1, help="number of worker threads"
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0, help="seconds between queue checks"
+        )
+        parser.add_argument(
+            "--burst", action="store_true", help="exit when the queue is empty"
+        )
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+
+        if options["concurrency"] == 1:
+            try:
+                jobs.work(options["burst"], options["poll_interval"], stop)
+            except KeyboardInterrupt:
+                pass
+            return
+
+        threads = [
+            threading.Thread(target=self._work, args=(options, stop), daemon=True)
+            for _ in range(options["concurrency"])
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _work(self, options, stop):
+        try:
+            jobs.work(options["burst"], options["poll_interval"], stop)
+        finally:
+            connection.close()
@@ -0,0 +1,47 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:14
+
+from collections import defaultdict
+from django.db import migrations, models
+
+
+def to_minute_of_week(rtime):
+    day_of_week, hhmm = divmod(int(rtime), 10000)
+    hours, minutes = divmod(hhmm, 100)
+    return day_of_week * 1440 + hours * 60 + minutes
+
+
+def fill_occupancy(apps, schema_editor):
+    Entry = apps.get_model('timeline', 'Entry')
+    OccupancyDelta = apps.get_model('timeline', 'OccupancyDelta')
+
+    deltas = defaultdict(int)
+    for from_time, to_time in Entry.objects.values_list('from_time', 'to_time').iterator():
+        start, end = to_minute_of_week(from_time), to_minute_of_week(to_time)
+        if end < start:
+            continue
+        deltas[start] += 1
+        deltas[end + 1] -= 1
+
+    OccupancyDelta.objects.bulk_create(
+        OccupancyDelta(minute=minute, delta=delta)
+        for minute, delta in sorted(deltas.items())
+        if delta
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0004_auto_20181228_1857'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyDelta',
+            fields=[
+                ('minute', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('delta', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0005_occupancydelta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='schedule_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:40
+
+from itertools import groupby
+from django.db import migrations
+from django.db.models import Max
+
+MINUTES_PER_DAY = 1440
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def to_minute_of_week(rtime):
+    day_of_week, hhmm = divmod(int(rtime), 10000)
+    hours, minutes = divmod(hhmm, 100)
+    return day_of_week * MINUTES_PER_DAY + hours * 60 + minutes
+
+
+def to_dhhmm(minute):
+    day_of_week, minute = divmod(minute, MINUTES_PER_DAY)
+    hours, minutes = divmod(minute, 60)
+    return day_of_week * 10000 + hours * 100 + minutes
+
+
+def merge_rows(rows):
+    """
+    Join rows split at midnight (and at the end of the week) back into one row
+    """
+    merged = []
+    for from_time, to_time in sorted(rows):
+        if merged and merged[-1][1] + 1 == from_time:
+            merged[-1][1] = to_time
+        else:
+            merged.append([from_time, to_time])
+
+    if len(merged) > 1 and merged[0][0] == 0 and merged[-1][1] == MINUTES_PER_WEEK - 1:
+        merged[-1][1] = merged.pop(0)[1]
+
+    return merged
+
+
+def forwards(apps, schema_editor):
+    Entry = apps.get_model('timeline', 'Entry')
+    # rows created below must not be converted twice
+    max_id = Entry.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+    entries = Entry.objects.filter(id__lte=max_id).order_by('shop_id', 'day_of_week').values_list(
+        'shop_id', 'day_of_week', 'from_time', 'to_time'
+    )
+    for (shop_id, day_of_week), rows in groupby(entries.iterator(), key=lambda row: row[:2]):
+        rows = [(to_minute_of_week(row[2]), to_minute_of_week(row[3])) for row in rows]
+
+        Entry.objects.filter(shop_id=shop_id, day_of_week=day_of_week, id__lte=max_id).delete()
+        Entry.objects.bulk_create(
+            Entry(shop_id=shop_id, day_of_week=day_of_week, from_time=from_time, to_time=to_time)
+            for from_time, to_time in merge_rows(rows)
+        )
+
+
+def backwards(apps, schema_editor):
+    Entry = apps.get_model('timeline', 'Entry')
+    max_id = Entry.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+    for entry in Entry.objects.filter(id__lte=max_id).iterator():
+        from_time = entry.from_time
+        to_time = entry.to_time
+        if to_time < from_time:
+            to_time += MINUTES_PER_WEEK
+
+        # DHHMM rows can't cross midnight
+        rows = []
+        while from_time // MINUTES_PER_DAY != to_time // MINUTES_PER_DAY:
+            end_of_the_day = (from_time // MINUTES_PER_DAY + 1) * MINUTES_PER_DAY - 1
+            rows.append((from_time, end_of_the_day))
+            from_time = end_of_the_day + 1
+        rows.append((from_time, to_time))
+
+        entry.delete()
+        Entry.objects.bulk_create(
+            Entry(
+                shop_id=entry.shop_id,
+                day_of_week=entry.day_of_week,
+                from_time=to_dhhmm(from_time % MINUTES_PER_WEEK),
+                to_time=to_dhhmm(to_time % MINUTES_PER_WEEK),
+            )
+            for from_time, to_time in rows
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0006_shop_schedule_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
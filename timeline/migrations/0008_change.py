@@ -0,0 +1,23 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0007_entry_minute_of_week'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shop_id', models.PositiveIntegerField()),
+                ('kind', models.CharField(choices=[('shop', 'Shop'), ('schedule', 'Schedule'), ('daysoff', 'Days off'), ('delete', 'Delete')], max_length=16)),
+                ('day_of_week', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
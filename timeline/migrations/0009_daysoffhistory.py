@@ -0,0 +1,38 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0008_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DaysoffHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_date', models.DateField()),
+                ('to_date', models.DateField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('shop', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='timeline_daysoff_history', to='timeline.Shop')),
+            ],
+            options={
+                'index_together': {('shop', 'from_date')},
+            },
+        ),
+        # days off check of a shop reads only the matching partial index
+        migrations.RunSQL(
+            'CREATE INDEX timeline_daysoff_open_ended ON timeline_daysoff (shop_id, from_date) '
+            'WHERE to_date IS NULL',
+            'DROP INDEX timeline_daysoff_open_ended',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX timeline_daysoff_bounded ON timeline_daysoff (shop_id, to_date, from_date) '
+            'WHERE to_date IS NOT NULL',
+            'DROP INDEX timeline_daysoff_bounded',
+        ),
+    ]
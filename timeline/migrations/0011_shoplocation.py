@@ -0,0 +1,51 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:30
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_locations(apps, schema_editor):
+    """
+    Shops created before sharding stay in the default database
+    """
+    Shop = apps.get_model('timeline', 'Shop')
+    ShopLocation = apps.get_model('timeline', 'ShopLocation')
+    db_alias = schema_editor.connection.alias
+
+    ShopLocation.objects.using(db_alias).bulk_create(
+        ShopLocation(pk=pk, shard='default')
+        for pk in Shop.objects.using(db_alias).values_list('pk', flat=True).iterator()
+    )
+
+    # new ids are allocated after the existing shops
+    sql = schema_editor.connection.ops.sequence_reset_sql(no_style(), [ShopLocation])
+    with schema_editor.connection.cursor() as cursor:
+        for statement in sql:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopLocation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='shop',
+            name='owner',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(
+            fill_locations, migrations.RunPython.noop, hints={'model_name': 'shoplocation'}
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0011_shoplocation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='change',
+            name='kind',
+            field=models.CharField(choices=[('shop', 'Shop'), ('schedule', 'Schedule'), ('daysoff', 'Days off'), ('special', 'Special hours'), ('delete', 'Delete')], max_length=16),
+        ),
+        migrations.CreateModel(
+            name='SpecialHours',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('from_time', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('to_time', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_special_hours', to='timeline.Shop')),
+            ],
+            options={
+                'index_together': {('shop', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0012_specialhours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0013_shop_location'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='entry',
+            index_together={('shop', 'from_time'), ('from_time', 'to_time')},
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 2.1.4 on 2026-10-19 13:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0014_entry_shop_from_time_index'),
+    ]
+
+    operations = [
+        # existing days off keep null, their creation time is unknown
+        migrations.AddField(
+            model_name='daysoff',
+            name='created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='daysoff',
+            name='created_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        # sqlite rebuilds the table on altering and loses the partial indexes of 0009
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS timeline_daysoff_open_ended ON timeline_daysoff (shop_id, from_date) '
+            'WHERE to_date IS NULL',
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS timeline_daysoff_bounded ON timeline_daysoff (shop_id, to_date, from_date) '
+            'WHERE to_date IS NOT NULL',
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddField(
+            model_name='daysoffhistory',
+            name='created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='daysoffhistory',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='schedule_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='daysoffhistory',
+            name='to_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScheduleVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day_of_week', models.PositiveSmallIntegerField()),
+                ('entries', models.TextField(blank=True, default='')),
+                ('valid_from', models.DateTimeField(blank=True, null=True)),
+                ('valid_to', models.DateTimeField()),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_schedule_versions', to='timeline.Shop')),
+            ],
+            options={
+                'index_together': {('shop', 'valid_to')},
+            },
+        ),
+    ]
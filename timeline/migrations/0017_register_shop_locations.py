@@ -0,0 +1,41 @@
+# Generated by Django 2.1.4 on 2026-10-19 15:40
+
+from django.core.management.color import no_style
+from django.db import migrations
+
+
+def register_locations(apps, schema_editor):
+    """
+    Shops created without sharding after 0011 got ids from the shop table
+    """
+    Shop = apps.get_model('timeline', 'Shop')
+    ShopLocation = apps.get_model('timeline', 'ShopLocation')
+    db_alias = schema_editor.connection.alias
+
+    registered = set(ShopLocation.objects.using(db_alias).values_list('pk', flat=True))
+    ShopLocation.objects.using(db_alias).bulk_create(
+        (
+            ShopLocation(pk=pk, shard='default')
+            for pk in Shop.objects.using(db_alias).values_list('pk', flat=True).iterator()
+            if pk not in registered
+        ),
+        batch_size=1000,
+    )
+
+    sql = schema_editor.connection.ops.sequence_reset_sql(no_style(), [ShopLocation])
+    with schema_editor.connection.cursor() as cursor:
+        for statement in sql:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0016_job_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            register_locations, migrations.RunPython.noop, hints={'model_name': 'shoplocation'}
+        ),
+    ]
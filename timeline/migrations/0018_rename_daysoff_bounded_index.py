@@ -0,0 +1,26 @@
+# Generated by Django 2.1.4 on 2026-10-19 16:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timeline', '0017_register_shop_locations'),
+    ]
+
+    operations = [
+        # a partial index can't be limited to current rows, its condition can't use now();
+        # it keeps expired rows till archive_daysoff moves them, the check scans
+        # from today's to_date on, so it skips them anyway
+        migrations.RunSQL(
+            'DROP INDEX IF EXISTS timeline_daysoff_bounded',
+            'CREATE INDEX IF NOT EXISTS timeline_daysoff_bounded ON timeline_daysoff (shop_id, to_date, from_date) '
+            'WHERE to_date IS NOT NULL',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS timeline_daysoff_by_to_date ON timeline_daysoff (shop_id, to_date, from_date) '
+            'WHERE to_date IS NOT NULL',
+            'DROP INDEX IF EXISTS timeline_daysoff_by_to_date',
+        ),
+    ]
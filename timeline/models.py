@@ -1,30 +1,382 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import BooleanField, Exists, F, Max, OuterRef, Q, Value
 from timeline.schedule import get_default_schedule, DayScheduler
+from timeline.utils import (
+    MINUTES_PER_DAY,
+    MINUTES_PER_WEEK,
+    coalesce,
+    covers,
+    decode_rows,
+    encode_rows,
+    format_time,
+    merge_intervals,
+    split_wrap,
+    subtract,
+)
+from timeline import events, occupancy, sharding
+from collections import defaultdict
+from itertools import chain
 import datetime
+import heapq
 
+# an entry lasts at most from the start of its day till the end of the next day
+MAX_ENTRY_MINUTES = 2 * MINUTES_PER_DAY
 
-class Shop(models.Model):
 
-    title = models.TextField()
-    owner = models.ForeignKey(
-        settings.AUTH_USER_MODEL, blank=False, null=False, on_delete=models.CASCADE
+STATUS_FIELDS = (
+    "has_special_hours",
+    "by_special_hours",
+    "by_working_time",
+    "is_dayoff",
+    "is_archived_dayoff",
+)
+
+
+def resolve_status(
+    has_special_hours, by_special_hours, by_working_time, is_dayoff, is_archived_dayoff=False
+):
+    """
+    Special hours replace days off and the weekly schedule of their date
+    """
+    if has_special_hours:
+        return by_special_hours
+    return by_working_time and not is_dayoff and not is_archived_dayoff
+
+
+def start_of_day(dt, date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time()), dt.tzinfo)
+
+
+def expand_weekly(weekly, start, end):
+    """
+    Repeat merged weekly [from, to) minutes as datetimes between start and end
+    """
+    week_start = datetime.datetime.combine(
+        start.date() - datetime.timedelta(days=start.weekday()), datetime.time()
+    )
+    week_start = timezone.make_aware(week_start, start.tzinfo)
+
+    def periods():
+        week = week_start
+        while week < end:
+            for from_minute, to_minute in weekly:
+                yield (
+                    week + datetime.timedelta(minutes=from_minute),
+                    week + datetime.timedelta(minutes=to_minute),
+                )
+            week += datetime.timedelta(weeks=1)
+
+    for from_dt, to_dt in coalesce(periods()):
+        if to_dt <= start:
+            continue
+        if from_dt >= end:
+            break
+        yield max(from_dt, start), min(to_dt, end)
+
+
+def open_between(weekly, daysoff, start, end, special=()):
+    """
+    Open periods between start and end, daysoff are (from_date, to_date) sorted by
+    from_date, special are (date, from_time, to_time) sorted by date and from_time
+    """
+    closed = coalesce(
+        (
+            start_of_day(start, from_date),
+            end
+            if to_date is None
+            else start_of_day(start, to_date + datetime.timedelta(days=1)),
+        )
+        for from_date, to_date in daysoff
+    )
+    regular = subtract(expand_weekly(weekly, start, end), closed)
+
+    special = list(special)
+    if not special:
+        return regular
+
+    # special hours replace the whole date
+    special_days = coalesce(
+        (start_of_day(start, date), start_of_day(start, date + datetime.timedelta(days=1)))
+        for date in sorted({date for date, _, _ in special})
+    )
+    special_periods = (
+        (
+            max(start_of_day(start, date) + datetime.timedelta(minutes=from_time), start),
+            min(start_of_day(start, date) + datetime.timedelta(minutes=to_time + 1), end),
+        )
+        for date, from_time, to_time in special
+        if from_time is not None
+    )
+    return coalesce(
+        heapq.merge(
+            subtract(regular, special_days),
+            (period for period in special_periods if period[0] < period[1]),
+        )
     )
 
-    def is_working(self):
+
+class ShopManager(models.Manager):
+    def schedule_changed(self, shop_ids, kind="schedule", day_of_week=None):
         """
-        Combine 2 methods
+        Bump schedule version of shops, entries or daysoff were changed
         """
+        shop_ids = list(shop_ids)
+        Change.objects.record(shop_ids, kind, day_of_week)
+        transaction.on_commit(lambda: events.schedule_changed(shop_ids))
 
-        if self.is_dayoff():
-            return False
+        now = timezone.now()
+        groups = {self._db: shop_ids} if self._db else sharding.group_by_shard(shop_ids)
+        return sum(
+            self.get_queryset()
+            .using(alias)
+            .filter(pk__in=ids)
+            .update(schedule_version=F("schedule_version") + 1, schedule_changed_at=now)
+            for alias, ids in groups.items()
+        )
 
-        if not self.by_working_time():
-            return False
+    def for_owner(self, owner_id):
+        """
+        Shops of the owner, read from the owner shard
+        """
+        if owner_id is None:
+            return self.none()
+        return (
+            self.get_queryset()
+            .using(sharding.shard_for_owner(owner_id))
+            .filter(owner_id=owner_id)
+        )
+
+    def for_shop(self, shop_id):
+        """
+        Queryset of the shard the shop is stored in
+        """
+        return self.get_queryset().using(sharding.shard_for_shop(shop_id))
+
+    def existing_ids(self, shop_ids):
+        def existing(alias, ids):
+            return {
+                pk: True
+                for pk in self.get_queryset()
+                .using(alias)
+                .filter(pk__in=ids)
+                .values_list("pk", flat=True)
+            }
+
+        return list(sharding.fan_out(existing, sharding.group_by_shard(shop_ids)))
+
+    def with_status(self, dt=None):
+        """
+        Annotate parts of is_working at dt, all of them are found by one query.
+        The current weekly schedule is used, shops changed after dt need the history
+        """
+        if dt is None:
+            dt = timezone.now()
+
+        working_time = format_time(dt.weekday(), dt)
+        minute = dt.hour * 60 + dt.minute
+        special = SpecialHours.objects.filter(shop=OuterRef("pk"), date=dt.date())
+        entries = Entry.objects.find_working_time(working_time).filter(shop=OuterRef("pk"))
+        daysoff = Daysoff.objects.is_closed(dt).filter(shop=OuterRef("pk"))
+        is_archived_dayoff = Value(False, output_field=BooleanField())
+        if dt < timezone.now():
+            # days off of past moments may be archived already, deleted ones are
+            # older than the last schedule change and checked by Shop.is_working
+            archived = DaysoffHistory.objects.is_closed(dt).filter(
+                shop=OuterRef("pk"), deleted_at__isnull=True
+            )
+            is_archived_dayoff = Exists(archived)
+
+        return self.get_queryset().annotate(
+            has_special_hours=Exists(special),
+            by_special_hours=Exists(special.filter(from_time__lte=minute, to_time__gte=minute)),
+            by_working_time=Exists(entries),
+            is_dayoff=Exists(daysoff),
+            is_archived_dayoff=is_archived_dayoff,
+        )
+
+    def bulk_is_working(self, shop_ids, dt=None):
+        """
+        is_working of many shops, one query per shard, shards are queried in parallel.
+        Shops changed after dt are checked one by one against the history
+        """
+
+        def status(alias, ids):
+            rows = (
+                self.with_status(dt)
+                .using(alias)
+                .filter(pk__in=ids)
+                .values_list("pk", "schedule_changed_at", *STATUS_FIELDS)
+            )
+            result = {}
+            changed = []
+            for pk, changed_at, *row in rows:
+                if dt is not None and changed_at is not None and dt < changed_at:
+                    changed.append(pk)
+                else:
+                    result[pk] = resolve_status(*row)
+            if changed:
+                for shop in self.get_queryset().using(alias).filter(pk__in=changed):
+                    result[shop.pk] = shop.is_working(dt)
+            return result
+
+        return sharding.fan_out(status, sharding.group_by_shard(shop_ids))
+
+    def open_in_window(self, start, end, entire=False):
+        """
+        Ids of shops open at some moment of the start..end window or, with entire,
+        for the whole window. Windows longer than a week are cut to a week.
+
+        Shops are selected by entry and days off subqueries, then only shops
+        partly closed by days off (or, for entire, without one entry covering
+        the window) are checked with their entries inside the window.
+        """
+        start = start.replace(second=0, microsecond=0)
+        end = min(end, start + datetime.timedelta(weeks=1))
+        last = end - datetime.timedelta(minutes=1)
+        if last < start:
+            return []
+
+        from_time = format_time(start.weekday(), start)
+        to_time = format_time(last.weekday(), last)
+        first_date, last_date = start.date(), last.date()
+
+        def search(alias, _):
+            # shops are found through the entries and days off indexes
+            entries = Entry.objects.using(alias)
+            daysoff = Daysoff.objects.using(alias)
+            shops = self.get_queryset().using(alias)
+
+            if entire:
+                candidates = (
+                    shops.filter(pk__in=entries.find_working_time(from_time).values("shop_id"))
+                    .filter(pk__in=entries.find_working_time(to_time).values("shop_id"))
+                    .exclude(
+                        pk__in=daysoff.overlapping(first_date, last_date).values("shop_id")
+                    )
+                )
+                # shops with one entry for the whole window need no check
+                covered = entries.covering(from_time, to_time).values("shop_id")
+                found = candidates.filter(pk__in=covered)
+                check = candidates.exclude(pk__in=covered)
+            else:
+                candidates = shops.filter(
+                    pk__in=entries.overlapping(from_time, to_time).values("shop_id")
+                ).exclude(pk__in=daysoff.covering(first_date, last_date).values("shop_id"))
+                # shops closed for a part of the window are checked
+                partly = daysoff.overlapping(first_date, last_date).values("shop_id")
+                found = candidates.exclude(pk__in=partly)
+                check = candidates.filter(pk__in=partly)
+
+            # special hours replace everything else on their dates
+            special = (
+                SpecialHours.objects.using(alias)
+                .filter(date__range=(first_date, last_date))
+                .values("shop_id")
+            )
+            result = dict.fromkeys(
+                found.exclude(pk__in=special).values_list("pk", flat=True), True
+            )
+            check = set(check.exclude(pk__in=special).values_list("pk", flat=True))
+            check.update(shops.filter(pk__in=special).values_list("pk", flat=True))
+            for pk in self._check_window(alias, sorted(check), start, end, entire):
+                result[pk] = True
+            return result
+
+        groups = {alias: None for alias in sharding.shards()}
+        return sorted(sharding.fan_out(search, groups))
+
+    def _check_window(self, alias, shop_ids, start, end, entire, chunk_size=500):
+        """
+        Yield shops which are open (for the whole window with entire) by their
+        entries inside the window, days off and special hours
+        """
+        last = end - datetime.timedelta(minutes=1)
+        from_time = format_time(start.weekday(), start)
+        to_time = format_time(last.weekday(), last)
+
+        for chunk_start in range(0, len(shop_ids), chunk_size):
+            chunk = shop_ids[chunk_start:chunk_start + chunk_size]
+            rows = defaultdict(list)
+            for shop_id, row_from, row_to in (
+                Entry.objects.using(alias)
+                .overlapping(from_time, to_time)
+                .filter(shop_id__in=chunk)
+                .values_list("shop_id", "from_time", "to_time")
+            ):
+                rows[shop_id].append((row_from, row_to))
+
+            closed = defaultdict(list)
+            for shop_id, from_date, to_date in (
+                Daysoff.objects.using(alias)
+                .overlapping(start.date(), last.date())
+                .filter(shop_id__in=chunk)
+                .order_by("from_date")
+                .values_list("shop_id", "from_date", "to_date")
+            ):
+                closed[shop_id].append((from_date, to_date))
+
+            special = defaultdict(list)
+            for shop_id, *row in (
+                SpecialHours.objects.using(alias)
+                .filter(date__range=(start.date(), last.date()), shop_id__in=chunk)
+                .order_by("date", "from_time")
+                .values_list("shop_id", "date", "from_time", "to_time")
+            ):
+                special[shop_id].append(row)
+
+            for shop_id in chunk:
+                periods = open_between(
+                    merge_intervals(rows[shop_id]),
+                    closed[shop_id],
+                    start,
+                    end,
+                    special[shop_id],
+                )
+                if entire:
+                    if list(periods) == [(start, end)]:
+                        yield shop_id
+                elif next(periods, None) is not None:
+                    yield shop_id
 
-        return True
+
+class Shop(models.Model):
+    objects = ShopManager()
+
+    title = models.TextField()
+    # users stay in the default database when shops are sharded
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=False,
+        null=False,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    # incremented on every entries or daysoff change
+    schedule_version = models.PositiveIntegerField(default=0)
+    # time of the last change, earlier moments are answered from the history
+    schedule_changed_at = models.DateTimeField(blank=True, null=True)
+    # WGS 84 degrees, kept in timeline.geo index
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+
+    def is_working(self, dt=None):
+        """
+        Special hours of the date, days off and the weekly schedule in one query,
+        moments before the last schedule change are checked against the history
+        """
+        if dt is not None and self.schedule_changed_at and dt < self.schedule_changed_at:
+            return self.__was_working(dt)
+
+        row = (
+            Shop.objects.db_manager(self._state.db)
+            .with_status(dt)
+            .filter(pk=self.pk)
+            .values_list(*STATUS_FIELDS)
+            .first()
+        )
+        return row is not None and resolve_status(*row)
 
     def is_dayoff(self):
         """
@@ -41,57 +393,320 @@ class Shop(models.Model):
         if dt is None:
             dt = timezone.now()
 
-        dt_time = "{}{:02d}{:02d}".format(dt.weekday(), dt.hour, dt.minute)
+        dt_time = format_time(dt.weekday(), dt)
 
         return self.timeline_entries.find_working_time(dt_time).exists()
 
+    def next_transition(self, dt=None):
+        """
+        Find the moment when is_working result changes,
+        None if it doesn't change in the next two weeks
+        """
+
+        if dt is None:
+            dt = timezone.now()
+
+        dt = dt.replace(second=0, microsecond=0)
+        horizon = dt + datetime.timedelta(weeks=2)
+
+        for start, end in self.open_intervals(dt, horizon):
+            if start > dt:
+                return start
+            if end < horizon:
+                return end
+            break
+
+        return None
+
+    def open_intervals(self, start, end):
+        """
+        Lazily yield merged (from, to) open periods between start and end datetimes
+        """
+
+        start = start.replace(second=0, microsecond=0)
+        changed_at = self.schedule_changed_at
+        if changed_at is not None and start < changed_at and start < end:
+            yield from coalesce(self.__open_intervals_history(start, end, changed_at))
+            return
+
+        yield from self.__open_intervals(start, end)
+
+    def weekly_entries_at(self, dt):
+        """
+        (from_time, to_time) entries of the weekly schedule in effect at dt
+        """
+        versions = dict(
+            self.timeline_schedule_versions.valid_at(dt).values_list("day_of_week", "entries")
+        )
+        rows = list(
+            self.timeline_entries.exclude(day_of_week__in=list(versions)).values_list(
+                "from_time", "to_time"
+            )
+        )
+        for entries in versions.values():
+            rows += decode_rows(entries)
+        return rows
+
+    def daysoff_at(self, dt, from_date, to_date):
+        """
+        (from_date, to_date) of days off existing at dt on some day of the
+        from_date..to_date range, sorted by from_date
+        """
+        existed = Q(created_at__isnull=True) | Q(created_at__lte=dt)
+        current = self.timeline_daysoff.overlapping(from_date, to_date).filter(existed)
+        archived = (
+            self.timeline_daysoff_history.overlapping(from_date, to_date)
+            .filter(existed)
+            .filter(Q(deleted_at__isnull=True) | Q(deleted_at__gt=dt))
+        )
+        return sorted(
+            chain(
+                current.values_list("from_date", "to_date"),
+                archived.values_list("from_date", "to_date"),
+            ),
+            key=lambda row: row[0],
+        )
+
+    def schedule_changed(self, kind="schedule", day_of_week=None):
+        Shop.objects.db_manager(self._state.db).schedule_changed(
+            [self.pk], kind, day_of_week
+        )
+        self.schedule_version += 1
+        self.schedule_changed_at = timezone.now()
+
     def save(self, *args, **kwargs):
         is_new = True
         if self.pk:
             is_new = False
 
-        super().save(*args, **kwargs)
+        if sharding.is_enabled():
+            # managers pass the default database, shops live in the owner shard
+            kwargs["using"] = router.db_for_write(Shop, instance=self)
+        using = kwargs.get("using") or router.db_for_write(Shop, instance=self)
+
+        with sharding.atomic(using):
+            if is_new:
+                # shop ids must be unique across shards, they are allocated
+                # without sharding too, so it can be enabled later
+                self.pk = ShopLocation.objects.create(shard=using).pk
+                kwargs.setdefault("force_insert", True)
+
+            super().save(*args, **kwargs)
 
-        if is_new:
-            self.__add_schedule()
+            Change.objects.record([self.pk], Change.SHOP)
+
+            if is_new:
+                self.__add_schedule()
+
+    def delete(self, *args, **kwargs):
+        with sharding.atomic(self._state.db):
+            removed = list(self.timeline_entries.values_list("from_time", "to_time"))
+            Change.objects.record([self.pk], Change.DELETE)
+            deleted = super().delete(*args, **kwargs)
+            occupancy.apply(removed=removed)
+            return deleted
 
     def update_schedule(self, day_of_week, is_working_day, data=None):
-        self.timeline_entries.filter(day_of_week=day_of_week).delete()
+        with sharding.atomic(self._state.db):
+            entries = self.timeline_entries.filter(day_of_week=day_of_week)
+            removed = list(entries.values_list("from_time", "to_time"))
+            ScheduleVersion.objects.db_manager(self._state.db).record(
+                {(self.pk, day_of_week): removed}
+            )
+            entries.delete()
+            self.schedule_changed(Change.SCHEDULE, day_of_week)
+
+            added = []
+            if is_working_day:
+                added = DayScheduler(day_of_week).create(data) or []
+                self.__create_entries({day_of_week: added})
+            occupancy.apply(added, removed)
+
+        return not is_working_day or bool(added)
+
+    def set_special_hours(self, date, is_working_day, data=None):
+        """
+        Replace the weekly schedule and days off of one date
+        """
+        with sharding.atomic(self._state.db):
+            self.timeline_special_hours.filter(date=date).delete()
+
+            rows = []
+            if is_working_day:
+                # minutes of monday are the minutes of the day
+                rows = DayScheduler(0).create(data)
+
+            special_hours = [
+                SpecialHours(shop=self, date=date, from_time=from_time, to_time=to_time)
+                for from_time, to_time in rows
+            ]
+            if not special_hours:
+                # a row without time closes the shop for the date
+                special_hours = [SpecialHours(shop=self, date=date)]
+            SpecialHours.objects.using(self._state.db).bulk_create(special_hours)
+            self.schedule_changed(Change.SPECIAL, date.weekday())
+
+        return True
+
+    def delete_special_hours(self, date):
+        with sharding.atomic(self._state.db):
+            deleted, _ = self.timeline_special_hours.filter(date=date).delete()
+            if deleted:
+                self.schedule_changed(Change.SPECIAL, date.weekday())
+
+        return bool(deleted)
+
+    def __was_working(self, dt):
+        special = list(
+            self.timeline_special_hours.filter(date=dt.date()).values_list(
+                "from_time", "to_time"
+            )
+        )
+        if special:
+            minute = dt.hour * 60 + dt.minute
+            return any(
+                from_time is not None and from_time <= minute <= to_time
+                for from_time, to_time in special
+            )
+
+        if self.daysoff_at(dt, dt.date(), dt.date()):
+            return False
+
+        minute = format_time(dt.weekday(), dt)
+        return any(
+            covers(from_time, to_time, minute)
+            for from_time, to_time in self.weekly_entries_at(dt)
+        )
+
+    def __open_intervals(self, start, end, at=None):
+        """
+        Open periods by the current schedule or, with at, by the schedule in effect at that moment
+        """
+        if at is None:
+            weekly = self.timeline_entries.values_list("from_time", "to_time")
+        else:
+            weekly = self.weekly_entries_at(at)
+        weekly = merge_intervals(weekly)
+        if start >= end:
+            return
+
+        if at is None and start < timezone.now():
+            # archived days off of past dates are still in effect
+            daysoff = self.daysoff_at(timezone.now(), start.date(), end.date())
+        elif at is None:
+            daysoff = (
+                self.timeline_daysoff.overlapping(start.date(), end.date())
+                .order_by("from_date")
+                .values_list("from_date", "to_date")
+                .iterator()
+            )
+        else:
+            daysoff = self.daysoff_at(at, start.date(), end.date())
+        special = (
+            self.timeline_special_hours.filter(date__range=(start.date(), end.date()))
+            .order_by("date", "from_time")
+            .values_list("date", "from_time", "to_time")
+        )
 
-        if not is_working_day:
-            return True
+        yield from open_between(weekly, daysoff, start, end, special)
 
-        scheduler = DayScheduler(day_of_week)
-        entry = scheduler.create(data)
-        if entry:
-            self.__create_entries(day_of_week, entry)
-            return True
+    def __open_intervals_history(self, start, end, changed_at):
+        """
+        Open periods till the last change split at every schedule or days off change,
+        each part is evaluated with the version in effect at its start
+        """
+        boundary = min(end, timezone.localtime(changed_at, start.tzinfo))
+
+        def changes(queryset, field):
+            return queryset.filter(
+                **{field + "__gt": start, field + "__lt": boundary}
+            ).values_list(field, flat=True)
+
+        moments = set(
+            chain(
+                changes(self.timeline_schedule_versions, "valid_to"),
+                changes(self.timeline_daysoff, "created_at"),
+                changes(self.timeline_daysoff_history, "created_at"),
+                changes(self.timeline_daysoff_history, "deleted_at"),
+            )
+        )
+        moments = [start] + sorted(timezone.localtime(moment, start.tzinfo) for moment in moments)
+        moments.append(boundary)
 
-        return False
+        for part_start, part_end in zip(moments, moments[1:]):
+            yield from self.__open_intervals(part_start, part_end, at=part_start)
+        if boundary < end:
+            yield from self.__open_intervals(boundary, end)
 
     def __add_schedule(self):
         schedule_list = get_default_schedule()
 
-        for week, rows in schedule_list.items():
-            self.__create_entries(week, rows)
+        self.__create_entries(schedule_list)
+        occupancy.apply(chain.from_iterable(schedule_list.values()))
 
-    def __create_entries(self, day_of_week, rows):
-        for row in rows:
-            from_time, to_time = row
-            Entry.objects.create(
-                shop=self, day_of_week=day_of_week, from_time=from_time, to_time=to_time
-            )
+    def __create_entries(self, days):
+        """
+        Insert (from_time, to_time) rows of {day_of_week: rows} by one query
+        """
+        Entry.objects.using(self._state.db).bulk_create(
+            Entry(shop=self, day_of_week=day_of_week, from_time=from_time, to_time=to_time)
+            for day_of_week, rows in days.items()
+            for from_time, to_time in rows
+        )
 
 
-class EntryManager(models.Manager):
+class EntryQuerySet(models.QuerySet):
     def find_working_time(self, working_time):
-        return (
-            self.get_queryset()
-            .filter(from_time__lte=working_time)
-            .filter(to_time__gte=working_time)
+        return self.overlapping(working_time, working_time)
+
+    def overlapping(self, from_time, to_time):
+        """
+        Entries open at some minute of the inclusive from_time..to_time window,
+        to_time less than from_time means the window wraps around the end of the week
+        """
+        condition = Q()
+        for start, end in split_wrap([(from_time, to_time)]):
+            # lower bound of from_time keeps the index range scan short
+            inside = Q(
+                from_time__gte=start - MAX_ENTRY_MINUTES,
+                from_time__lte=end,
+                to_time__gte=start,
+            ) & Q(from_time__lte=F("to_time"))
+            # only sunday entries wrap around the end of the week
+            wrapped = Q(
+                from_time__gte=MINUTES_PER_WEEK - MINUTES_PER_DAY,
+                from_time__gt=F("to_time"),
+            ) & (Q(from_time__lte=end) | Q(to_time__gte=start))
+            condition |= inside | wrapped
+
+        return self.filter(condition)
+
+    def covering(self, from_time, to_time):
+        """
+        Entries open for the whole inclusive from_time..to_time window
+        """
+        wrapped = Q(
+            from_time__gte=MINUTES_PER_WEEK - MINUTES_PER_DAY, from_time__gt=F("to_time")
+        )
+        if to_time < from_time:
+            return self.filter(
+                wrapped, from_time__lte=from_time, to_time__gte=to_time
+            )
+
+        inside = Q(
+            from_time__gte=to_time - MAX_ENTRY_MINUTES,
+            from_time__lte=from_time,
+            to_time__gte=to_time,
+        ) & Q(from_time__lte=F("to_time"))
+        return self.filter(
+            inside | (wrapped & (Q(from_time__lte=from_time) | Q(to_time__gte=to_time)))
         )
 
 
+class EntryManager(models.Manager.from_queryset(EntryQuerySet)):
+    pass
+
+
 class Entry(models.Model):
     objects = EntryManager()
     shop = models.ForeignKey(
@@ -100,30 +715,51 @@ class Entry(models.Model):
     # from 0 to 6
     day_of_week = models.PositiveSmallIntegerField()
     """
-        Template is DHHMM, where
-        D - day of week
-        HH - hours
-        MM - minutes
+        Minutes since Monday 00:00, both ends are included.
+        to_time less than from_time means the interval
+        wraps around the end of the week
     """
     from_time = models.PositiveIntegerField()
     to_time = models.PositiveIntegerField()
 
     class Meta:
-        index_together = ["from_time", "to_time"]
+        # (shop, from_time) lets the export stream entries without sorting
+        index_together = [["from_time", "to_time"], ["shop", "from_time"]]
 
 
-class DaysoffManager(models.Manager):
-    def is_closed(self):
+class DaysoffQuerySet(models.QuerySet):
+    def is_closed(self, dt=None):
         """
         Filter shops that are closed
         """
-        return (
-            self.get_queryset()
-            .filter(from_date__lte=timezone.now())
-            .filter(Q(to_date__isnull=True) | Q(to_date__gte=timezone.now()))
+        if dt is None:
+            dt = timezone.now()
+
+        return self.filter(from_date__lte=dt).filter(
+            Q(to_date__isnull=True) | Q(to_date__gte=dt)
+        )
+
+    def overlapping(self, from_date, to_date):
+        """
+        Days off on some day of the from_date..to_date range
+        """
+        return self.filter(from_date__lte=to_date).filter(
+            Q(to_date__isnull=True) | Q(to_date__gte=from_date)
+        )
+
+    def covering(self, from_date, to_date):
+        """
+        Days off on every day of the from_date..to_date range
+        """
+        return self.filter(from_date__lte=from_date).filter(
+            Q(to_date__isnull=True) | Q(to_date__gte=to_date)
         )
 
 
+class DaysoffManager(models.Manager.from_queryset(DaysoffQuerySet)):
+    pass
+
+
 class Daysoff(models.Model):
     objects = DaysoffManager()
     shop = models.ForeignKey(
@@ -136,6 +772,227 @@ class Daysoff(models.Model):
 
     from_date = models.DateField(default=datetime.date.today)
     to_date = models.DateField(blank=True, null=True)
+    # null for days off created before the history was kept
+    created_at = models.DateTimeField(blank=True, null=True, default=timezone.now)
 
     class Meta:
         index_together = ["from_date", "to_date"]
+
+    def save(self, *args, **kwargs):
+        if sharding.is_enabled():
+            kwargs["using"] = router.db_for_write(Daysoff, instance=self)
+        using = kwargs.get("using") or router.db_for_write(Daysoff, instance=self)
+
+        with sharding.atomic(using):
+            super().save(*args, **kwargs)
+
+            if self.shop_id:
+                Shop.objects.schedule_changed([self.shop_id], Change.DAYSOFF)
+
+    def delete(self, *args, **kwargs):
+        with sharding.atomic(self._state.db):
+            if self.shop_id:
+                # kept for point in time checks
+                DaysoffHistory.objects.using(self._state.db).create(
+                    shop_id=self.shop_id,
+                    from_date=self.from_date,
+                    to_date=self.to_date,
+                    created_at=self.created_at,
+                    deleted_at=timezone.now(),
+                )
+                Shop.objects.schedule_changed([self.shop_id], Change.DAYSOFF)
+
+            return super().delete(*args, **kwargs)
+
+
+class OccupancyDelta(models.Model):
+    """
+    Difference array of open shops per minute of week,
+    prefix sum of delta gives the number of open shops
+    """
+
+    minute = models.PositiveSmallIntegerField(primary_key=True)
+    delta = models.IntegerField(default=0)
+
+
+class DaysoffHistory(models.Model):
+    """
+    Days off which are already over, moved out of daysoff table by archive_daysoff,
+    and deleted days off
+    """
+
+    objects = DaysoffManager()
+    shop = models.ForeignKey(
+        "Shop",
+        related_name="timeline_daysoff_history",
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+    )
+
+    from_date = models.DateField()
+    to_date = models.DateField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(blank=True, null=True)
+    deleted_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        index_together = ["shop", "from_date"]
+
+
+class SpecialHours(models.Model):
+    """
+    Working hours of a shop on one date, they replace the weekly schedule and
+    days off of the date. A row without times closes the shop for the date
+    """
+
+    shop = models.ForeignKey(
+        "Shop", related_name="timeline_special_hours", on_delete=models.CASCADE
+    )
+    date = models.DateField()
+    # minutes since the start of the date, both ends are included
+    from_time = models.PositiveSmallIntegerField(blank=True, null=True)
+    to_time = models.PositiveSmallIntegerField(blank=True, null=True)
+
+    class Meta:
+        index_together = ["shop", "date"]
+
+
+class ScheduleVersionQuerySet(models.QuerySet):
+    def valid_at(self, dt):
+        return self.filter(valid_to__gt=dt).filter(
+            Q(valid_from__isnull=True) | Q(valid_from__lte=dt)
+        )
+
+
+class ScheduleVersionManager(models.Manager.from_queryset(ScheduleVersionQuerySet)):
+    def record(self, days, now=None):
+        """
+        Append replaced entries, days maps (shop_id, day_of_week) to
+        its (from_time, to_time) rows
+        """
+        if now is None:
+            now = timezone.now()
+
+        previous = dict(
+            ((shop_id, day_of_week), valid_to)
+            for shop_id, day_of_week, valid_to in self.filter(
+                shop_id__in={shop_id for shop_id, _ in days}
+            )
+            .values("shop_id", "day_of_week")
+            .annotate(valid_to=Max("valid_to"))
+            .values_list("shop_id", "day_of_week", "valid_to")
+        )
+        return self.bulk_create(
+            ScheduleVersion(
+                shop_id=shop_id,
+                day_of_week=day_of_week,
+                entries=encode_rows(sorted(rows)),
+                valid_from=previous.get((shop_id, day_of_week)),
+                valid_to=now,
+            )
+            for (shop_id, day_of_week), rows in days.items()
+        )
+
+
+class ScheduleVersion(models.Model):
+    """
+    Append-only history of the weekly schedule. A row keeps the entries one day
+    of week had from valid_from (null before the history was kept) till they were
+    replaced at valid_to, days which weren't changed aren't copied
+    """
+
+    objects = ScheduleVersionManager()
+    shop = models.ForeignKey(
+        "Shop", related_name="timeline_schedule_versions", on_delete=models.CASCADE
+    )
+    day_of_week = models.PositiveSmallIntegerField()
+    # "from-to,from-to" minutes of week, empty if the day was closed
+    entries = models.TextField(blank=True, default="")
+    valid_from = models.DateTimeField(blank=True, null=True)
+    valid_to = models.DateTimeField()
+
+    class Meta:
+        index_together = ["shop", "valid_to"]
+
+
+class ShopLocation(models.Model):
+    """
+    Allocates shop ids and keeps the shard of every shop
+    """
+
+    shard = models.CharField(max_length=64)
+
+
+class ChangeManager(models.Manager):
+    def record(self, shop_ids, kind, day_of_week=None):
+        return self.bulk_create(
+            Change(shop_id=shop_id, kind=kind, day_of_week=day_of_week)
+            for shop_id in shop_ids
+        )
+
+    def since(self, cursor):
+        return self.get_queryset().filter(pk__gt=cursor).order_by("pk")
+
+
+class Change(models.Model):
+    """
+    Outbox of shop changes, written in the same transaction as the change.
+    id is the cursor of the change feed
+    """
+
+    SHOP = "shop"
+    SCHEDULE = "schedule"
+    DAYSOFF = "daysoff"
+    SPECIAL = "special"
+    DELETE = "delete"
+    KIND_CHOICES = (
+        (SHOP, "Shop"),
+        (SCHEDULE, "Schedule"),
+        (DAYSOFF, "Days off"),
+        (SPECIAL, "Special hours"),
+        (DELETE, "Delete"),
+    )
+
+    objects = ChangeManager()
+    # not a foreign key, records of deleted shops are kept
+    shop_id = models.PositiveIntegerField()
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    day_of_week = models.PositiveSmallIntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Job(models.Model):
+    """
+    Background job, executed by run_worker command
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    kind = models.CharField(max_length=32)
+    # json encoded arguments and result of job handler
+    payload = models.TextField(default="{}")
+    result = models.TextField(blank=True, default="")
+    error = models.TextField(blank=True, default="")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, blank=True, null=True, on_delete=models.CASCADE
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # renewed by the worker, a running job without it for JOB_LEASE_SECONDS is requeued
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        index_together = ["status", "id"]
@@ -0,0 +1,120 @@
+from collections import defaultdict
+from itertools import chain
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from . import sharding
+from .utils import MINUTES_PER_WEEK, split_wrap
+
+# minutes of one upsert, two parameters each
+UPSERT_BATCH_SIZE = 400
+
+
+def interval_deltas(intervals, sign=1):
+    """
+    Difference array for a list of (from_time, to_time) entry rows,
+    as {minute: delta}. Both ends are inclusive.
+    """
+    deltas = defaultdict(int)
+
+    for start, end in split_wrap(intervals):
+        deltas[start] += sign
+        deltas[end + 1] -= sign
+
+    return deltas
+
+
+def prefix_sum(deltas):
+    """
+    Turn a difference array into the open shops count for every minute of the week
+    """
+    histogram = []
+    current = 0
+
+    for minute in range(MINUTES_PER_WEEK):
+        current += deltas.get(minute, 0)
+        histogram.append(current)
+
+    return histogram
+
+
+def build_histogram(owner=None):
+    """
+    Build the histogram in one pass over entries, optionally for one owner
+    """
+    from .models import Entry
+
+    if owner is not None:
+        entries = Entry.objects.using(sharding.shard_for_owner(owner)).filter(
+            shop__owner_id=owner
+        )
+        rows = entries.values_list("from_time", "to_time").iterator()
+        return prefix_sum(interval_deltas(rows))
+
+    deltas = defaultdict(int)
+    for alias in sharding.shards():
+        rows = Entry.objects.using(alias).values_list("from_time", "to_time")
+        for minute, delta in interval_deltas(rows.iterator()).items():
+            deltas[minute] += delta
+    return prefix_sum(deltas)
+
+
+def get_histogram(owner=None):
+    """
+    Catalog-wide histogram is read from the maintained difference array,
+    owner histograms are built on the fly
+    """
+    from .models import OccupancyDelta
+
+    if owner is not None:
+        return build_histogram(owner)
+
+    return prefix_sum(dict(OccupancyDelta.objects.values_list("minute", "delta")))
+
+
+def apply(added=(), removed=()):
+    """
+    Add and remove entry rows from the maintained histogram by one upsert
+    per UPSERT_BATCH_SIZE minutes. Minutes are sorted, so concurrent writers
+    lock the rows in the same order, and callers issue it last in their
+    transaction to keep the locks short
+    """
+    from .models import OccupancyDelta
+
+    deltas = interval_deltas(added)
+    for minute, delta in interval_deltas(removed, sign=-1).items():
+        deltas[minute] += delta
+    rows = [(minute, delta) for minute, delta in sorted(deltas.items()) if delta]
+
+    connection = connections[router.db_for_write(OccupancyDelta) or DEFAULT_DB_ALIAS]
+    table = connection.ops.quote_name(OccupancyDelta._meta.db_table)
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        batch = rows[start:start + UPSERT_BATCH_SIZE]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {table} (minute, delta) VALUES {values} "
+                "ON CONFLICT (minute) DO UPDATE "
+                "SET delta = {table}.delta + excluded.delta".format(
+                    table=table, values=", ".join(["(%s, %s)"] * len(batch))
+                ),
+                list(chain.from_iterable(batch)),
+            )
+
+
+@transaction.atomic
+def rebuild():
+    """
+    Recalculate the maintained difference array from scratch
+    """
+    from .models import Entry, OccupancyDelta
+
+    deltas = defaultdict(int)
+    for alias in sharding.shards():
+        rows = Entry.objects.using(alias).values_list("from_time", "to_time")
+        for minute, delta in interval_deltas(rows.iterator()).items():
+            deltas[minute] += delta
+
+    OccupancyDelta.objects.all().delete()
+    OccupancyDelta.objects.bulk_create(
+        OccupancyDelta(minute=minute, delta=delta)
+        for minute, delta in sorted(deltas.items())
+        if delta
+    )
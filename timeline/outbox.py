@@ -0,0 +1,69 @@
+import datetime
+from django.conf import settings
+from django.utils import timezone
+from .models import Change
+
+BATCH_SIZE = 500
+
+
+def settled_before(now=None):
+    """
+    Changes created before this moment are visible to every reader. Ids are
+    taken at insert, not at commit, so a younger change may still be followed
+    by the commit of a transaction holding a smaller id
+    """
+    if now is None:
+        now = timezone.now()
+    return now - datetime.timedelta(seconds=settings.OUTBOX_SETTLE_SECONDS)
+
+
+def read(since=0, limit=BATCH_SIZE, now=None):
+    """
+    Up to limit changes after the cursor in id order, the page ends before
+    the first change younger than OUTBOX_SETTLE_SECONDS
+    """
+    settled = settled_before(now)
+    changes = []
+    for change in Change.objects.since(since)[:limit]:
+        if change.created_at > settled:
+            break
+        changes.append(change)
+    return changes
+
+
+def last_cursor(now=None):
+    """
+    Cursor for readers loading the current state, it stays before the first
+    young change among the last BATCH_SIZE ones
+    """
+    recent = list(Change.objects.order_by("-pk").values_list("pk", "created_at")[:BATCH_SIZE])
+    settled = settled_before(now)
+    young = [pk for pk, created_at in recent if created_at > settled]
+    if young:
+        return min(young) - 1
+    return recent[0][0] if recent else 0
+
+
+def iter_changes(since=0, batch_size=BATCH_SIZE):
+    """
+    Yield settled changes after the cursor in id order, batch by batch
+    """
+    while True:
+        batch = read(since, batch_size)
+        yield from batch
+
+        if len(batch) < batch_size:
+            return
+        since = batch[-1].pk
+
+
+def consume(handler, since=0, batch_size=BATCH_SIZE):
+    """
+    Pass every change after the cursor to handler,
+    return the new cursor to continue from next time
+    """
+    for change in iter_changes(since, batch_size):
+        handler(change)
+        since = change.pk
+
+    return since
@@ -0,0 +1,231 @@
+"""
+Opt-in profiling of live requests.
+
+ProfileMiddleware profiles a PROFILE_SAMPLE_RATE share of requests and every
+request of a staff user with the "X-Profile: 1" header. Results are
+aggregated per view in this process: cProfile function stats (PROFILE_MODE
+"cprofile") or stack samples for flamegraphs (PROFILE_MODE "sample"), and
+the count and time of SQL queries.
+"""
+import cProfile
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+
+_lock = threading.Lock()
+_views = {}
+
+
+class ViewProfile:
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.stats = None
+        self.stacks = Counter()
+
+
+class QueryRecorder:
+    """
+    execute_wrapper counting queries and their time
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class StackSampler(threading.Thread):
+    """
+    Sample the stack of a thread every interval seconds
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.finished = threading.Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("{}:{}".format(code.co_filename, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+def is_staff(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+
+    try:
+        authenticated = TokenAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+def should_profile(request):
+    if request.META.get(PROFILE_HEADER) == "1" and is_staff(request):
+        return True
+
+    rate = settings.PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return request.path
+    return match.view_name
+
+
+class ProfileMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        if settings.PROFILE_MODE == "sample":
+            profiler = None
+            sampler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL)
+            sampler.start()
+        else:
+            profiler = cProfile.Profile()
+            sampler = None
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                else:
+                    sampler.stop()
+        seconds = time.perf_counter() - started
+
+        record(view_name(request), seconds, recorder, profiler, sampler)
+        return response
+
+
+def record(name, seconds, recorder, profiler=None, sampler=None):
+    with _lock:
+        profile = _views.setdefault(name, ViewProfile())
+        profile.requests += 1
+        profile.seconds += seconds
+        profile.queries += recorder.queries
+        profile.query_seconds += recorder.seconds
+        if profiler is not None:
+            if profile.stats is None:
+                profile.stats = pstats.Stats(profiler)
+            else:
+                profile.stats.add(profiler)
+        if sampler is not None:
+            profile.stacks.update(sampler.stacks)
+
+
+def function_name(func):
+    filename, line, name = func
+    return "{}:{}({})".format(filename, line, name)
+
+
+def summary(view=None, limit=30):
+    """
+    Aggregated profile of every view, functions are sorted by own time
+    """
+    result = {}
+    with _lock:
+        for name, profile in sorted(_views.items()):
+            if view is not None and name != view:
+                continue
+
+            functions = []
+            if profile.stats is not None:
+                rows = sorted(
+                    profile.stats.stats.items(), key=lambda item: item[1][2], reverse=True
+                )
+                functions = [
+                    {
+                        "function": function_name(func),
+                        "calls": calls,
+                        "tottime": round(tottime, 6),
+                        "cumtime": round(cumtime, 6),
+                    }
+                    for func, (_, calls, tottime, cumtime, _) in rows[:limit]
+                ]
+
+            result[name] = {
+                "requests": profile.requests,
+                "seconds": round(profile.seconds, 6),
+                "queries": profile.queries,
+                "query_seconds": round(profile.query_seconds, 6),
+                "functions": functions,
+            }
+    return result
+
+
+def collapsed_stacks(view=None):
+    """
+    Stack samples in the collapsed format of flamegraph.pl and speedscope,
+    cProfile stats are exported as own time of functions in microseconds
+    """
+    lines = []
+    with _lock:
+        for name, profile in sorted(_views.items()):
+            if view is not None and name != view:
+                continue
+
+            for stack, count in profile.stacks.most_common():
+                lines.append("{};{} {}".format(name, stack, count))
+
+            if profile.stats is None:
+                continue
+            for func, (_, _, tottime, _, _) in profile.stats.stats.items():
+                microseconds = int(tottime * 1000000)
+                if microseconds:
+                    lines.append(
+                        "{};{} {}".format(name, function_name(func), microseconds)
+                    )
+    return lines
+
+
+def reset():
+    with _lock:
+        _views.clear()
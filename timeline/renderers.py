@@ -0,0 +1,53 @@
+import json
+import msgpack
+import orjson
+from rest_framework import renderers
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """
+    Lets clients ask for text/event-stream, errors are sent as plain json
+    """
+
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data).encode(self.charset)
+
+
+class FastJSONRenderer(renderers.BaseRenderer):
+    """
+    Compact json of hot read endpoints by orjson
+    """
+
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, use_bin_type=True)
+
+
+def fast_renderers():
+    """
+    Renderers of hot read endpoints, json by default and MessagePack on request
+    """
+    return [FastJSONRenderer, MessagePackRenderer]
@@ -1,18 +1,39 @@
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 import calendar
 import datetime
-from .utils import format_time, next_weekday, subminutes
+from .utils import format_time, merge_slots, next_weekday, subminutes
+
+
+_default_schedule = None
 
 
 def get_default_schedule():
-    calendar_ = calendar.Calendar(firstweekday=0)
-    default_schedule = {}
+    """
+    Entry rows of DEFAULT_SHOP_SCHEDULE, compiled once per process
+    """
+    global _default_schedule
+    if _default_schedule is None:
+        calendar_ = calendar.Calendar(firstweekday=0)
+        default_schedule = {}
+
+        for weekday in calendar_.iterweekdays():
+            dayScheduler = DayScheduler(weekday)
+            default_schedule[weekday] = tuple(
+                tuple(row) for row in dayScheduler.create(settings.DEFAULT_SHOP_SCHEDULE)
+            )
 
-    for weekday in calendar_.iterweekdays():
-        dayScheduler = DayScheduler(weekday)
-        default_schedule[weekday] = dayScheduler.create(settings.DEFAULT_SHOP_SCHEDULE)
+        _default_schedule = default_schedule
 
-    return default_schedule
+    return _default_schedule
+
+
+@receiver(setting_changed)
+def reset_default_schedule(setting, **kwargs):
+    global _default_schedule
+    if setting == "DEFAULT_SHOP_SCHEDULE":
+        _default_schedule = None
 
 
 class DayScheduler:
@@ -54,7 +75,9 @@ class DayScheduler:
                 break_from = to_time
                 row = []
             finally:
-                result.append((from_time, break_from))
+                # break starting at the beginning of the slot leaves nothing to add
+                if not row or row["from_time"] != from_time:
+                    result.append((from_time, break_from))
                 if "to_time" in row:
                     from_time = row["to_time"]
 
@@ -67,18 +90,16 @@ class DayScheduler:
             from_time, to_time = entry
 
             if self.check_if_finish_time_is_next_day(from_time, to_time):
-                extra_filter += self._add_next_day(from_time, to_time)
+                extra_filter.append(self._add_next_day(from_time, to_time))
             else:
                 extra_filter.append(self._format_row(from_time, to_time))
 
-        return extra_filter
+        # overlapping breaks can give overlapping slots
+        return [list(row) for row in merge_slots(extra_filter)]
 
     def _add_next_day(self, from_time, to_time):
-        result = []
-        # if time_to more then 00:00, should separate on 2 row,
-        result.append(self._format_row(from_time, self.end_of_the_day))
-        # if a day is the last day of week, need to change
-        result.append(
-            self._format_row(self.start_of_the_day, to_time, next_weekday(self.weekday))
-        )
-        return result
+        # on the last day of week the row wraps around to monday
+        return [
+            format_time(self.weekday, from_time),
+            format_time(next_weekday(self.weekday), to_time),
+        ]
@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
-from .models import Shop, Daysoff
+from rest_framework.settings import api_settings
+from .models import Shop, Daysoff, Change, Job
+from . import snapshot
 from itertools import groupby
-from timeline.utils import timetostring
+import datetime
+from timeline.utils import split_by_days, timetostring
 
 User = get_user_model()
 
@@ -21,39 +25,83 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+def group_by_day(entries):
+    """
+    (day_of_week, from_time, to_time) rows sorted by day_of_week and from_time
+    as working hours of every day, rows over midnight are shown as two parts
+    of the day they start on
+    """
+
+    def prepare_data(rows):
+        return [
+            {"from_time": timetostring(from_time), "to_time": timetostring(to_time)}
+            for _, row_from, row_to in rows
+            for from_time, to_time in split_by_days(row_from, row_to)
+        ]
+
+    return {
+        day: prepare_data(rows) for day, rows in groupby(entries, key=lambda x: x[0])
+    }
+
+
+def schedule_data(instance):
+    """
+    Shop working hours grouped by day of week
+    """
+    entries = snapshot.weekly_entries(instance)
+    if entries is None:
+        entries = (
+            instance.timeline_entries.all()
+            .order_by("day_of_week", "from_time")
+            .values_list("day_of_week", "from_time", "to_time")
+        )
+    return group_by_day(entries)
+
+
+def special_hours_data(instance, from_date):
+    """
+    Special hours of dates from from_date, an empty list means closed
+    """
+    special_hours = (
+        instance.timeline_special_hours.filter(date__gte=from_date)
+        .order_by("date", "from_time")
+        .values_list("date", "from_time", "to_time")
+    )
+    return {
+        date.isoformat(): [
+            {"from_time": timetostring(from_time), "to_time": timetostring(to_time)}
+            for _, from_time, to_time in rows
+            if from_time is not None
+        ]
+        for date, rows in groupby(special_hours, key=lambda x: x[0])
+    }
+
+
 class ShopSerializer(serializers.ModelSerializer):
     owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
         model = Shop
-        fields = ("id", "title", "owner")
+        fields = ("id", "title", "owner", "latitude", "longitude")
+        extra_kwargs = {
+            "latitude": {"min_value": -90, "max_value": 90},
+            "longitude": {"min_value": -180, "max_value": 180},
+        }
+
+    def validate(self, attrs):
+        latitude = attrs.get("latitude", getattr(self.instance, "latitude", None))
+        longitude = attrs.get("longitude", getattr(self.instance, "longitude", None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError(
+                "latitude and longitude must be set together"
+            )
+        return super().validate(attrs)
 
     def create(self, validated_data):
         shop = super(ShopSerializer, self).create(validated_data)
         shop.save()
         return shop
 
-    def is_working(self, instance):
-        return instance.is_working()
-
-    def schedule(self, instance):
-        def prepare_data(row):
-            return {
-                "from_time": timetostring(row["from_time"]),
-                "to_time": timetostring(row["to_time"]),
-            }
-
-        entries = instance.timeline_entries.all().values(
-            "from_time", "to_time", "day_of_week"
-        )
-        # group rows by day_of_week
-        result = {
-            k: list(each)
-            for k, each in groupby(entries, key=lambda x: x["day_of_week"])
-        }
-        # update format
-        return {day: list(map(prepare_data, row)) for day, row in result.items()}
-
 
 class SchedulerBreaksSerialized(serializers.Serializer):
     from_time = serializers.TimeField(format="hh:mm", required=True)
@@ -90,6 +138,29 @@ class ShopUpdateSerialized(serializers.ModelSerializer):
         return super().validate(attrs)
 
 
+class SpecialDateSerialized(serializers.Serializer):
+    date = serializers.DateField(required=True)
+
+
+class SpecialHoursSerialized(SpecialDateSerialized):
+    is_working_day = serializers.BooleanField(required=True)
+    working_schedule = ScheduleSerialized(required=False)
+
+    def validate(self, attrs):
+        if not attrs["is_working_day"]:
+            return super().validate(attrs)
+
+        schedule = attrs.get("working_schedule")
+        if schedule is None:
+            raise serializers.ValidationError(
+                "working_schedule can't be empty if is_working_day is True"
+            )
+        if schedule["to_time"] <= schedule["from_time"]:
+            raise serializers.ValidationError("special hours must end before midnight")
+
+        return super().validate(attrs)
+
+
 class ShopCloseSerializer(serializers.ModelSerializer):
     shop = serializers.PrimaryKeyRelatedField(many=False, read_only=True)
 
@@ -105,3 +176,101 @@ class ShopCloseSerializer(serializers.ModelSerializer):
             if attrs["from_date"] > attrs["to_date"]:
                 raise serializers.ValidationError("finish must occur after start")
         return super().validate(attrs)
+
+
+class OpenIntervalsSerialized(serializers.Serializer):
+    """
+    Query parameters of open intervals, dates mean midnight
+    """
+
+    def get_fields(self):
+        input_formats = [api_settings.DATETIME_INPUT_FORMATS[0], "%Y-%m-%d"]
+        return {
+            "from": serializers.DateTimeField(input_formats=input_formats),
+            "to": serializers.DateTimeField(input_formats=input_formats),
+        }
+
+    def validate(self, attrs):
+        if attrs["from"] >= attrs["to"]:
+            raise serializers.ValidationError("to must occur after from")
+        return super().validate(attrs)
+
+
+class WindowSearchSerialized(OpenIntervalsSerialized):
+    """
+    Query parameters of the open shops search, the window is at most a week
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fields["mode"] = serializers.ChoiceField(choices=("any", "entire"), default="any")
+        return fields
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if attrs["to"] - attrs["from"] > datetime.timedelta(weeks=1):
+            raise serializers.ValidationError("window can't be longer than a week")
+        return attrs
+
+
+class PointInTimeSerialized(serializers.Serializer):
+    at = serializers.DateTimeField()
+
+
+class NearbySerialized(serializers.Serializer):
+    """
+    Query parameters of the nearby open shops search, radius in kilometers
+    """
+
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(min_value=0, default=5)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+    def validate_radius(self, value):
+        if value > settings.GEO_MAX_RADIUS_KM:
+            raise serializers.ValidationError(
+                "radius can't be larger than {} km".format(settings.GEO_MAX_RADIUS_KM)
+            )
+        return value
+
+
+class ChangeSerializer(serializers.ModelSerializer):
+    shop = serializers.IntegerField(source="shop_id")
+
+    class Meta:
+        model = Change
+        fields = ("id", "shop", "kind", "day_of_week", "created_at")
+
+
+class ChangesQuerySerialized(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=500)
+
+
+class RescheduleSerialized(serializers.Serializer):
+    days = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6), required=False
+    )
+    working_schedule = ScheduleSerialized(required=True)
+
+
+class BulkDeleteSerialized(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=100000
+    )
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = (
+            "id",
+            "kind",
+            "status",
+            "attempts",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
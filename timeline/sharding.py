@@ -0,0 +1,150 @@
+"""
+Optional sharding of shops by owner.
+
+Shop, Entry, Daysoff, DaysoffHistory and SpecialHours rows of an owner live in the database
+alias TIMELINE_SHARDS[owner_id % len(TIMELINE_SHARDS)]. Users, the outbox,
+occupancy, jobs and ShopLocation (shard of every shop id) stay in the default
+database. Without TIMELINE_SHARDS everything is in the default database.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+SHARDED_MODELS = {
+    "shop",
+    "entry",
+    "daysoff",
+    "daysoffhistory",
+    "specialhours",
+    "scheduleversion",
+}
+
+# shop id -> shard, shops never move between shards
+_locations = {}
+
+
+def is_enabled():
+    return bool(settings.TIMELINE_SHARDS)
+
+
+def shards():
+    return list(settings.TIMELINE_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def shard_for_owner(owner_id):
+    aliases = shards()
+    return aliases[owner_id % len(aliases)]
+
+
+def shard_for_shop(shop_id):
+    return group_by_shard([shop_id]).popitem()[0]
+
+
+def group_by_shard(shop_ids):
+    """
+    Split shop ids by their shards, as {alias: [shop ids]}
+    """
+    from .models import ShopLocation
+
+    shop_ids = [int(shop_id) for shop_id in shop_ids]
+    if not is_enabled():
+        return {DEFAULT_DB_ALIAS: shop_ids}
+
+    unknown = [shop_id for shop_id in shop_ids if shop_id not in _locations]
+    if unknown:
+        _locations.update(
+            ShopLocation.objects.using(DEFAULT_DB_ALIAS)
+            .filter(pk__in=unknown)
+            .values_list("pk", "shard")
+        )
+
+    groups = defaultdict(list)
+    for shop_id in shop_ids:
+        # missing shops are looked for in the default database
+        groups[_locations.get(shop_id, DEFAULT_DB_ALIAS)].append(shop_id)
+    return dict(groups)
+
+
+def fan_out(func, groups):
+    """
+    Call func(alias, items) for every shard in parallel and merge dict results
+    """
+    if len(groups) == 1:
+        ((alias, items),) = groups.items()
+        return func(alias, items)
+
+    def call(alias, items):
+        try:
+            return func(alias, items)
+        finally:
+            connections.close_all()
+
+    result = {}
+    with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        for part in executor.map(lambda group: call(*group), groups.items()):
+            result.update(part)
+    return result
+
+
+@contextmanager
+def atomic(alias):
+    """
+    Transaction in the shard and in the default database
+    """
+    with ExitStack() as stack:
+        stack.enter_context(transaction.atomic(using=alias))
+        if alias != DEFAULT_DB_ALIAS:
+            stack.enter_context(transaction.atomic(using=DEFAULT_DB_ALIAS))
+        yield
+
+
+class OwnerShardRouter:
+    def db_for_read(self, model, **hints):
+        return self._db_for_model(model, hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_model(model, hints.get("instance"))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_enabled():
+            # shops refer to users of the default database
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not is_enabled() or app_label != "timeline" or model_name is None:
+            return None
+        if model_name in SHARDED_MODELS:
+            return db in shards() or db == DEFAULT_DB_ALIAS
+        return db == DEFAULT_DB_ALIAS
+
+    def _db_for_model(self, model, instance):
+        if not is_enabled() or model._meta.app_label != "timeline":
+            return None
+        if model._meta.model_name not in SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+        if instance is None:
+            return None
+        if instance._meta.app_label != "timeline":
+            # shops of a user, e.g. on owner assignment
+            if model._meta.model_name == "shop" and instance.pk is not None:
+                return shard_for_owner(instance.pk)
+            return None
+        if instance._state.db and not instance._state.adding:
+            return instance._state.db
+
+        owner_id = getattr(instance, "owner_id", None)
+        if owner_id is not None:
+            return shard_for_owner(owner_id)
+        if model._meta.model_name == "shop":
+            return None
+
+        shop_field = instance._meta.get_field("shop")
+        if shop_field.is_cached(instance) and instance.shop is not None:
+            return instance.shop._state.db
+        if instance.shop_id is not None:
+            return shard_for_shop(instance.shop_id)
+
+        return instance._state.db
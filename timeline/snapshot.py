@@ -0,0 +1,60 @@
+"""
+In-process snapshot of the weekly entries of all shops.
+
+Loaded before a preforking server forks its workers, so they share it
+copy-on-write. A snapshot row is used only while the shop has the same
+schedule_version, any schedule change makes readers go to the database.
+"""
+from itertools import groupby
+from django.db import transaction
+from . import sharding
+
+_shops = {}
+
+
+def load():
+    """
+    Replace the snapshot with entries of all shards, return number of shops
+    """
+    from .models import Entry, Shop
+
+    shops = {}
+    for alias in sharding.shards():
+        with transaction.atomic(using=alias):
+            # versions are read first, entries changed meanwhile have a newer version
+            versions = dict(
+                Shop.objects.using(alias).values_list("pk", "schedule_version").iterator()
+            )
+            rows = (
+                Entry.objects.using(alias)
+                .order_by("shop_id", "from_time")
+                .values_list("shop_id", "day_of_week", "from_time", "to_time")
+                .iterator()
+            )
+            entries = {
+                shop_id: tuple(sorted(row[1:] for row in shop_rows))
+                for shop_id, shop_rows in groupby(rows, key=lambda row: row[0])
+            }
+
+        for shop_id, version in versions.items():
+            shops[shop_id] = (version, entries.get(shop_id, ()))
+
+    global _shops
+    _shops = shops
+    return len(shops)
+
+
+def weekly_entries(shop):
+    """
+    (day_of_week, from_time, to_time) rows of the shop ordered by day and time,
+    None if the snapshot doesn't have its current schedule
+    """
+    cached = _shops.get(shop.pk)
+    if cached is None or cached[0] != shop.schedule_version:
+        return None
+    return cached[1]
+
+
+def clear():
+    global _shops
+    _shops = {}
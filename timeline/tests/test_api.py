@@ -1,10 +1,14 @@
+import datetime
+import msgpack
+from unittest import mock
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework.views import status
 from rest_framework.authtoken.models import Token
 from timeline.models import Shop, Daysoff, Entry
-from timeline.views import ShopDetail
+from timeline.views import ShopDetail, IsOwner
+from timeline import throttling
 from freezegun import freeze_time
 from django.test import override_settings
 
@@ -14,6 +18,10 @@ User = get_user_model()
 class BaseAPITest(APITestCase):
     client = APIClient()
 
+    def _pre_setup(self):
+        super()._pre_setup()
+        throttling.local_buckets.clear()
+
     def _create_user(self):
         user = User(username="user1")
         user.set_password("pass1")
@@ -95,9 +103,35 @@ class ShopAPITest(BaseAPITest):
             {"title": "shop1"},
         )
 
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertNotEqual(foreign_shop.owner, self.user)
 
+    def test_shop_trying_to_close_foreign_shop(self):
+        foreign_user = User.objects.create(username="test1")
+        foreign_shop = Shop.objects.create(title="test", owner=foreign_user)
+
+        response = self.client.post(
+            self.view.reverse_action("close", args=[foreign_shop.pk])
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(foreign_shop.is_dayoff())
+
+    def test_shop_list_contains_only_own_shops(self):
+        shop = self._create_shop(self.user)
+        Shop.objects.create(title="test", owner=User.objects.create(username="test1"))
+
+        response = self.client.get(self.view.reverse_action("list"))
+
+        self.assertEqual([row["id"] for row in response.data], [shop.pk])
+
+    def test_shop_owner_check_does_not_load_owner(self):
+        shop = Shop.objects.get(pk=self._create_shop(self.user).pk)
+        request = mock.Mock(user=self.user)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(IsOwner().has_object_permission(request, None, shop))
+
     def test_shop_owner_is_saved_if_user_is_authenticated(self):
         response = self.client.post(
             self.view.reverse_action("list"), {"title": "shop1"}
@@ -233,6 +267,66 @@ class ShopAPITest(BaseAPITest):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class ShopAPISpecialHoursTest(BaseAPITest):
+    def setUp(self):
+        self.user = self._create_user()
+        self._login_user(self.user)
+        self.shop = self._create_shop(self.user)
+        self.view = self._set_shop_view()
+        self.url = self.view.reverse_action("special-hours", args=[self.shop.pk])
+
+    @freeze_time("2018-12-20 08:00:00")
+    def test_set_special_hours(self):
+        response = self.client.post(
+            self.url,
+            {
+                "date": "2018-12-24",
+                "is_working_day": True,
+                "working_schedule": {
+                    "from_time": "10:00",
+                    "to_time": "15:00",
+                    "breaks": [{"from_time": "12:00", "to_time": "12:30"}],
+                },
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.post(self.url, {"date": "2018-12-31", "is_working_day": False})
+
+        response = self.client.get(self.view.reverse_action("schedule", args=[self.shop.pk]))
+        self.assertEqual(
+            response.data["special_hours"],
+            {
+                "2018-12-24": [
+                    {"from_time": "10.00", "to_time": "11.59"},
+                    {"from_time": "12.30", "to_time": "15.00"},
+                ],
+                "2018-12-31": [],
+            },
+        )
+
+    def test_special_hours_end_before_midnight(self):
+        response = self.client.post(
+            self.url,
+            {
+                "date": "2018-12-24",
+                "is_working_day": True,
+                "working_schedule": {"from_time": "20:00", "to_time": "02:00"},
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_delete_special_hours(self):
+        self.client.post(self.url, {"date": "2018-12-24", "is_working_day": False})
+
+        response = self.client.delete(self.url + "?date=2018-12-24")
+
+        self.assertEqual(response.data, {"deleted": True})
+        self.assertFalse(self.shop.timeline_special_hours.exists())
+
+
 class ApiPermissionsTest(BaseAPITest):
     def setUp(self):
         self.view = self._set_shop_view()
@@ -282,8 +376,212 @@ class ShopAPIPublicTest(BaseAPITest):
         self.assertIn("is_working", response.data)
         self.assertFalse(response.data["is_working"])
 
+    def test_is_working_at_past_moment(self):
+        with freeze_time("2018-12-20 10:00:00"):
+            self.shop.update_schedule(1, False)
+        url = self.view.reverse_action("is-working", args=[self.shop.pk])
+
+        response = self.client.get(url, {"at": "2018-12-18T14:00:00"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["is_working"])
+
+        response = self.client.get(url, {"at": "2018-12-25T14:00:00"})
+        self.assertFalse(response.data["is_working"])
+
+        response = self.client.get(url, {"at": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_testshop_try_to_get_schedule(self):
         url = self.view.reverse_action("schedule", args=[self.shop.pk])
         response = self.client.post(url)
         self.assertIn("working_hours", response.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_testshop_schedule_splits_rows_at_midnight(self):
+        url = self.view.reverse_action("schedule", args=[self.shop.pk])
+        response = self.client.post(url)
+
+        self.assertEqual(
+            response.data["working_hours"][6],
+            [
+                {"from_time": "08.00", "to_time": "11.29"},
+                {"from_time": "12.30", "to_time": "15.14"},
+                {"from_time": "15.25", "to_time": "23.59"},
+                {"from_time": "00.00", "to_time": "02.01"},
+            ],
+        )
+
+    def test_testshop_schedule_is_rendered_as_compact_json(self):
+        url = self.view.reverse_action("schedule", args=[self.shop.pk])
+        response = self.client.post(url)
+
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn(
+            b'"6":[{"from_time":"08.00","to_time":"11.29"},', response.content
+        )
+
+    def test_is_working_can_be_rendered_as_msgpack(self):
+        url = self.view.reverse_action("is-working", args=[self.shop.pk])
+        response = self.client.post(url, HTTP_ACCEPT="application/msgpack")
+
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertIn("is_working", msgpack.unpackb(response.content, raw=False))
+
+    def test_open_intervals_are_streamed(self):
+        url = self.view.reverse_action("open-intervals", args=[self.shop.pk])
+        response = self.client.get(
+            url, {"from": "2018-12-20T08:00:00", "to": "2018-12-20T13:00:00"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines,
+            [
+                '{"from": "2018-12-20T08:00:00+00:00", "to": "2018-12-20T11:30:00+00:00"}',
+                '{"from": "2018-12-20T12:30:00+00:00", "to": "2018-12-20T13:00:00+00:00"}',
+            ],
+        )
+
+    def test_open_intervals_with_invalid_range(self):
+        url = self.view.reverse_action("open-intervals", args=[self.shop.pk])
+        response = self.client.get(url, {"from": "2018-12-21", "to": "2018-12-20"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @freeze_time("2018-12-20 08:00:00")
+    def test_bulk_status_of_many_shops(self):
+        closed = self._create_shop(self.shop.owner)
+        Daysoff.objects.create(shop=closed, from_date="2018-12-19")
+
+        url = self.view.reverse_action("bulk-status")
+        response = self.client.get(url, {"ids": "{},{},999".format(self.shop.pk, closed.pk)})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["is_working"], {str(self.shop.pk): True, str(closed.pk): False}
+        )
+
+    @override_settings(STATUS_MAX_IDS=2)
+    def test_bulk_status_of_too_many_shops(self):
+        url = self.view.reverse_action("bulk-status")
+
+        self.assertEqual(
+            self.client.get(url, {"ids": "1,2,2"}).status_code, status.HTTP_200_OK
+        )
+        response = self.client.get(url, {"ids": "1,2,3"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_shops_open_in_window(self):
+        url = self.view.reverse_action("open-shops")
+        response = self.client.get(
+            url, {"from": "2018-12-22T18:00:00", "to": "2018-12-22T21:00:00", "mode": "entire"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["shops"], [self.shop.pk])
+
+    def test_search_window_is_limited_to_a_week(self):
+        url = self.view.reverse_action("open-shops")
+        response = self.client.get(url, {"from": "2018-12-01", "to": "2018-12-20"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_status_with_invalid_ids(self):
+        url = self.view.reverse_action("bulk-status")
+        response = self.client.get(url, {"ids": "1,x"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(TIME_ZONE="UTC", SCHEDULE_CACHE_MAX_AGE=3600)
+class ShopAPICacheTest(BaseAPITest):
+    def setUp(self):
+        user = self._create_user()
+        self.shop = self._create_shop(user)
+        self.view = self._set_shop_view()
+
+    @freeze_time("2018-12-20 11:00:00")
+    def test_is_working_get_sets_max_age_till_transition(self):
+        response = self.client.get(
+            self.view.reverse_action("is-working", args=[self.shop.pk])
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["is_working"])
+        self.assertEqual(response["Cache-Control"], "public, max-age=1800")
+        self.assertIn("ETag", response)
+
+    @freeze_time("2018-12-20 08:00:00")
+    def test_is_working_get_max_age_is_limited(self):
+        response = self.client.get(
+            self.view.reverse_action("is-working", args=[self.shop.pk])
+        )
+
+        self.assertEqual(response["Cache-Control"], "public, max-age=3600")
+
+    def test_is_working_get_not_modified(self):
+        url = self.view.reverse_action("is-working", args=[self.shop.pk])
+        with freeze_time("2018-12-20 11:00:00"):
+            etag = self.client.get(url)["ETag"]
+        with freeze_time("2018-12-20 11:10:00"):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["Cache-Control"], "public, max-age=1200")
+
+    def test_is_working_get_modified_after_transition(self):
+        url = self.view.reverse_action("is-working", args=[self.shop.pk])
+        with freeze_time("2018-12-20 11:00:00"):
+            etag = self.client.get(url)["ETag"]
+        with freeze_time("2018-12-20 11:30:00"):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data["is_working"])
+
+    @freeze_time("2018-12-20 11:00:00")
+    def test_is_working_get_modified_after_close(self):
+        url = self.view.reverse_action("is-working", args=[self.shop.pk])
+        etag = self.client.get(url)["ETag"]
+        Daysoff.objects.create(shop=self.shop)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data["is_working"])
+
+    def test_schedule_get_not_modified(self):
+        url = self.view.reverse_action("schedule", args=[self.shop.pk])
+        response = self.client.get(url)
+        self.assertIn("working_hours", response.data)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_schedule_get_modified_after_midnight(self):
+        url = self.view.reverse_action("schedule", args=[self.shop.pk])
+        self.shop.set_special_hours(datetime.date(2018, 12, 20), False)
+        with freeze_time("2018-12-20 23:59:00"):
+            response = self.client.get(url)
+            self.assertEqual(len(response.data["special_hours"]), 1)
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code,
+                status.HTTP_304_NOT_MODIFIED,
+            )
+        with freeze_time("2018-12-21 00:00:00"):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["special_hours"], {})
+
+    def test_schedule_get_modified_after_update(self):
+        url = self.view.reverse_action("schedule", args=[self.shop.pk])
+        etag = self.client.get(url)["ETag"]
+        self.shop.update_schedule(0, False)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(0, response.data["working_hours"])
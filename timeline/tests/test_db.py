@@ -0,0 +1,82 @@
+import unittest
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.test import SimpleTestCase, TestCase
+from timeline import db
+from timeline.management.commands.benchmark_connections import MODES, make_connection
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+
+class HealthCheckTest(SimpleTestCase):
+    allow_database_queries = True
+
+    def _connect(self, health_checks=True):
+        connection = make_connection(
+            "default", {"CONN_MAX_AGE": None, "CONN_HEALTH_CHECKS": health_checks}
+        )
+        connection.ensure_connection()
+        self.addCleanup(connection.close)
+        return connection
+
+    def test_broken_connection_is_closed(self):
+        connection = self._connect()
+
+        with mock.patch.object(connection, "is_usable", return_value=False), mock.patch.object(
+            connection, "close"
+        ) as close:
+            db.check_connection(connection)
+
+        close.assert_called_once_with()
+
+    def test_working_connection_is_kept(self):
+        connection = self._connect()
+
+        db.check_connection(connection)
+
+        self.assertIsNotNone(connection.connection)
+
+    def test_check_is_disabled(self):
+        connection = self._connect(health_checks=False)
+
+        with mock.patch.object(connection, "is_usable") as is_usable:
+            db.check_connection(connection)
+
+        is_usable.assert_not_called()
+
+    def test_connections_are_checked_on_request_start(self):
+        with mock.patch("timeline.db.check_connection") as check_connection:
+            request_started.send(sender=self.__class__)
+
+        self.assertTrue(check_connection.called)
+
+
+@unittest.skipIf(psycopg2 is None, "psycopg2 is not installed")
+class WaitingConnectionPoolTest(SimpleTestCase):
+    def test_exhausted_pool_waits_and_fails(self):
+        from timeline.backends.postgresql_pool.base import WaitingConnectionPool
+
+        with mock.patch("psycopg2.pool.psycopg2.connect"):
+            connection_pool = WaitingConnectionPool(0, 1, 0.01)
+            connection = connection_pool.getconn()
+
+            with self.assertRaises(psycopg2.OperationalError):
+                connection_pool.getconn()
+
+            connection_pool.putconn(connection)
+            self.assertIsNotNone(connection_pool.getconn())
+
+
+class BenchmarkConnectionsTest(TestCase):
+    def test_benchmark(self):
+        out = StringIO()
+        call_command("benchmark_connections", "--requests", "20", "--threads", "2", stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]], list(MODES))
+        self.assertIn("skipped", lines[-1])
@@ -0,0 +1,119 @@
+from unittest import mock
+from django.contrib import auth
+from django.test import TestCase, override_settings
+from freezegun import freeze_time
+from rest_framework.test import APITestCase
+from rest_framework.views import status
+from timeline import events
+from timeline.events import TransitionScheduler
+from timeline.models import Change, Entry, Shop
+from timeline.views import ShopDetail
+
+User = auth.get_user_model()
+
+
+class TransitionSchedulerTest(TestCase):
+    def setUp(self):
+        self.shop = Shop.objects.create(owner=User.objects.create())
+        self.scheduler = TransitionScheduler()
+
+    def test_subscribe_sets_current_state(self):
+        with freeze_time("2018-12-20 11:00:00"):
+            self.scheduler.subscribe([self.shop.pk])
+
+        self.assertTrue(self.scheduler.state(self.shop.pk))
+
+    def test_tick_publishes_transition(self):
+        with freeze_time("2018-12-20 11:00:00"):
+            subscription = self.scheduler.subscribe([self.shop.pk])
+            self.assertEqual(self.scheduler.tick(), 30 * 60)
+
+        with freeze_time("2018-12-20 11:30:00"):
+            self.scheduler.tick()
+
+        self.assertEqual(
+            subscription.get(timeout=0), {"shop": self.shop.pk, "is_working": False}
+        )
+
+    def test_tick_without_transition_publishes_nothing(self):
+        with freeze_time("2018-12-20 11:00:00"):
+            subscription = self.scheduler.subscribe([self.shop.pk])
+        with freeze_time("2018-12-20 11:29:00"):
+            self.scheduler.tick()
+
+        self.assertIsNone(subscription.get(timeout=0))
+
+    @freeze_time("2018-12-20 11:00:00")
+    def test_schedule_changed_publishes_new_state(self):
+        subscription = self.scheduler.subscribe([self.shop.pk])
+        self.shop.update_schedule(3, False)
+
+        self.scheduler.schedule_changed([self.shop.pk])
+
+        self.assertEqual(
+            subscription.get(timeout=0), {"shop": self.shop.pk, "is_working": False}
+        )
+
+    @freeze_time("2018-12-20 11:00:00")
+    @override_settings(OUTBOX_SETTLE_SECONDS=0)
+    def test_sync_publishes_changes_of_other_processes(self):
+        subscription = self.scheduler.subscribe([self.shop.pk])
+        self.scheduler.cursor = Change.objects.last().pk
+        # written by another process, no on_commit hook runs here
+        Entry.objects.filter(shop=self.shop, day_of_week=3).delete()
+        Change.objects.record([self.shop.pk], Change.SCHEDULE, 3)
+
+        self.scheduler.sync()
+
+        self.assertEqual(
+            subscription.get(timeout=0), {"shop": self.shop.pk, "is_working": False}
+        )
+        self.assertEqual(self.scheduler.cursor, Change.objects.last().pk)
+
+    @freeze_time("2018-12-20 11:00:00")
+    def test_unsubscribe_stops_watching(self):
+        subscription = self.scheduler.subscribe([self.shop.pk])
+        self.scheduler.unsubscribe(subscription)
+
+        self.assertIsNone(self.scheduler.state(self.shop.pk))
+        self.assertIsNone(self.scheduler.tick())
+
+
+class EventsAPITest(APITestCase):
+    def setUp(self):
+        self.shop = Shop.objects.create(owner=User.objects.create())
+        view = ShopDetail()
+        view.basename = "shop"
+        view.request = None
+        self.url = view.reverse_action("events")
+
+    @freeze_time("2018-12-20 11:00:00")
+    def test_stream_starts_with_current_state(self):
+        with mock.patch.object(events.scheduler, "start"):
+            response = self.client.get(
+                self.url, {"ids": self.shop.pk}, HTTP_ACCEPT="text/event-stream"
+            )
+            content = response.streaming_content
+            first = next(content)
+            response.close()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(
+            first,
+            'event: state\ndata: {{"shop": {}, "is_working": true}}\n\n'.format(
+                self.shop.pk
+            ).encode(),
+        )
+        self.assertIsNone(events.scheduler.state(self.shop.pk))
+
+    def test_stream_with_invalid_ids(self):
+        response = self.client.get(self.url, {"ids": "1,a"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(EVENTS_MAX_IDS=2)
+    def test_stream_with_too_many_ids(self):
+        response = self.client.get(self.url, {"ids": "1,2,3"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
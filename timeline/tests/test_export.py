@@ -0,0 +1,122 @@
+import datetime
+import json
+from io import StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from freezegun import freeze_time
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from rest_framework.views import status
+from timeline import export
+from timeline.models import Shop
+from timeline.serializers import schedule_data
+
+User = get_user_model()
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        user = User.objects.create()
+        self.shop = Shop.objects.create(owner=user)
+        self.closed = Shop.objects.create(owner=user)
+        for day_of_week in range(7):
+            self.closed.update_schedule(day_of_week, False)
+        self.night = Shop.objects.create(owner=user)
+        for day_of_week in range(7):
+            self.night.update_schedule(day_of_week, False)
+        self.night.update_schedule(
+            6, True, {"from_time": datetime.time(22, 0), "to_time": datetime.time(2, 0)}
+        )
+
+    def _export(self, output, chunk_size=export.CHUNK_SIZE):
+        chunks, _ = export.export(output, chunk_size)
+        return "".join(chunks)
+
+    def test_shops_are_grouped_in_one_pass(self):
+        shops = list(export.iter_shops(chunk_size=3))
+
+        self.assertEqual([shop_id for shop_id, _ in shops], [self.shop.pk, self.night.pk])
+        from_times = [row[1] for row in shops[0][1]]
+        self.assertEqual(from_times, sorted(from_times))
+
+    def test_jsonl_has_format_of_schedule(self):
+        lines = self._export("jsonl").splitlines()
+
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(
+            json.loads(lines[0])["working_hours"],
+            json.loads(json.dumps(schedule_data(self.shop))),
+        )
+        # the part after midnight stays with the day it starts on
+        self.assertEqual(
+            json.loads(lines[1]),
+            {
+                "shop": self.night.pk,
+                "working_hours": {
+                    "6": [
+                        {"from_time": "22.00", "to_time": "23.59"},
+                        {"from_time": "00.00", "to_time": "02.00"},
+                    ],
+                },
+            },
+        )
+
+    def test_csv(self):
+        lines = self._export("csv").splitlines()
+
+        self.assertEqual(lines[0], "shop,day_of_week,from_time,to_time")
+        self.assertEqual(
+            lines[-2:],
+            ["{},6,22.00,23.59".format(self.night.pk), "{},6,00.00,02.00".format(self.night.pk)],
+        )
+
+    @freeze_time("2018-12-20 08:00:00")
+    def test_ics_event_over_end_of_week(self):
+        calendar = self._export("ics")
+
+        self.assertTrue(calendar.startswith("BEGIN:VCALENDAR\r\n"))
+        self.assertTrue(calendar.endswith("END:VCALENDAR\r\n"))
+        self.assertIn(
+            "DTSTART:20181223T220000\r\nDTEND:20181224T020100\r\nRRULE:FREQ=WEEKLY\r\n",
+            calendar,
+        )
+
+    def test_command(self):
+        out = StringIO()
+        call_command("export_schedules", output="jsonl", stdout=out)
+
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class ExportAPITest(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        Shop.objects.create(owner=self.staff)
+
+    def _authenticate(self, user):
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+
+    def test_export_is_streamed_to_staff(self):
+        self._authenticate(self.staff)
+        response = self.client.get(reverse("export"), {"output": "csv"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        content = b"".join(response.streaming_content).decode()
+        self.assertTrue(content.startswith("shop,day_of_week"))
+
+    def test_unknown_output(self):
+        self._authenticate(self.staff)
+        response = self.client.get(reverse("export"), {"output": "xml"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_only_staff_can_export(self):
+        self._authenticate(User.objects.create(username="user"))
+        response = self.client.get(reverse("export"))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
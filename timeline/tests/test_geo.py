@@ -0,0 +1,126 @@
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from freezegun import freeze_time
+from rest_framework.views import status
+from timeline import geo
+from timeline.models import Daysoff, Shop
+from timeline.tests.test_api import BaseAPITest
+
+User = get_user_model()
+
+
+class GridIndexTest(SimpleTestCase):
+    def test_distance(self):
+        self.assertAlmostEqual(geo.distance_km(0, 0, 0, 1), 111.195, places=3)
+        self.assertEqual(geo.distance_km(55.75, 37.62, 55.75, 37.62), 0)
+
+    def test_nearby_nearest_first(self):
+        grid = geo.GridIndex(cell_degrees=0.1)
+        grid.update(1, 55.76, 37.62)
+        grid.update(2, 55.75, 37.62)
+        grid.update(3, 55.95, 37.62)
+
+        self.assertEqual([shop_id for _, shop_id in grid.nearby(55.75, 37.62, 5)], [2, 1])
+
+    def test_nearby_over_date_line(self):
+        grid = geo.GridIndex(cell_degrees=0.1)
+        grid.update(1, 0, 179.99)
+        grid.update(2, 0, -179.99)
+
+        self.assertEqual(
+            sorted(shop_id for _, shop_id in grid.nearby(0, 180, 5)), [1, 2]
+        )
+
+    def test_update_and_remove(self):
+        grid = geo.GridIndex(cell_degrees=0.1)
+        grid.update(1, 10, 10)
+        grid.update(1, 20, 20)
+
+        self.assertEqual(grid.nearby(10, 10, 5), [])
+        self.assertEqual(len(grid.nearby(20, 20, 5)), 1)
+
+        grid.remove(1)
+        self.assertEqual(grid.nearby(20, 20, 5), [])
+        self.assertEqual(grid.cells, {})
+
+
+@freeze_time("2018-12-20 08:00:00")
+@override_settings(OUTBOX_SETTLE_SECONDS=0)
+class NearbyOpenTest(TestCase):
+    def setUp(self):
+        geo.reset()
+        self.user = User.objects.create()
+        self.near = Shop.objects.create(owner=self.user, latitude=55.751, longitude=37.62)
+        self.far = Shop.objects.create(owner=self.user, latitude=55.78, longitude=37.62)
+        self.closed = Shop.objects.create(owner=self.user, latitude=55.75, longitude=37.62)
+        Daysoff.objects.create(shop=self.closed, from_date="2018-12-19")
+
+    def tearDown(self):
+        geo.reset()
+
+    def test_open_shops_nearest_first(self):
+        shops = geo.nearby_open(55.75, 37.62, 5, 10)
+
+        self.assertEqual([shop_id for _, shop_id in shops], [self.near.pk, self.far.pk])
+
+    def test_limit(self):
+        self.assertEqual(
+            [shop_id for _, shop_id in geo.nearby_open(55.75, 37.62, 5, 1)], [self.near.pk]
+        )
+
+    @override_settings(GEO_MAX_CANDIDATES=2)
+    def test_candidates_are_capped(self):
+        # the two nearest candidates are the closed shop and the near one
+        self.assertEqual(
+            [shop_id for _, shop_id in geo.nearby_open(55.75, 37.62, 5, 10)], [self.near.pk]
+        )
+
+    def test_index_follows_changes(self):
+        geo.nearby_open(55.75, 37.62, 5, 10)
+
+        self.far.latitude = 40
+        self.far.save()
+        self.near.delete()
+        moved = Shop.objects.create(owner=self.user, latitude=55.752, longitude=37.62)
+
+        self.assertEqual(
+            [shop_id for _, shop_id in geo.nearby_open(55.75, 37.62, 5, 10)], [moved.pk]
+        )
+
+
+class NearbyAPITest(BaseAPITest):
+    def setUp(self):
+        geo.reset()
+        user = self._create_user()
+        self.shop = self._create_shop(user)
+        self.shop.latitude, self.shop.longitude = 55.751, 37.62
+        self.shop.save()
+        self.view = self._set_shop_view()
+        self.client.force_authenticate(user=None)
+
+    def tearDown(self):
+        geo.reset()
+
+    @freeze_time("2018-12-20 08:00:00")
+    def test_nearby_open_shops(self):
+        url = self.view.reverse_action("nearby")
+        response = self.client.get(url, {"lat": 55.75, "lng": 37.62, "radius": 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data, {"shops": [{"id": self.shop.pk, "distance_km": 0.111}]}
+        )
+
+    def test_invalid_query(self):
+        url = self.view.reverse_action("nearby")
+        for query in ({"lat": 91, "lng": 0}, {"lat": 0}, {"lat": 0, "lng": 0, "radius": 1000}):
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_location_must_be_complete(self):
+        self._login_user(self.shop.owner)
+        response = self.client.patch(
+            self.view.reverse_action("detail", args=[self.shop.pk]), {"latitude": None}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,159 @@
+import datetime
+from io import StringIO
+from django.contrib import auth
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework.views import status
+from timeline import jobs
+from timeline.models import Daysoff, Entry, Job, Shop
+from timeline.views import ShopDetail
+
+User = auth.get_user_model()
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create()
+        self.shop = Shop.objects.create(owner=self.user)
+
+    def test_dequeue_takes_oldest_job(self):
+        first = jobs.enqueue("close", {"owner": self.user.pk, "from_date": "2018-12-20"})
+        jobs.enqueue("close", {"owner": self.user.pk, "from_date": "2018-12-21"})
+
+        job = jobs.dequeue()
+
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.attempts, 1)
+
+    def test_dequeue_empty_queue(self):
+        self.assertIsNone(jobs.dequeue())
+
+    def test_enqueue_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue("unknown", {})
+
+    def test_failed_job_is_retried(self):
+        jobs.enqueue("close", {"owner": self.user.pk})
+
+        call_command("run_worker", "--burst", "--concurrency", "1", stdout=StringIO())
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, jobs.MAX_ATTEMPTS)
+        self.assertIn("KeyError", job.error)
+
+    def test_close_job(self):
+        Shop.objects.create(owner=self.user)
+        jobs.enqueue(
+            "close", {"owner": self.user.pk, "from_date": "2018-12-20", "to_date": None}
+        )
+
+        call_command("run_worker", "--burst", "--concurrency", "1", stdout=StringIO())
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, '{"closed": 2}')
+        self.assertEqual(Daysoff.objects.filter(shop__owner=self.user).count(), 2)
+
+    def test_job_of_crashed_worker_is_requeued(self):
+        jobs.enqueue("close", {"owner": self.user.pk, "from_date": "2018-12-20"})
+        crashed = jobs.dequeue()
+        Job.objects.filter(pk=crashed.pk).update(
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+
+        job = jobs.dequeue()
+
+        self.assertEqual(job.pk, crashed.pk)
+        self.assertEqual(job.attempts, 2)
+        # the stalled attempt can't overwrite the new one
+        jobs.run(crashed)
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
+
+    def test_job_out_of_attempts_fails_on_expired_lease(self):
+        job = jobs.enqueue("close", {"owner": self.user.pk, "from_date": "2018-12-20"})
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING,
+            attempts=jobs.MAX_ATTEMPTS,
+            heartbeat_at=timezone.now() - datetime.timedelta(hours=1),
+        )
+
+        self.assertIsNone(jobs.dequeue())
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_retried_close_job_skips_closed_shops(self):
+        Shop.objects.create(owner=self.user)
+        payload = {"owner": self.user.pk, "from_date": "2018-12-20", "to_date": None}
+        jobs.handlers["close"](payload)
+
+        self.assertEqual(jobs.handlers["close"](payload), {"closed": 2})
+        self.assertEqual(Daysoff.objects.filter(shop__owner=self.user).count(), 2)
+
+
+class JobAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user1")
+        self.shop = Shop.objects.create(owner=self.user)
+        self.client.force_authenticate(user=self.user)
+        self.view = ShopDetail()
+        self.view.basename = "shop"
+        self.view.request = None
+
+    def test_reschedule_returns_accepted(self):
+        response = self.client.post(
+            self.view.reverse_action("reschedule"),
+            {"days": [0], "working_schedule": {"from_time": "11:00", "to_time": "20:00"}},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], Job.QUEUED)
+
+        jobs.work(burst=True)
+        response = self.client.get(response["Location"])
+
+        self.assertEqual(response.data["status"], Job.DONE)
+        self.assertEqual(response.data["result"], {"changed": 1})
+        self.assertEqual(Entry.objects.filter(shop=self.shop, day_of_week=0).count(), 1)
+
+    def test_reschedule_with_invalid_schedule(self):
+        response = self.client.post(
+            self.view.reverse_action("reschedule"), {"days": [0]}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_close_returns_accepted(self):
+        response = self.client.post(
+            self.view.reverse_action("bulk-close"), {"from_date": "2018-12-20"}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        jobs.work(burst=True)
+        self.assertTrue(Daysoff.objects.filter(shop=self.shop).exists())
+
+    def test_bulk_delete_only_own_shops(self):
+        other_shop = Shop.objects.create(owner=User.objects.create(username="user2"))
+        response = self.client.post(
+            self.view.reverse_action("bulk-delete"),
+            {"ids": [self.shop.pk, other_shop.pk]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        jobs.work(burst=True)
+        response = self.client.get(response["Location"])
+
+        self.assertEqual(response.data["result"], {"deleted": 1})
+        self.assertEqual(list(Shop.objects.all()), [other_shop])
+
+    def test_foreign_job_is_not_found(self):
+        job = jobs.enqueue("close", {}, owner=User.objects.create(username="user2"))
+
+        response = self.client.get(reverse("job", args=[job.pk]))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,54 @@
+from django.test import LiveServerTestCase, SimpleTestCase
+from timeline import loadtest
+from timeline.models import Shop
+
+
+class LoadTestHelpersTest(SimpleTestCase):
+    def test_parse_mix(self):
+        self.assertEqual(
+            loadtest.parse_mix("is_working=3,close"), [("is_working", 3), ("close", 1)]
+        )
+
+    def test_parse_invalid_mix(self):
+        for mix in ("unknown=1", "close=x", "close=-1", "close=0"):
+            with self.assertRaises(ValueError):
+                loadtest.parse_mix(mix)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile([7], 95), 7)
+        self.assertIsNone(loadtest.percentile([], 50))
+
+    def test_summary(self):
+        stats = loadtest.Stats()
+        stats.record("schedule", 0.010, True)
+        stats.record("schedule", 0.030, False)
+        stats.record("close", 0.020, True)
+        stats.record("close", 0.001, False, throttled=True)
+
+        rows = stats.summary()
+
+        self.assertEqual(rows[1][:3], ("schedule", 2, 1))
+        self.assertEqual(rows[-1][:3], ("total", 4, 1))
+        self.assertAlmostEqual(rows[-1][3], 10.0)
+        self.assertEqual(stats.throttled, {"close": 1})
+
+
+class LoadTestRunTest(LiveServerTestCase):
+    def test_run_against_live_server(self):
+        stats = loadtest.run(
+            self.live_server_url + "/api",
+            shops=2,
+            requests=40,
+            concurrency=1,
+            mix=loadtest.parse_mix(loadtest.DEFAULT_MIX),
+            random_seed=1,
+        )
+
+        total = stats.summary()[-1]
+        self.assertEqual(Shop.objects.count(), 2)
+        self.assertEqual(total[:3], ("total", 40, 0))
+        self.assertGreater(stats.throughput(), 0)
@@ -0,0 +1,205 @@
+import datetime
+import json
+import tempfile
+from io import StringIO
+from django.contrib import auth
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from timeline import occupancy
+from timeline.models import Change, Daysoff, DaysoffHistory, Entry, Shop, SpecialHours
+from timeline.schedule import DayScheduler
+from timeline.utils import merge_slots
+
+User = auth.get_user_model()
+
+
+class MergeSlotsTest(TestCase):
+    def test_merge_overlapping_and_adjacent(self):
+        self.assertEqual(
+            merge_slots([(10, 20), (15, 30), (31, 40), (50, 60)]), [(10, 40), (50, 60)]
+        )
+
+    def test_merge_wrapped_row(self):
+        self.assertEqual(merge_slots([(10070, 5), (0, 20), (30, 40)]), [(30, 40), (10070, 20)])
+
+    def test_break_at_start_of_slot(self):
+        rows = DayScheduler(0).create(
+            {
+                "from_time": datetime.time(11, 0),
+                "to_time": datetime.time(20, 0),
+                "breaks": [
+                    {"from_time": datetime.time(11, 0), "to_time": datetime.time(12, 0)}
+                ],
+            }
+        )
+
+        self.assertEqual(rows, [[720, 1200]])
+
+
+class CompactSchedulesTest(TestCase):
+    def setUp(self):
+        self.shop = Shop.objects.create(owner=User.objects.create())
+        Entry.objects.filter(shop=self.shop).exclude(day_of_week=0).delete()
+        self.rows = list(
+            Entry.objects.filter(shop=self.shop).values_list("from_time", "to_time")
+        )
+        # duplicate, contained and adjacent rows
+        for from_time, to_time in [(480, 689), (500, 600), (690, 700)]:
+            Entry.objects.create(
+                shop=self.shop, day_of_week=0, from_time=from_time, to_time=to_time
+            )
+        occupancy.rebuild()
+
+    def _compact(self, *args):
+        out = StringIO()
+        call_command("compact_schedules", "--chunk-size", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_compact(self):
+        out = self._compact()
+
+        rows = Entry.objects.filter(shop=self.shop).values_list("from_time", "to_time")
+        self.assertEqual(sorted(rows), [(480, 700), (750, 914), (925, 1561)])
+        self.assertIn("4 rows deleted, 1 rows created, 3 rows reclaimed", out)
+        self.assertEqual(occupancy.get_histogram(), occupancy.build_histogram())
+
+    def test_compact_dry_run(self):
+        out = self._compact("--dry-run")
+
+        self.assertEqual(Entry.objects.filter(shop=self.shop).count(), 6)
+        self.assertIn("[dry run] 4 rows deleted", out)
+
+    def test_compact_resumes_after_shop(self):
+        self._compact("--start-after", str(self.shop.pk))
+
+        self.assertEqual(Entry.objects.filter(shop=self.shop).count(), 6)
+
+
+class ArchiveDaysoffTest(TestCase):
+    def setUp(self):
+        self.shop = Shop.objects.create(owner=User.objects.create())
+        Daysoff.objects.create(shop=self.shop, from_date="2017-01-01", to_date="2017-01-02")
+        Daysoff.objects.create(shop=self.shop, from_date="2017-02-01", to_date="2017-02-02")
+        Daysoff.objects.create(shop=self.shop, from_date="2017-03-01")
+
+    def test_archive_expired_daysoff(self):
+        out = StringIO()
+        call_command("archive_daysoff", "--batch-size", "1", stdout=out)
+
+        self.assertEqual(Daysoff.objects.count(), 1)
+        self.assertIsNone(Daysoff.objects.get().to_date)
+        self.assertEqual(
+            sorted(self.shop.timeline_daysoff_history.values_list("to_date", flat=True)),
+            [datetime.date(2017, 1, 2), datetime.date(2017, 2, 2)],
+        )
+        self.assertIn("2 days off archived", out.getvalue())
+
+    def test_daysoff_has_partial_indexes(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Daysoff._meta.db_table
+            )
+
+        self.assertIn("timeline_daysoff_open_ended", constraints)
+        self.assertIn("timeline_daysoff_by_to_date", constraints)
+
+
+class RescheduleShopsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create()
+        self.shop = Shop.objects.create(owner=self.user)
+        self.other_shop = Shop.objects.create(owner=User.objects.create(username="user2"))
+        self.shop.update_schedule(
+            0, True, {"from_time": datetime.time(9, 0), "to_time": datetime.time(18, 0)}
+        )
+
+    def _reschedule(self, *args):
+        out = StringIO()
+        call_command("reschedule_shops", "--processes", "0", *args, stdout=out)
+        return out.getvalue()
+
+    def test_reschedule_to_default_schedule(self):
+        out = self._reschedule()
+
+        self.assertEqual(Entry.objects.filter(shop=self.shop, day_of_week=0).count(), 3)
+        self.assertIn("1 shops changed, 1 rows deleted, 3 rows created", out)
+        self.assertEqual(occupancy.get_histogram(), occupancy.build_histogram())
+
+    def test_reschedule_dry_run(self):
+        out = self._reschedule("--dry-run", "--verbosity", "2")
+
+        self.assertEqual(Entry.objects.filter(shop=self.shop, day_of_week=0).count(), 1)
+        self.assertIn("shop {}: -1 +3 rows".format(self.shop.pk), out)
+
+    def test_reschedule_from_file_for_owner(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as schedule_file:
+            json.dump({"from_time": "10:00", "to_time": "20:00"}, schedule_file)
+            schedule_file.flush()
+            self._reschedule(
+                "--schedule", schedule_file.name, "--days", "1", "--owner", str(self.user.pk)
+            )
+
+        self.assertEqual(
+            list(
+                Entry.objects.filter(shop=self.shop, day_of_week=1).values_list(
+                    "from_time", "to_time"
+                )
+            ),
+            [(1440 + 600, 1440 + 1200)],
+        )
+        self.assertEqual(Entry.objects.filter(shop=self.other_shop, day_of_week=1).count(), 3)
+
+
+class DeleteShopsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create()
+        self.shops = [Shop.objects.create(owner=self.user) for _ in range(3)]
+        Daysoff.objects.create(shop=self.shops[0], from_date="2018-12-20")
+        DaysoffHistory.objects.create(
+            shop=self.shops[0], from_date="2018-12-01", to_date="2018-12-02"
+        )
+        self.shops[1].set_special_hours(datetime.date(2018, 12, 31), False)
+        self.other_shop = Shop.objects.create(owner=User.objects.create(username="user2"))
+        occupancy.rebuild()
+
+    def _delete(self, *args):
+        out = StringIO()
+        call_command("delete_shops", "--chunk-size", "2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_delete_shops_of_owner(self):
+        cursor = Change.objects.order_by("-pk").values_list("pk", flat=True).first()
+
+        out = self._delete("--owner", str(self.user.pk))
+
+        self.assertIn("3 shops deleted", out.splitlines()[-1])
+        self.assertEqual(list(Shop.objects.all()), [self.other_shop])
+        for model in (Entry, Daysoff, DaysoffHistory, SpecialHours):
+            self.assertFalse(model.objects.exclude(shop=self.other_shop).exists())
+        self.assertEqual(occupancy.get_histogram(), occupancy.build_histogram())
+        self.assertEqual(
+            sorted(
+                Change.objects.since(cursor)
+                .filter(kind=Change.DELETE)
+                .values_list("shop_id", flat=True)
+            ),
+            [shop.pk for shop in self.shops],
+        )
+
+    def test_delete_by_ids(self):
+        self._delete("--ids", "{},{}".format(self.shops[0].pk, self.other_shop.pk))
+
+        self.assertEqual(Shop.objects.count(), 2)
+        self.assertFalse(Shop.objects.filter(pk=self.other_shop.pk).exists())
+
+    def test_delete_dry_run(self):
+        out = self._delete("--owner", str(self.user.pk), "--dry-run")
+
+        self.assertIn("[dry run] 3 shops deleted", out)
+        self.assertEqual(Shop.objects.count(), 4)
+
+    def test_owner_or_ids_is_required(self):
+        with self.assertRaises(CommandError):
+            self._delete()
@@ -1,7 +1,10 @@
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 from django.contrib import auth
-from timeline.models import Shop, Entry, Daysoff
+from django.utils import timezone
+from timeline import maintenance
+from timeline.models import Shop, Entry, Daysoff, ScheduleVersion
+from timeline.utils import format_time
 from freezegun import freeze_time
 import datetime
 
@@ -115,6 +118,25 @@ class ShopModelTest(TestCase):
         with freeze_time("2018-12-20 00:00:00"):
             self.assertTrue(shop.by_working_time())
 
+    def test_shop_find_working_hours_after_end_of_the_week(self):
+        user_ = User.objects.create()
+        shop = Shop.objects.create(owner=user_)
+
+        # monday, sunday row wraps around the end of the week
+        with freeze_time("2018-12-17 02:01:00"):
+            self.assertTrue(shop.by_working_time())
+        with freeze_time("2018-12-17 02:02:00"):
+            self.assertFalse(shop.by_working_time())
+
+    def test_shop_default_schedule_overnight_is_one_row(self):
+        user_ = User.objects.create()
+        shop = Shop.objects.create(owner=user_)
+
+        self.assertEqual(Entry.objects.filter(shop=shop).count(), 7 * 3)
+        self.assertTrue(
+            Entry.objects.filter(shop=shop, day_of_week=6, from_time__gt=9000, to_time=121).exists()
+        )
+
     def test_shop_find_working_hours_at_end_of_the_day(self):
         user_ = User.objects.create()
         shop = Shop.objects.create(owner=user_)
@@ -187,3 +209,387 @@ class DaysoffModelTest(TestCase):
         Daysoff.objects.create(shop=shop, from_date="2017-01-02", to_date="2017-02-02")
 
         self.assertFalse(Daysoff.objects.is_closed().exists())
+
+
+class ShopTransitionTest(TestCase):
+    """test next open/close transition"""
+
+    def setUp(self):
+        user_ = User.objects.create()
+        self.shop = Shop.objects.create(owner=user_)
+
+    def test_next_transition_when_open(self):
+        with freeze_time("2018-12-20 08:00:00"):
+            transition = self.shop.next_transition()
+
+        self.assertEqual(transition.strftime("%Y-%m-%d %H:%M"), "2018-12-20 11:30")
+
+    def test_next_transition_when_closed(self):
+        with freeze_time("2018-12-20 03:00:00"):
+            transition = self.shop.next_transition()
+
+        self.assertEqual(transition.strftime("%Y-%m-%d %H:%M"), "2018-12-20 08:00")
+
+    def test_next_transition_over_midnight(self):
+        with freeze_time("2018-12-20 23:00:00"):
+            transition = self.shop.next_transition()
+
+        self.assertEqual(transition.strftime("%Y-%m-%d %H:%M"), "2018-12-21 02:02")
+
+    def test_next_transition_at_daysoff_end(self):
+        Daysoff.objects.create(
+            shop=self.shop, from_date="2018-12-19", to_date="2018-12-20"
+        )
+        with freeze_time("2018-12-20 08:00:00"):
+            transition = self.shop.next_transition()
+
+        self.assertEqual(transition.strftime("%Y-%m-%d %H:%M"), "2018-12-21 00:00")
+
+    def test_next_transition_at_daysoff_start(self):
+        Daysoff.objects.create(shop=self.shop, from_date="2018-12-21")
+        with freeze_time("2018-12-20 23:00:00"):
+            transition = self.shop.next_transition()
+
+        self.assertEqual(transition.strftime("%Y-%m-%d %H:%M"), "2018-12-21 00:00")
+
+    def test_next_transition_without_entries(self):
+        Entry.objects.filter(shop=self.shop).delete()
+
+        self.assertIsNone(self.shop.next_transition())
+
+    def test_schedule_version_is_changed(self):
+        self.shop.update_schedule(0, False)
+        Daysoff.objects.create(shop=self.shop)
+
+        self.assertEqual(Shop.objects.get(pk=self.shop.pk).schedule_version, 2)
+
+
+class ShopOpenIntervalsTest(TestCase):
+    """test expanding schedule into datetime intervals"""
+
+    def setUp(self):
+        user_ = User.objects.create()
+        self.shop = Shop.objects.create(owner=user_)
+
+    def _intervals(self, start, end):
+        start = timezone.make_aware(datetime.datetime.strptime(start, "%Y-%m-%d %H:%M"))
+        end = timezone.make_aware(datetime.datetime.strptime(end, "%Y-%m-%d %H:%M"))
+        return [
+            (from_dt.strftime("%d %H:%M"), to_dt.strftime("%d %H:%M"))
+            for from_dt, to_dt in self.shop.open_intervals(start, end)
+        ]
+
+    def test_open_intervals_of_one_day(self):
+        intervals = self._intervals("2018-12-20 00:00", "2018-12-21 00:00")
+
+        self.assertEqual(
+            intervals,
+            [
+                ("20 00:00", "20 02:02"),
+                ("20 08:00", "20 11:30"),
+                ("20 12:30", "20 15:15"),
+                ("20 15:25", "21 00:00"),
+            ],
+        )
+
+    def test_open_intervals_over_end_of_the_week(self):
+        intervals = self._intervals("2018-12-23 20:00", "2018-12-24 04:00")
+
+        self.assertEqual(intervals, [("23 20:00", "24 02:02")])
+
+    def test_open_intervals_without_daysoff(self):
+        Daysoff.objects.create(
+            shop=self.shop, from_date="2018-12-20", to_date="2018-12-20"
+        )
+        Daysoff.objects.create(shop=self.shop, from_date="2018-12-22")
+
+        intervals = self._intervals("2018-12-19 20:00", "2018-12-24 00:00")
+
+        self.assertEqual(
+            intervals,
+            [
+                ("19 20:00", "20 00:00"),
+                ("21 00:00", "21 02:02"),
+                ("21 08:00", "21 11:30"),
+                ("21 12:30", "21 15:15"),
+                ("21 15:25", "22 00:00"),
+            ],
+        )
+
+    def test_open_intervals_of_a_year(self):
+        start = timezone.make_aware(datetime.datetime(2018, 12, 17))
+        intervals = self.shop.open_intervals(
+            start, start + datetime.timedelta(weeks=52)
+        )
+
+        # plus the sunday night part at the very beginning
+        self.assertEqual(sum(1 for _ in intervals), 52 * 7 * 3 + 1)
+
+
+class ShopWindowSearchTest(TestCase):
+    """test searching shops open in a time window"""
+
+    def setUp(self):
+        user_ = User.objects.create()
+        self.shop = Shop.objects.create(owner=user_)
+        self.saturday_closed = Shop.objects.create(owner=user_)
+        self.saturday_closed.update_schedule(5, False)
+        self.closed = Shop.objects.create(owner=user_)
+        Daysoff.objects.create(shop=self.closed, from_date="2018-12-22", to_date="2018-12-24")
+        self.monday_off = Shop.objects.create(owner=user_)
+        Daysoff.objects.create(shop=self.monday_off, from_date="2018-12-24")
+
+    def _search(self, start, end, entire=False):
+        start = timezone.make_aware(datetime.datetime.strptime(start, "%Y-%m-%d %H:%M"))
+        end = timezone.make_aware(datetime.datetime.strptime(end, "%Y-%m-%d %H:%M"))
+        return Shop.objects.open_in_window(start, end, entire=entire)
+
+    def test_open_at_any_moment(self):
+        self.assertEqual(
+            self._search("2018-12-22 18:00", "2018-12-22 21:00"),
+            [self.shop.pk, self.monday_off.pk],
+        )
+
+    def test_open_for_the_entire_window(self):
+        self.assertEqual(
+            self._search("2018-12-22 18:00", "2018-12-22 21:00", entire=True),
+            [self.shop.pk, self.monday_off.pk],
+        )
+
+    def test_break_inside_the_window(self):
+        self.assertEqual(
+            self._search("2018-12-22 14:00", "2018-12-22 16:00", entire=True), []
+        )
+        self.assertEqual(
+            self._search("2018-12-22 14:00", "2018-12-22 16:00"),
+            [self.shop.pk, self.monday_off.pk],
+        )
+
+    def test_window_over_midnight(self):
+        self.assertEqual(
+            self._search("2018-12-21 23:00", "2018-12-22 01:00", entire=True),
+            [self.shop.pk, self.saturday_closed.pk, self.monday_off.pk],
+        )
+
+    def test_window_over_end_of_the_week(self):
+        self.assertEqual(
+            self._search("2018-12-23 23:00", "2018-12-24 01:00", entire=True),
+            [self.shop.pk, self.saturday_closed.pk],
+        )
+        # the shop is open on sunday before its day off
+        self.assertEqual(
+            self._search("2018-12-23 23:00", "2018-12-24 01:00"),
+            [self.shop.pk, self.saturday_closed.pk, self.monday_off.pk],
+        )
+
+    def test_entry_search_over_end_of_the_week(self):
+        sunday_night = format_time(6, datetime.time(23, 0))
+        monday_night = format_time(0, datetime.time(1, 0))
+
+        self.assertEqual(
+            set(
+                Entry.objects.covering(sunday_night, monday_night).values_list(
+                    "shop_id", flat=True
+                )
+            ),
+            {self.shop.pk, self.saturday_closed.pk, self.closed.pk, self.monday_off.pk},
+        )
+        self.assertFalse(
+            Entry.objects.overlapping(monday_night + 100, monday_night + 300).exists()
+        )
+
+
+class ShopSpecialHoursTest(TestCase):
+    """test special hours of a date"""
+
+    def setUp(self):
+        user_ = User.objects.create()
+        self.shop = Shop.objects.create(owner=user_)
+        self.date = datetime.date(2018, 12, 24)
+        self.shop.set_special_hours(
+            self.date,
+            True,
+            {"from_time": datetime.time(10, 0), "to_time": datetime.time(14, 0)},
+        )
+
+    def _is_working(self, dt):
+        with freeze_time(dt):
+            return self.shop.is_working()
+
+    def test_special_hours_replace_weekly_schedule(self):
+        self.assertFalse(self._is_working("2018-12-24 09:00"))
+        self.assertTrue(self._is_working("2018-12-24 11:00"))
+        # sunday night entry doesn't continue into the special date
+        self.assertFalse(self._is_working("2018-12-24 01:00"))
+        self.assertTrue(self._is_working("2018-12-25 09:00"))
+
+    def test_special_hours_are_resolved_in_one_query(self):
+        with freeze_time("2018-12-24 11:00"), self.assertNumQueries(1):
+            self.shop.is_working()
+        with freeze_time("2018-12-25 11:00"), self.assertNumQueries(1):
+            self.shop.is_working()
+
+    def test_closed_date(self):
+        self.shop.set_special_hours(self.date, False)
+
+        self.assertFalse(self._is_working("2018-12-24 11:00"))
+
+    def test_special_hours_open_shop_on_day_off(self):
+        Daysoff.objects.create(shop=self.shop, from_date="2018-12-23", to_date="2018-12-25")
+
+        self.assertTrue(self._is_working("2018-12-24 11:00"))
+        self.assertFalse(self._is_working("2018-12-25 11:00"))
+        with freeze_time("2018-12-24 11:00"):
+            self.assertEqual(Shop.objects.bulk_is_working([self.shop.pk]), {self.shop.pk: True})
+
+    def test_open_intervals_with_special_hours(self):
+        start = timezone.make_aware(datetime.datetime(2018, 12, 23, 23, 0))
+        end = timezone.make_aware(datetime.datetime(2018, 12, 25, 9, 0))
+
+        self.assertEqual(
+            [
+                (from_dt.strftime("%d %H:%M"), to_dt.strftime("%d %H:%M"))
+                for from_dt, to_dt in self.shop.open_intervals(start, end)
+            ],
+            [
+                ("23 23:00", "24 00:00"),
+                ("24 10:00", "24 14:01"),
+                # monday night entry continues on the next date
+                ("25 00:00", "25 02:02"),
+                ("25 08:00", "25 09:00"),
+            ],
+        )
+
+    def test_window_search_with_special_hours(self):
+        start = timezone.make_aware(datetime.datetime(2018, 12, 24, 10, 0))
+        end = timezone.make_aware(datetime.datetime(2018, 12, 24, 14, 0))
+
+        self.assertEqual(Shop.objects.open_in_window(start, end, entire=True), [self.shop.pk])
+        self.assertEqual(
+            Shop.objects.open_in_window(start.replace(hour=8), start, entire=False), []
+        )
+
+    def test_delete_special_hours(self):
+        version = Shop.objects.get(pk=self.shop.pk).schedule_version
+
+        self.assertTrue(self.shop.delete_special_hours(self.date))
+        self.assertFalse(self.shop.delete_special_hours(self.date))
+
+        self.assertTrue(self._is_working("2018-12-24 09:00"))
+        self.assertEqual(Shop.objects.get(pk=self.shop.pk).schedule_version, version + 1)
+
+
+class ShopScheduleHistoryTest(TestCase):
+    """test point in time checks against the schedule history"""
+
+    def setUp(self):
+        with freeze_time("2018-12-17 09:00:00"):
+            self.shop = Shop.objects.create(owner=User.objects.create())
+
+    def _dt(self, value):
+        return timezone.make_aware(datetime.datetime.strptime(value, "%Y-%m-%d %H:%M"))
+
+    def test_replaced_schedule_is_kept(self):
+        with freeze_time("2018-12-20 10:00:00"):
+            self.shop.update_schedule(1, False)
+        with freeze_time("2018-12-21 10:00:00"):
+            self.shop.update_schedule(
+                1, True, {"from_time": datetime.time(10, 0), "to_time": datetime.time(12, 0)}
+            )
+
+        first, second = ScheduleVersion.objects.order_by("valid_to")
+        self.assertIsNone(first.valid_from)
+        self.assertEqual(second.valid_from, first.valid_to)
+        self.assertEqual(second.entries, "")
+
+        shop = Shop.objects.get(pk=self.shop.pk)
+        # the default schedule before the changes, the new one after them
+        self.assertTrue(shop.is_working(self._dt("2018-12-18 14:00")))
+        self.assertFalse(shop.is_working(self._dt("2018-12-25 14:00")))
+        self.assertTrue(shop.is_working(self._dt("2018-12-25 11:00")))
+
+    def test_current_version_is_read_by_one_query(self):
+        with freeze_time("2018-12-20 10:00:00"):
+            self.shop.update_schedule(1, False)
+
+        with self.assertNumQueries(1):
+            self.assertFalse(self.shop.is_working(self._dt("2018-12-25 14:00")))
+
+    def test_daysoff_existing_at_the_moment(self):
+        with freeze_time("2018-12-19 08:00:00"):
+            deleted = Daysoff.objects.create(shop=self.shop, from_date="2018-12-19")
+        with freeze_time("2018-12-20 10:00:00"):
+            deleted.delete()
+            Daysoff.objects.create(shop=self.shop, from_date="2018-12-18", to_date="2018-12-18")
+
+        shop = Shop.objects.get(pk=self.shop.pk)
+        # days off created later don't close the shop in the past
+        self.assertTrue(shop.is_working(self._dt("2018-12-18 14:00")))
+        self.assertFalse(shop.is_working(self._dt("2018-12-19 14:00")))
+        self.assertTrue(shop.is_working(self._dt("2018-12-21 14:00")))
+
+    def test_archived_daysoff_still_close_the_shop(self):
+        with freeze_time("2018-12-01 08:00:00"):
+            Daysoff.objects.create(shop=self.shop, from_date="2018-12-18", to_date="2018-12-18")
+        with freeze_time("2018-12-20 10:00:00"):
+            self.assertEqual(maintenance.archive_daysoff(), 1)
+            self.assertFalse(Daysoff.objects.exists())
+
+            shop = Shop.objects.get(pk=self.shop.pk)
+            # the moment is after the last schedule change, it isn't read from the history
+            self.assertFalse(shop.is_working(self._dt("2018-12-18 11:00")))
+            self.assertTrue(shop.is_working(self._dt("2018-12-19 11:00")))
+            self.assertEqual(
+                Shop.objects.bulk_is_working([shop.pk], self._dt("2018-12-18 11:00")),
+                {shop.pk: False},
+            )
+            self.assertEqual(
+                list(shop.open_intervals(self._dt("2018-12-18 00:00"), self._dt("2018-12-19 09:00"))),
+                [
+                    (self._dt("2018-12-19 00:00"), self._dt("2018-12-19 02:02")),
+                    (self._dt("2018-12-19 08:00"), self._dt("2018-12-19 09:00")),
+                ],
+            )
+
+    def test_bulk_is_working_before_the_change(self):
+        with freeze_time("2018-12-19 08:00:00"):
+            Daysoff.objects.create(shop=self.shop, from_date="2018-12-21", to_date="2018-12-21")
+        with freeze_time("2018-12-20 10:00:00"):
+            self.shop.update_schedule(1, False)
+
+        shop = Shop.objects.get(pk=self.shop.pk)
+        start = self._dt("2018-12-17 09:00")
+        for hour in range(7 * 24):
+            dt = start + datetime.timedelta(hours=hour)
+            is_working = shop.is_working(dt)
+            opened = any(
+                from_dt <= dt < to_dt
+                for from_dt, to_dt in shop.open_intervals(dt, dt + datetime.timedelta(minutes=1))
+            )
+
+            self.assertEqual(Shop.objects.bulk_is_working([shop.pk], dt), {shop.pk: is_working})
+            self.assertEqual(opened, is_working, dt)
+        # tuesday before the change is open by the replaced schedule
+        self.assertEqual(
+            Shop.objects.bulk_is_working([shop.pk], self._dt("2018-12-18 14:00")),
+            {shop.pk: True},
+        )
+
+    @freeze_time("2018-12-20 11:00:00")
+    def test_open_intervals_over_the_change(self):
+        with freeze_time("2018-12-20 10:00:00"):
+            self.shop.update_schedule(3, False)
+
+        intervals = list(
+            Shop.objects.get(pk=self.shop.pk).open_intervals(
+                self._dt("2018-12-20 00:00"), self._dt("2018-12-21 00:00")
+            )
+        )
+
+        self.assertEqual(
+            intervals,
+            [
+                (self._dt("2018-12-20 00:00"), self._dt("2018-12-20 02:02")),
+                (self._dt("2018-12-20 08:00"), self._dt("2018-12-20 10:00")),
+            ],
+        )
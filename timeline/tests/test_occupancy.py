@@ -0,0 +1,119 @@
+import datetime
+from io import StringIO
+from django.contrib import auth
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework.views import status
+from timeline import occupancy
+from timeline.models import Shop, OccupancyDelta
+
+User = auth.get_user_model()
+
+MONDAY_0800 = 8 * 60
+MONDAY_1130 = 11 * 60 + 30
+MONDAY_0100 = 60
+TUESDAY_0100 = 24 * 60 + 60
+
+
+class OccupancyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user1")
+        self.shop = Shop.objects.create(owner=self.user)
+        Shop.objects.create(owner=User.objects.create(username="user2"))
+
+    def test_histogram_counts_open_shops(self):
+        histogram = occupancy.get_histogram()
+
+        self.assertEqual(len(histogram), 7 * 24 * 60)
+        self.assertEqual(histogram[MONDAY_0800], 2)
+        self.assertEqual(histogram[MONDAY_1130], 0)
+        # overnight rows of sunday and monday
+        self.assertEqual(histogram[MONDAY_0100], 2)
+        self.assertEqual(histogram[TUESDAY_0100], 2)
+
+    def test_histogram_filtered_by_owner(self):
+        histogram = occupancy.get_histogram(self.user.pk)
+
+        self.assertEqual(histogram[MONDAY_0800], 1)
+
+    def test_histogram_is_maintained_by_update_schedule(self):
+        self.shop.update_schedule(0, False)
+        self.shop.update_schedule(
+            1,
+            True,
+            {"from_time": datetime.time(0, 0), "to_time": datetime.time(3, 0)},
+        )
+
+        histogram = occupancy.get_histogram()
+
+        self.assertEqual(histogram[MONDAY_0800], 1)
+        self.assertEqual(histogram[TUESDAY_0100], 2)
+        self.assertEqual(histogram, occupancy.build_histogram())
+
+    def test_histogram_is_maintained_by_delete(self):
+        self.shop.delete()
+
+        self.assertEqual(occupancy.get_histogram()[MONDAY_0800], 1)
+
+    def test_histogram_is_updated_by_one_statement(self):
+        def histogram_queries(write):
+            with CaptureQueriesContext(connection) as queries:
+                write()
+            return [
+                query["sql"] for query in queries if "timeline_occupancydelta" in query["sql"]
+            ]
+
+        self.assertEqual(len(histogram_queries(lambda: Shop.objects.create(owner=self.user))), 1)
+        self.assertEqual(
+            len(
+                histogram_queries(
+                    lambda: self.shop.update_schedule(
+                        0,
+                        True,
+                        {"from_time": datetime.time(7, 0), "to_time": datetime.time(9, 0)},
+                    )
+                )
+            ),
+            1,
+        )
+        self.assertEqual(occupancy.get_histogram(), occupancy.build_histogram())
+
+    def test_rebuild(self):
+        expected = occupancy.get_histogram()
+        OccupancyDelta.objects.all().delete()
+
+        call_command("occupancy", "--rebuild", stdout=StringIO())
+
+        self.assertEqual(occupancy.get_histogram(), expected)
+
+
+class OccupancyAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user1")
+        Shop.objects.create(owner=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def test_get_histogram(self):
+        response = self.client.get(reverse("occupancy"), {"owner": self.user.pk})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["minutes"][MONDAY_0800], 1)
+
+    def test_get_histogram_of_other_owner(self):
+        other = User.objects.create(username="user2")
+
+        response = self.client.get(reverse("occupancy"), {"owner": other.pk})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=User.objects.create(username="staff", is_staff=True))
+        response = self.client.get(reverse("occupancy"), {"owner": other.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_histogram_invalid_owner(self):
+        response = self.client.get(reverse("occupancy"), {"owner": "abc"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
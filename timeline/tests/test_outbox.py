@@ -0,0 +1,106 @@
+import datetime
+from django.contrib import auth
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework.views import status
+from timeline import outbox
+from timeline.models import Change, Daysoff, Shop
+
+User = auth.get_user_model()
+
+
+@override_settings(OUTBOX_SETTLE_SECONDS=0)
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.shop = Shop.objects.create(owner=User.objects.create())
+
+    def _kinds(self, since=0):
+        return [(change.shop_id, change.kind) for change in outbox.iter_changes(since)]
+
+    def test_new_shop_is_recorded(self):
+        self.assertEqual(self._kinds(), [(self.shop.pk, Change.SHOP)])
+
+    def test_schedule_update_is_recorded(self):
+        cursor = Change.objects.last().pk
+        self.shop.update_schedule(
+            2, True, {"from_time": datetime.time(9, 0), "to_time": datetime.time(18, 0)}
+        )
+
+        change = Change.objects.get(pk__gt=cursor)
+        self.assertEqual(change.kind, Change.SCHEDULE)
+        self.assertEqual(change.day_of_week, 2)
+
+    def test_close_and_delete_are_recorded(self):
+        cursor = Change.objects.last().pk
+        Daysoff.objects.create(shop=self.shop)
+        shop_id = self.shop.pk
+        self.shop.delete()
+
+        self.assertEqual(
+            self._kinds(cursor), [(shop_id, Change.DAYSOFF), (shop_id, Change.DELETE)]
+        )
+
+    def test_consume_returns_cursor(self):
+        Shop.objects.create(owner=User.objects.create(username="user2"))
+        seen = []
+
+        cursor = outbox.consume(seen.append, batch_size=1)
+
+        self.assertEqual(len(seen), 2)
+        self.assertEqual(cursor, Change.objects.last().pk)
+        self.assertEqual(outbox.consume(seen.append, since=cursor), cursor)
+
+    @override_settings(OUTBOX_SETTLE_SECONDS=60)
+    def test_young_changes_are_not_read(self):
+        settled = Change.objects.get()
+        Change.objects.filter(pk=settled.pk).update(
+            created_at=timezone.now() - datetime.timedelta(minutes=2)
+        )
+        Shop.objects.create(owner=User.objects.create(username="user2"))
+        # an older change after the young one must not move the cursor past it
+        Change.objects.create(
+            shop_id=self.shop.pk,
+            kind=Change.SHOP,
+            created_at=timezone.now() - datetime.timedelta(minutes=2),
+        )
+
+        self.assertEqual([change.pk for change in outbox.read()], [settled.pk])
+        self.assertEqual(outbox.last_cursor(), settled.pk)
+        self.assertEqual(
+            len(outbox.read(now=timezone.now() + datetime.timedelta(minutes=1))), 3
+        )
+
+
+@override_settings(OUTBOX_SETTLE_SECONDS=0)
+class ChangesAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user1", is_staff=True)
+        self.shop = Shop.objects.create(owner=self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def test_changes_are_for_staff_only(self):
+        self.client.force_authenticate(user=User.objects.create(username="user2"))
+
+        response = self.client.get(reverse("changes"))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_get_changes_since_cursor(self):
+        response = self.client.get(reverse("changes"))
+        cursor = response.data["cursor"]
+        self.shop.update_schedule(0, False)
+
+        response = self.client.get(reverse("changes"), {"since": cursor})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["changes"]), 1)
+        self.assertEqual(response.data["changes"][0]["shop"], self.shop.pk)
+        self.assertEqual(response.data["changes"][0]["kind"], Change.SCHEDULE)
+        self.assertGreater(response.data["cursor"], cursor)
+
+    def test_get_changes_with_invalid_cursor(self):
+        response = self.client.get(reverse("changes"), {"since": "abc"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
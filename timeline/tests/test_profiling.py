@@ -0,0 +1,77 @@
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from rest_framework.views import status
+from timeline import profiling
+from timeline.models import Shop
+
+User = get_user_model()
+
+
+class ProfileMiddlewareTest(APITestCase):
+    def setUp(self):
+        profiling.reset()
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        self.user = User.objects.create(username="user")
+        self.shop = Shop.objects.create(owner=self.user)
+        self.url = reverse("shop-schedule", args=[self.shop.pk])
+
+    def tearDown(self):
+        profiling.reset()
+
+    def _authenticate(self, user):
+        token = Token.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+
+    def test_staff_can_profile_request_with_header(self):
+        self._authenticate(self.staff)
+        self.client.get(self.url, HTTP_X_PROFILE="1")
+
+        profile = profiling.summary(limit=1000)["shop-schedule"]
+        self.assertEqual(profile["requests"], 1)
+        self.assertGreater(profile["queries"], 0)
+        self.assertTrue(
+            any("(timetostring)" in row["function"] for row in profile["functions"])
+        )
+
+    def test_header_of_other_users_is_ignored(self):
+        self._authenticate(self.user)
+        self.client.get(self.url, HTTP_X_PROFILE="1")
+
+        self.assertEqual(profiling.summary(), {})
+
+    @override_settings(PROFILE_SAMPLE_RATE=1, PROFILE_MODE="sample", PROFILE_SAMPLE_INTERVAL=0.0001)
+    def test_sampled_requests(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        self.assertEqual(profiling.summary()["shop-schedule"]["requests"], 2)
+        for line in profiling.collapsed_stacks():
+            self.assertTrue(line.startswith("shop-schedule;"))
+
+    def test_stats_are_available_only_for_staff(self):
+        self._authenticate(self.user)
+        response = self.client.get(reverse("profile"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self._authenticate(self.staff)
+        self.client.get(self.url, HTTP_X_PROFILE="1")
+        response = self.client.get(reverse("profile"), {"view": "shop-schedule", "limit": 5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data["views"]), ["shop-schedule"])
+        self.assertEqual(len(response.data["views"]["shop-schedule"]["functions"]), 5)
+
+    def test_collapsed_stacks_and_reset(self):
+        self._authenticate(self.staff)
+        self.client.get(self.url, HTTP_X_PROFILE="1")
+
+        response = self.client.get(reverse("profile"), {"output": "collapsed"})
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertIn(b"shop-schedule;", response.content)
+
+        response = self.client.delete(reverse("profile"))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(profiling.summary(), {})
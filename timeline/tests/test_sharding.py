@@ -0,0 +1,160 @@
+import datetime
+import unittest
+from django.conf import settings
+from django.contrib import auth
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from freezegun import freeze_time
+from timeline import jobs, maintenance, sharding
+from timeline.models import Change, Daysoff, DaysoffHistory, Entry, Shop, ShopLocation
+
+User = auth.get_user_model()
+
+
+@override_settings(TIMELINE_SHARDS=["default", "shard1"])
+class RouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = sharding.OwnerShardRouter()
+
+    def test_owner_shard(self):
+        self.assertEqual(sharding.shard_for_owner(2), "default")
+        self.assertEqual(sharding.shard_for_owner(3), "shard1")
+
+    def test_new_shop_goes_to_owner_shard(self):
+        self.assertEqual(self.router.db_for_write(Shop, instance=Shop(owner_id=3)), "shard1")
+
+    def test_entry_follows_its_shop(self):
+        shop = Shop(owner_id=3)
+        shop._state.db = "shard1"
+
+        self.assertEqual(self.router.db_for_write(Entry, instance=Entry(shop=shop)), "shard1")
+
+    def test_global_models_stay_in_default(self):
+        self.assertEqual(self.router.db_for_write(Change), "default")
+        self.assertTrue(self.router.allow_migrate("default", "timeline", "change"))
+        self.assertFalse(self.router.allow_migrate("shard1", "timeline", "change"))
+        self.assertTrue(self.router.allow_migrate("shard1", "timeline", "entry"))
+
+
+@override_settings(TIMELINE_SHARDS=[])
+class UnshardedTest(TestCase):
+    def test_everything_is_in_default(self):
+        shop = Shop.objects.create(owner=User.objects.create())
+
+        self.assertEqual(sharding.group_by_shard([shop.pk]), {"default": [shop.pk]})
+        # ids are allocated by the locations table, so sharding can be enabled later
+        self.assertEqual(ShopLocation.objects.get(pk=shop.pk).shard, "default")
+
+    @freeze_time("2018-12-20 08:00:00")
+    def test_bulk_is_working(self):
+        owner = User.objects.create()
+        shops = [Shop.objects.create(owner=owner) for i in range(3)]
+        Daysoff.objects.create(shop=shops[1], from_date="2018-12-20")
+
+        self.assertEqual(
+            Shop.objects.bulk_is_working([shop.pk for shop in shops]),
+            {shops[0].pk: True, shops[1].pk: False, shops[2].pk: True},
+        )
+
+
+@unittest.skipUnless(len(settings.TIMELINE_SHARDS) > 1, "sharding is not configured")
+class ShardedTest(TransactionTestCase):
+    multi_db = True
+
+    def setUp(self):
+        sharding._locations.clear()
+        self.owners = [
+            User.objects.create(username="owner{}".format(i))
+            for i in range(len(settings.TIMELINE_SHARDS))
+        ]
+        self.shops = [Shop.objects.create(owner=owner) for owner in self.owners]
+
+    def test_shops_are_stored_in_owner_shards(self):
+        for owner, shop in zip(self.owners, self.shops):
+            alias = sharding.shard_for_owner(owner.pk)
+            if alias != "default":
+                self.assertFalse(Entry.objects.using("default").filter(shop=shop).exists())
+            self.assertEqual(shop._state.db, alias)
+            self.assertTrue(Entry.objects.using(alias).filter(shop=shop).exists())
+            self.assertEqual(ShopLocation.objects.get(pk=shop.pk).shard, alias)
+
+    def test_shop_ids_are_unique_across_shards(self):
+        self.assertEqual(len({shop.pk for shop in self.shops}), len(self.shops))
+
+    def test_owner_and_shop_lookups(self):
+        shop = self.shops[-1]
+
+        self.assertEqual(list(Shop.objects.for_owner(shop.owner_id)), [shop])
+        self.assertEqual(Shop.objects.for_shop(shop.pk).get(pk=shop.pk), shop)
+
+    @freeze_time("2018-12-20 08:00:00")
+    def test_bulk_is_working_fans_out(self):
+        shop = Shop.objects.for_shop(self.shops[-1].pk).get(pk=self.shops[-1].pk)
+        Daysoff.objects.create(shop=shop, from_date="2018-12-20")
+
+        result = Shop.objects.bulk_is_working([shop.pk for shop in self.shops])
+
+        self.assertEqual(result[shop.pk], False)
+        self.assertTrue(all(result[other.pk] for other in self.shops[:-1]))
+        self.assertEqual(
+            Shop.objects.for_shop(shop.pk).get(pk=shop.pk).schedule_version, 1
+        )
+
+    def test_delete_shops_in_every_shard(self):
+        deleted = maintenance.delete_shops([shop.pk for shop in self.shops])
+
+        self.assertEqual(deleted, len(self.shops))
+        for alias in sharding.shards():
+            self.assertFalse(Shop.objects.using(alias).exists())
+            self.assertFalse(Entry.objects.using(alias).exists())
+
+    def test_shop_chunks_cover_every_shard(self):
+        self.assertEqual(
+            list(maintenance.iter_shop_chunks(1)), [[shop.pk] for shop in self.shops]
+        )
+
+    def test_reschedule_job_in_owner_shard(self):
+        for owner, shop in zip(self.owners, self.shops):
+            result = jobs.handlers["reschedule"](
+                {
+                    "owner": owner.pk,
+                    "days": [0],
+                    "working_schedule": {"from_time": "11:00", "to_time": "20:00"},
+                }
+            )
+
+            self.assertEqual(result, {"changed": 1})
+            self.assertEqual(
+                list(
+                    Entry.objects.using(shop._state.db)
+                    .filter(shop=shop, day_of_week=0)
+                    .values_list("from_time", "to_time")
+                ),
+                [(11 * 60, 20 * 60)],
+            )
+
+    def test_compact_shops_in_every_shard(self):
+        for shop in self.shops:
+            entry = Entry.objects.using(shop._state.db).filter(shop=shop).first()
+            Entry.objects.using(shop._state.db).create(
+                shop=shop,
+                day_of_week=entry.day_of_week,
+                from_time=entry.from_time,
+                to_time=entry.to_time,
+            )
+
+        deleted, created = maintenance.compact_shops([shop.pk for shop in self.shops])
+
+        self.assertEqual((deleted, created), (len(self.shops), 0))
+
+    def test_archive_daysoff_in_every_shard(self):
+        for shop in self.shops:
+            Daysoff.objects.create(shop=shop, from_date="2018-12-01", to_date="2018-12-02")
+
+        moved = maintenance.archive_daysoff(before=datetime.date(2018, 12, 20))
+
+        self.assertEqual(moved, len(self.shops))
+        for shop in self.shops:
+            self.assertFalse(Daysoff.objects.using(shop._state.db).filter(shop=shop).exists())
+            self.assertTrue(
+                DaysoffHistory.objects.using(shop._state.db).filter(shop=shop).exists()
+            )
@@ -0,0 +1,61 @@
+import datetime
+from django.contrib import auth
+from django.test import TestCase, override_settings
+from timeline import geo, snapshot, warmup
+from timeline.models import Shop
+from timeline.schedule import get_default_schedule
+from timeline.serializers import schedule_data
+
+User = auth.get_user_model()
+
+
+class DefaultScheduleTest(TestCase):
+    def test_compiled_once(self):
+        self.assertIs(get_default_schedule(), get_default_schedule())
+
+    def test_recompiled_after_setting_change(self):
+        with override_settings(
+            DEFAULT_SHOP_SCHEDULE={"from_time": datetime.time(9, 0), "to_time": datetime.time(10, 0)}
+        ):
+            self.assertEqual(get_default_schedule()[0], ((540, 600),))
+
+        self.assertNotEqual(get_default_schedule()[0], ((540, 600),))
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.shop = Shop.objects.create(owner=User.objects.create())
+        snapshot.load()
+
+    def tearDown(self):
+        snapshot.clear()
+        geo.reset()
+
+    def test_schedule_is_read_from_snapshot(self):
+        expected = schedule_data(Shop.objects.get(pk=self.shop.pk))
+        snapshot.clear()
+        snapshot.load()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(schedule_data(self.shop), expected)
+
+    def test_changed_schedule_is_read_from_database(self):
+        self.shop.update_schedule(0, False)
+
+        self.assertIsNone(snapshot.weekly_entries(self.shop))
+        self.assertNotIn(0, schedule_data(self.shop))
+
+    def test_warm_up(self):
+        snapshot.clear()
+
+        warmup.warm(load_snapshot=True)
+
+        self.assertIsNotNone(snapshot.weekly_entries(self.shop))
+        self.assertIsNotNone(geo.get_index().cursor)
+
+    def test_memory_usage(self):
+        memory = warmup.memory_usage()
+
+        if memory is not None:
+            self.assertGreater(memory["rss"], 0)
+            self.assertLessEqual(memory["private"], memory["rss"])
@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+from rest_framework.views import status
+from timeline import throttling
+from timeline.models import Shop
+
+User = get_user_model()
+
+
+class TokenBucketTest(SimpleTestCase):
+    def test_parse_rate(self):
+        self.assertEqual(throttling.parse_rate("120/min"), (120, 2))
+        self.assertEqual(throttling.parse_rate("5/s"), (5, 5))
+
+    def test_bucket_refills(self):
+        buckets = throttling.LocalBuckets()
+
+        self.assertEqual(buckets.take("key", 2, 1, now=100), 0)
+        self.assertEqual(buckets.take("key", 2, 1, now=100), 0)
+        self.assertEqual(buckets.take("key", 2, 1, now=100.5), 0.5)
+        self.assertEqual(buckets.take("key", 2, 1, now=101), 0)
+
+    def test_least_recently_used_buckets_are_evicted(self):
+        buckets = throttling.LocalBuckets(shards=1, max_keys=2)
+        for key in ("a", "b", "a", "c"):
+            buckets.take(key, 1, 1, now=100)
+
+        self.assertEqual(list(buckets.shards[0][0]), ["a", "c"])
+
+    def test_verified_tokens_expire(self):
+        tokens = throttling.VerifiedTokens(max_keys=2, ttl=10)
+        tokens.add("a", 1, now=100)
+        tokens.add("b", 2, now=100)
+        tokens.add("c", 3, now=100)
+
+        self.assertIsNone(tokens.get("a", now=100))
+        self.assertEqual(tokens.get("b", now=110), 2)
+        self.assertIsNone(tokens.get("b", now=111))
+
+
+@override_settings(SCHEDULE_THROTTLE_RATES={"is_working": "2/min"})
+class ThrottleAPITest(APITestCase):
+    def setUp(self):
+        throttling.local_buckets.clear()
+        throttling.verified_tokens.clear()
+        self.shop = Shop.objects.create(owner=User.objects.create())
+        self.url = reverse("shop-is-working", args=[self.shop.pk])
+
+    def test_throttled_without_queries(self):
+        self.client.post(self.url)
+        self.client.post(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "30")
+
+    def test_verified_tokens_have_own_buckets(self):
+        token = Token.objects.create(user=self.shop.owner)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        # the first request of a token takes from the ip bucket
+        self.client.post(self.url)
+        self.client.credentials()
+        self.client.post(self.url)
+        self.assertEqual(
+            self.client.post(self.url).status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+
+        self.assertEqual(self.client.post(self.url).status_code, status.HTTP_200_OK)
+
+    def test_unknown_tokens_share_ip_bucket(self):
+        for number in range(2):
+            self.client.credentials(HTTP_AUTHORIZATION="Token fake{}".format(number))
+            self.client.post(self.url)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token fake2")
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_does_not_reset_bucket(self):
+        for address in ("10.0.0.1", "10.0.0.2"):
+            self.client.post(self.url, HTTP_X_FORWARDED_FOR=address)
+
+        response = self.client.post(self.url, HTTP_X_FORWARDED_FOR="10.0.0.3")
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, NUM_PROXIES=1))
+    def test_forwarded_for_behind_proxy(self):
+        for address in ("10.0.0.1", "10.0.0.1"):
+            self.client.post(self.url, HTTP_X_FORWARDED_FOR="1.1.1.1, " + address)
+
+        response = self.client.post(self.url, HTTP_X_FORWARDED_FOR="10.0.0.2")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(SCHEDULE_THROTTLE=False)
+    def test_throttling_can_be_turned_off(self):
+        for _ in range(3):
+            self.assertEqual(self.client.post(self.url).status_code, status.HTTP_200_OK)
+
+    def test_other_actions_are_not_throttled(self):
+        url = reverse("shop-schedule", args=[self.shop.pk])
+        for _ in range(3):
+            self.assertEqual(self.client.post(url).status_code, status.HTTP_200_OK)
+
+    @override_settings(
+        SCHEDULE_THROTTLE_CACHE="throttle",
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "throttle": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        },
+    )
+    def test_shared_cache_buckets(self):
+        for _ in range(2):
+            self.assertEqual(self.client.post(self.url).status_code, status.HTTP_200_OK)
+
+        self.assertEqual(
+            self.client.post(self.url).status_code, status.HTTP_429_TOO_MANY_REQUESTS
+        )
+        self.assertFalse(any(throttling.local_buckets.shards[i][0] for i in range(16)))
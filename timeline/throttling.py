@@ -0,0 +1,170 @@
+"""
+Token bucket throttling of ShopDetail actions.
+
+Throttling runs before authentication, so no database query is needed to throttle
+a request. Buckets are keyed by the user of a token verified by an earlier request
+and by the client ip otherwise, so made up tokens don't get their own buckets.
+They are held in this process or, with SCHEDULE_THROTTLE_CACHE, in a shared
+Django cache.
+"""
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import get_authorization_header
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """
+    "N/period" into (capacity, tokens per second), period is s, m, h or d
+    """
+    requests, _, period = rate.partition("/")
+    return int(requests), int(requests) / DURATIONS[period[0]]
+
+
+def take_token(state, capacity, refill, now):
+    """
+    Take a token from the bucket state (tokens, updated),
+    return the new state and seconds to wait, 0 if the token was taken
+    """
+    if state is None:
+        tokens = capacity
+    else:
+        # clock going back (another server, frozen time) doesn't drain the bucket
+        tokens = min(capacity, state[0] + max(now - state[1], 0) * refill)
+
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / refill
+
+
+class LocalBuckets:
+    """
+    Buckets of this process, split into shards with their own locks,
+    the least recently used buckets are evicted over max_keys
+    """
+
+    def __init__(self, shards=16, max_keys=100000):
+        self.shards = [(OrderedDict(), threading.Lock()) for _ in range(shards)]
+        self.max_keys = max(max_keys // shards, 1)
+
+    def take(self, key, capacity, refill, now):
+        buckets, lock = self.shards[zlib.crc32(key.encode()) % len(self.shards)]
+        with lock:
+            state, wait = take_token(buckets.pop(key, None), capacity, refill, now)
+            buckets[key] = state
+            while len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        for buckets, lock in self.shards:
+            with lock:
+                buckets.clear()
+
+
+class VerifiedTokens:
+    """
+    Users of tokens which passed authentication, remembered for ttl seconds,
+    the least recently used tokens are evicted over max_keys
+    """
+
+    def __init__(self, max_keys=10000, ttl=300):
+        self.tokens = OrderedDict()
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def get(self, token, now):
+        with self._lock:
+            user_id, verified = self.tokens.get(token, (None, None))
+            if user_id is None:
+                return None
+            if now - verified > self.ttl:
+                del self.tokens[token]
+                return None
+            self.tokens.move_to_end(token)
+            return user_id
+
+    def add(self, token, user_id, now):
+        with self._lock:
+            self.tokens.pop(token, None)
+            self.tokens[token] = (user_id, now)
+            while len(self.tokens) > self.max_keys:
+                self.tokens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.tokens.clear()
+
+
+class CacheBuckets:
+    """
+    Buckets shared through a Django cache, concurrent requests of one key
+    can take a few extra tokens
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def take(self, key, capacity, refill, now):
+        key = "throttle:" + key
+        state, wait = take_token(self.cache.get(key), capacity, refill, now)
+        self.cache.set(key, state, timeout=int(capacity / refill) + 1)
+        return wait
+
+    def clear(self):
+        self.cache.clear()
+
+
+local_buckets = LocalBuckets()
+verified_tokens = VerifiedTokens()
+
+
+def token_verified(request):
+    """
+    Remember the user of the token the request was authenticated by
+    """
+    token = getattr(request.auth, "key", None)
+    if token is not None and request.user.is_authenticated:
+        verified_tokens.add(token, request.user.pk, time.time())
+
+
+def get_buckets():
+    if settings.SCHEDULE_THROTTLE_CACHE:
+        return CacheBuckets(caches[settings.SCHEDULE_THROTTLE_CACHE])
+    return local_buckets
+
+
+class ActionRateThrottle(BaseThrottle):
+    """
+    Token bucket per action and client, rates are taken from SCHEDULE_THROTTLE_RATES
+    """
+
+    def allow_request(self, request, view):
+        if not settings.SCHEDULE_THROTTLE:
+            return True
+        rate = settings.SCHEDULE_THROTTLE_RATES.get(getattr(view, "action", None))
+        if not rate:
+            return True
+
+        capacity, refill = parse_rate(rate)
+        key = "{}:{}".format(view.action, self.get_key(request))
+        self.wait_seconds = get_buckets().take(key, capacity, refill, time.time())
+        return not self.wait_seconds
+
+    def get_key(self, request):
+        auth = get_authorization_header(request).split()
+        if len(auth) == 2 and auth[0].lower() == b"token":
+            user_id = verified_tokens.get(auth[1].decode("latin-1"), time.time())
+            if user_id is not None:
+                return "user:{}".format(user_id)
+        return "ip:" + self.get_ident(request)
+
+    def wait(self):
+        return self.wait_seconds
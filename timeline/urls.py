@@ -11,4 +11,9 @@ urlpatterns = router.urls
 urlpatterns += [
     url(r"^user/register/", views.create_user, name="register"),
     url(r"^user/login/", auth_views.obtain_auth_token, name="login"),
+    url(r"^occupancy/$", views.occupancy_histogram, name="occupancy"),
+    url(r"^changes/$", views.changes, name="changes"),
+    url(r"^jobs/(?P<pk>[0-9]+)/$", views.job_detail, name="job"),
+    url(r"^profile/$", views.profile_stats, name="profile"),
+    url(r"^export/$", views.export_schedules, name="export"),
 ]
@@ -1,13 +1,19 @@
 import datetime
 
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
 
 def format_time(day_of_week, time):
-    return "{}{:02d}{:02d}".format(day_of_week, time.hour, time.minute)
+    """
+    Number of minutes since Monday 00:00
+    """
+    return day_of_week * MINUTES_PER_DAY + time.hour * 60 + time.minute
 
 
 def timetostring(rtime):
-    full_date = datetime.datetime.strptime(str(rtime).zfill(5), "%w%H%M")
-    return "{:02d}.{:02d}".format(full_date.hour, full_date.minute)
+    hours, minutes = divmod(rtime % MINUTES_PER_DAY, 60)
+    return "{:02d}.{:02d}".format(hours, minutes)
 
 
 def subminutes(time1, minutes):
@@ -17,3 +23,139 @@ def subminutes(time1, minutes):
 
 def next_weekday(day_of_week):
     return 0 if day_of_week == 6 else day_of_week + 1
+
+
+def split_wrap(intervals):
+    """
+    Split intervals wrapped around the end of the week (to_time < from_time)
+    """
+    for from_time, to_time in intervals:
+        if to_time < from_time:
+            yield from_time, MINUTES_PER_WEEK - 1
+            yield 0, to_time
+        else:
+            yield from_time, to_time
+
+
+def split_by_days(from_time, to_time):
+    """
+    Split interval on parts which don't cross midnight
+    """
+    if to_time < from_time:
+        to_time += MINUTES_PER_WEEK
+
+    while from_time // MINUTES_PER_DAY != to_time // MINUTES_PER_DAY:
+        end_of_the_day = (from_time // MINUTES_PER_DAY + 1) * MINUTES_PER_DAY - 1
+        yield from_time % MINUTES_PER_WEEK, end_of_the_day % MINUTES_PER_WEEK
+        from_time = end_of_the_day + 1
+
+    yield from_time % MINUTES_PER_WEEK, to_time % MINUTES_PER_WEEK
+
+
+def merge_slots(rows):
+    """
+    Merge overlapping and adjacent inclusive (from_time, to_time) rows,
+    rows wrapped around the end of the week stay wrapped
+    """
+    merged = []
+
+    # unwrap rows, so every row has from_time <= to_time
+    for from_time, to_time in sorted(
+        (from_time, to_time + MINUTES_PER_WEEK if to_time < from_time else to_time)
+        for from_time, to_time in rows
+    ):
+        if merged and from_time <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], to_time)
+        else:
+            merged.append([from_time, to_time])
+
+    # the last row can reach rows at the beginning of the next week
+    while len(merged) > 1 and merged[0][0] + MINUTES_PER_WEEK <= merged[-1][1] + 1:
+        from_time, to_time = merged.pop(0)
+        merged[-1][1] = max(merged[-1][1], to_time + MINUTES_PER_WEEK)
+
+    result = []
+    for from_time, to_time in merged:
+        if to_time - from_time + 1 >= MINUTES_PER_WEEK:
+            return [(0, MINUTES_PER_WEEK - 1)]
+        result.append((from_time, to_time % MINUTES_PER_WEEK))
+
+    return result
+
+
+def merge_intervals(intervals):
+    """
+    Merge inclusive minute of week intervals into sorted half-open [start, end) ones
+    """
+    merged = []
+
+    for start, end in sorted((start, end + 1) for start, end in split_wrap(intervals)):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return [tuple(row) for row in merged]
+
+
+def coalesce(intervals):
+    """
+    Join sorted (start, end) intervals which touch or overlap
+    """
+    current = None
+
+    for start, end in intervals:
+        if current is not None and start <= current[1]:
+            current = (current[0], max(current[1], end))
+            continue
+        if current is not None:
+            yield current
+        current = (start, end)
+
+    if current is not None:
+        yield current
+
+
+def subtract(intervals, gaps):
+    """
+    Remove sorted gaps from sorted non-overlapping intervals
+    """
+    gaps = iter(gaps)
+    gap = next(gaps, None)
+
+    for start, end in intervals:
+        while gap is not None and start < end:
+            gap_start, gap_end = gap
+            if gap_end <= start:
+                gap = next(gaps, None)
+                continue
+            if gap_start >= end:
+                break
+            if gap_start > start:
+                yield start, gap_start
+            start = max(start, gap_end)
+            if gap_end <= end:
+                gap = next(gaps, None)
+
+        if start < end:
+            yield start, end
+
+
+def covers(from_time, to_time, minute):
+    """
+    Inclusive entry row contains the minute of week
+    """
+    if to_time < from_time:
+        return minute >= from_time or minute <= to_time
+    return from_time <= minute <= to_time
+
+
+def encode_rows(rows):
+    """
+    (from_time, to_time) rows as compact "from-to,from-to" text
+    """
+    return ",".join("{}-{}".format(from_time, to_time) for from_time, to_time in rows)
+
+
+def decode_rows(text):
+    return [tuple(int(value) for value in row.split("-")) for row in text.split(",") if row]
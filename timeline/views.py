@@ -1,13 +1,36 @@
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status, viewsets, permissions
 from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from django.utils import timezone
 from .serializers import (
     UserSerializer,
     ShopSerializer,
     ShopCloseSerializer,
     ShopUpdateSerialized,
+    OpenIntervalsSerialized,
+    WindowSearchSerialized,
+    NearbySerialized,
+    PointInTimeSerialized,
+    SpecialDateSerialized,
+    SpecialHoursSerialized,
+    ChangeSerializer,
+    ChangesQuerySerialized,
+    RescheduleSerialized,
+    BulkDeleteSerialized,
+    JobSerializer,
+    schedule_data,
+    special_hours_data,
 )
-from .models import Shop
+from .models import Shop, Job
+from .renderers import EventStreamRenderer, fast_renderers
+from .throttling import ActionRateThrottle
+from . import caching, events, export, geo, jobs, occupancy, outbox, profiling, throttling
+import datetime
+import json
 
 
 def create_object_if_valid(serialized):
@@ -25,10 +48,111 @@ def create_user(request):
     return create_object_if_valid(serialized)
 
 
+@api_view(["GET"])
+def occupancy_histogram(request):
+    """
+    Number of open shops for every minute of the week, starting from Monday 00:00
+    """
+    owner = request.query_params.get("owner")
+    if owner is not None and not owner.isdigit():
+        return Response(
+            {"owner": ["A valid integer is required."]},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if owner and int(owner) != request.user.pk and not request.user.is_staff:
+        return Response(status=status.HTTP_403_FORBIDDEN)
+
+    histogram = occupancy.get_histogram(int(owner) if owner else None)
+    return Response({"minutes": histogram})
+
+
+@api_view(["GET", "DELETE"])
+@permission_classes((permissions.IsAdminUser,))
+def profile_stats(request):
+    """
+    Aggregated request profiles of this process, output=collapsed gives flamegraph input
+    """
+    if request.method == "DELETE":
+        profiling.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    view = request.query_params.get("view")
+    if request.query_params.get("output") == "collapsed":
+        lines = profiling.collapsed_stacks(view)
+        return HttpResponse("".join(line + "\n" for line in lines), content_type="text/plain")
+
+    limit = request.query_params.get("limit", "30")
+    if not limit.isdigit():
+        return Response(
+            {"limit": ["A valid integer is required."]},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    return Response({"views": profiling.summary(view, int(limit))})
+
+
+@api_view(["GET"])
+@permission_classes((permissions.IsAdminUser,))
+def export_schedules(request):
+    """
+    Weekly schedule of every shop streamed as output=csv (default), jsonl or ics
+    """
+    output = request.query_params.get("output", "csv")
+    if output not in export.FORMATS:
+        return Response(
+            {"output": ["One of {} is required.".format(", ".join(sorted(export.FORMATS)))]},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    chunks, content_type = export.export(output)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = 'attachment; filename="schedules.{}"'.format(output)
+    return response
+
+
+@api_view(["GET"])
+@permission_classes((permissions.IsAdminUser,))
+def changes(request):
+    """
+    Shop changes of all owners after the since cursor, pass returned cursor to get the next page
+    """
+    query = ChangesQuerySerialized(data=request.query_params)
+    if not query.is_valid():
+        return Response(query._errors, status=status.HTTP_400_BAD_REQUEST)
+
+    since = query.validated_data["since"]
+    rows = outbox.read(since, query.validated_data["limit"])
+    cursor = rows[-1].pk if rows else since
+
+    return Response(
+        {"changes": ChangeSerializer(rows, many=True).data, "cursor": cursor}
+    )
+
+
+@api_view(["GET"])
+def job_detail(request, pk):
+    job = Job.objects.filter(pk=pk, owner_id=request.user.pk).first()
+    if job is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    data = JobSerializer(job).data
+    data["result"] = json.loads(job.result) if job.result else None
+    return Response(data)
+
+
+def job_accepted(request, job):
+    response = Response(
+        {"job": job.pk, "status": job.status}, status=status.HTTP_202_ACCEPTED
+    )
+    response["Location"] = reverse("job", args=[job.pk], request=request)
+    return response
+
+
 class IsOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj=None):
         """Instance must have an attribute named owner"""
-        return obj.owner == request.user
+        return obj.owner_id == request.user.pk
 
 
 class ShopDetail(viewsets.ModelViewSet):
@@ -39,6 +163,30 @@ class ShopDetail(viewsets.ModelViewSet):
     queryset = Shop.objects.all()
     serializer_class = ShopSerializer
     permission_classes = [IsOwner, permissions.IsAuthenticated]
+    # actions available for everyone, other actions see only own shops
+    public_actions = ("is_working", "schedule", "open_intervals", "events", "bulk_status", "open_shops", "nearby")
+    throttle_classes = [ActionRateThrottle]
+
+    def get_queryset(self):
+        if self.action in self.public_actions:
+            pk = self.kwargs.get("pk")
+            if pk is not None and str(pk).isdigit():
+                return Shop.objects.for_shop(pk)
+            return super().get_queryset()
+
+        return Shop.objects.for_owner(self.request.user.pk)
+
+    def perform_authentication(self, request):
+        # buckets don't need the user, so throttle before the token lookup
+        self.check_throttles(request)
+        super().perform_authentication(request)
+        throttling.token_verified(request)
+
+    def check_throttles(self, request):
+        if getattr(request, "throttle_checked", False):
+            return
+        request.throttle_checked = True
+        super().check_throttles(request)
 
     def create(self, request):
         serialized = ShopSerializer(data=request.data, context={"request": request})
@@ -68,22 +216,265 @@ class ShopDetail(viewsets.ModelViewSet):
         else:
             return Response(serializer._errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(methods=["post"], detail=True, permission_classes=[permissions.AllowAny])
+    @action(
+        methods=["get", "post"],
+        detail=True,
+        permission_classes=[permissions.AllowAny],
+        renderer_classes=fast_renderers(),
+    )
     def is_working(self, request, pk):
+        """
+        Is the shop working now or, with ?at=, at a past or future moment
+        """
         shop = self.get_object()
-        serializer = ShopSerializer(shop)
 
-        is_working = serializer.is_working(shop)
+        if "at" in request.query_params:
+            serializer = PointInTimeSerialized(data=request.query_params)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"is_working": shop.is_working(serializer.validated_data["at"])})
 
-        return Response({"is_working": is_working})
+        if request.method == "GET":
+            return self._cached_is_working(request, shop)
 
-    @action(methods=["post"], detail=True, permission_classes=[permissions.AllowAny])
+        return Response({"is_working": shop.is_working()})
+
+    @action(
+        methods=["get", "post"],
+        detail=True,
+        permission_classes=[permissions.AllowAny],
+        renderer_classes=fast_renderers(),
+    )
     def schedule(self, request, pk):
         shop = self.get_object()
-        serializer = ShopSerializer(
-            shop, data=request.data, context={"request": request}
+        # the body and its etag are built for the same date
+        today = timezone.localdate()
+
+        if request.method == "GET":
+            not_modified = caching.schedule_not_modified(request, shop, today)
+            if not_modified is not None:
+                return not_modified
+
+        data = {
+            "working_hours": schedule_data(shop),
+            "special_hours": special_hours_data(shop, today),
+        }
+
+        if request.method == "GET":
+            return caching.cached_response(data, etag=caching.schedule_etag(shop, today))
+
+        return Response(data)
+
+    @action(methods=["post", "delete"], detail=True)
+    def special_hours(self, request, pk=None):
+        """
+        Set or remove working hours of one date
+        """
+        shop = self.get_object()
+
+        if request.method == "DELETE":
+            serializer = SpecialDateSerialized(data=request.query_params)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            deleted = shop.delete_special_hours(serializer.validated_data["date"])
+            return Response({"deleted": deleted})
+
+        serializer = SpecialHoursSerialized(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        updated = shop.set_special_hours(
+            serializer.validated_data["date"],
+            serializer.validated_data["is_working_day"],
+            serializer.validated_data.get("working_schedule"),
+        )
+        return Response({"updated": updated})
+
+    @action(methods=["post"], detail=False)
+    def bulk_close(self, request):
+        """
+        Close all shops of the user in background
+        """
+        serializer = ShopCloseSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer._errors, status=status.HTTP_400_BAD_REQUEST)
+
+        from_date = serializer.validated_data.get("from_date", datetime.date.today())
+        to_date = serializer.validated_data.get("to_date")
+        job = jobs.enqueue(
+            "close",
+            {
+                "owner": request.user.pk,
+                "from_date": from_date.isoformat(),
+                "to_date": to_date.isoformat() if to_date else None,
+            },
+            owner=request.user,
+        )
+        return job_accepted(request, job)
+
+    @action(methods=["post"], detail=False)
+    def reschedule(self, request):
+        """
+        Update schedule of all shops of the user in background
+        """
+        serializer = RescheduleSerialized(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer._errors, status=status.HTTP_400_BAD_REQUEST)
+
+        job = jobs.enqueue(
+            "reschedule",
+            {
+                "owner": request.user.pk,
+                "days": serializer.validated_data.get("days", list(range(7))),
+                "working_schedule": request.data["working_schedule"],
+            },
+            owner=request.user,
+        )
+        return job_accepted(request, job)
+
+    @action(methods=["post"], detail=False)
+    def bulk_delete(self, request):
+        """
+        Delete shops of the user by ids in background
+        """
+        serializer = BulkDeleteSerialized(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer._errors, status=status.HTTP_400_BAD_REQUEST)
+
+        job = jobs.enqueue(
+            "delete",
+            {"owner": request.user.pk, "ids": serializer.validated_data["ids"]},
+            owner=request.user,
+        )
+        return job_accepted(request, job)
+
+    @action(methods=["get"], detail=True, permission_classes=[permissions.AllowAny])
+    def open_intervals(self, request, pk):
+        shop = self.get_object()
+        serializer = OpenIntervalsSerialized(data=request.query_params)
+
+        if not serializer.is_valid():
+            return Response(serializer._errors, status=status.HTTP_400_BAD_REQUEST)
+
+        intervals = shop.open_intervals(
+            serializer.validated_data["from"], serializer.validated_data["to"]
+        )
+        lines = (
+            json.dumps({"from": from_dt.isoformat(), "to": to_dt.isoformat()}) + "\n"
+            for from_dt, to_dt in intervals
         )
 
-        schedule = serializer.schedule(shop)
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=[permissions.AllowAny],
+        renderer_classes=[EventStreamRenderer, JSONRenderer],
+    )
+    def events(self, request):
+        ids = request.query_params.get("ids", "").split(",")
+        if not all(shop_id.isdigit() for shop_id in ids):
+            return Response(
+                {"ids": ["Comma separated shop ids are required."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if len(set(ids)) > settings.EVENTS_MAX_IDS:
+            return Response(
+                {"ids": ["Up to {} shop ids are allowed.".format(settings.EVENTS_MAX_IDS)]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        shop_ids = Shop.objects.existing_ids(ids)
+        response = StreamingHttpResponse(
+            events.stream(shop_ids), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    @action(
+        methods=["get"],
+        detail=False,
+        url_path="status",
+        permission_classes=[permissions.AllowAny],
+        renderer_classes=fast_renderers(),
+    )
+    def bulk_status(self, request):
+        ids = request.query_params.get("ids", "").split(",")
+        if not all(shop_id.isdigit() for shop_id in ids):
+            return Response(
+                {"ids": ["Comma separated shop ids are required."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if len(set(ids)) > settings.STATUS_MAX_IDS:
+            return Response(
+                {"ids": ["Up to {} shop ids are allowed.".format(settings.STATUS_MAX_IDS)]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        is_working = Shop.objects.bulk_is_working(ids)
+        return Response(
+            {"is_working": {str(pk): value for pk, value in sorted(is_working.items())}}
+        )
 
-        return Response({"working_hours": schedule})
+    @action(
+        methods=["get"],
+        detail=False,
+        url_path="open",
+        permission_classes=[permissions.AllowAny],
+        renderer_classes=fast_renderers(),
+    )
+    def open_shops(self, request):
+        serializer = WindowSearchSerialized(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        shops = Shop.objects.open_in_window(
+            serializer.validated_data["from"],
+            serializer.validated_data["to"],
+            entire=serializer.validated_data["mode"] == "entire",
+        )
+        return Response({"shops": shops})
+
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=[permissions.AllowAny],
+        renderer_classes=fast_renderers(),
+    )
+    def nearby(self, request):
+        """
+        Nearest shops open now within radius km of lat, lng
+        """
+        serializer = NearbySerialized(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        shops = geo.nearby_open(data["lat"], data["lng"], data["radius"], data["limit"])
+        return Response(
+            {
+                "shops": [
+                    {"id": shop_id, "distance_km": round(distance, 3)}
+                    for distance, shop_id in shops
+                ]
+            }
+        )
+
+    def _cached_is_working(self, request, shop):
+        now = timezone.now()
+
+        not_modified = caching.is_working_not_modified(request, shop, now)
+        if not_modified is not None:
+            return not_modified
+
+        expires = caching.is_working_expires(shop, now)
+
+        return caching.cached_response(
+            {"is_working": shop.is_working()},
+            etag=caching.is_working_etag(shop, expires),
+            max_age=caching.max_age(now, expires),
+        )
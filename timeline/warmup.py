@@ -0,0 +1,45 @@
+"""
+Process state loaded before a preforking server forks its workers.
+"""
+import time
+from django.conf import settings
+from . import geo, snapshot
+from .schedule import get_default_schedule
+
+
+def warm(load_snapshot=None):
+    """
+    Compile the default schedule, load the location index and optionally
+    the schedule snapshot, return seconds spent
+    """
+    if load_snapshot is None:
+        load_snapshot = settings.SCHEDULE_SNAPSHOT
+
+    started = time.perf_counter()
+    get_default_schedule()
+    geo.get_index().load()
+    if load_snapshot:
+        snapshot.load()
+
+    return time.perf_counter() - started
+
+
+def memory_usage():
+    """
+    Resident and private (not shared with the master) memory of this process in KiB,
+    None where /proc isn't available
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    values = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        values[name] = int(value.split()[0])
+    return {
+        "rss": values.get("Rss", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }